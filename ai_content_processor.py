@@ -12,10 +12,11 @@ import json
 import logging
 import os
 import sys
+import threading
 import time
 import traceback
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import mysql.connector
 import openai
@@ -25,6 +26,52 @@ from tqdm import tqdm
 # Import config
 from config import Config
 
+# Các module trong helpers/ import lẫn nhau theo tên (module_wp_publisher, ...)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers"))
+
+POSTS_AI_SYSTEM = "Bạn là chuyên gia content marketing và SEO chuyên nghiệp."
+# Field bắt buộc của JSON output (thiếu → gọi sửa, vẫn thiếu → job lỗi thay vì lưu meta giả)
+POSTS_AI_REQUIRED = ("ai_content", "meta_title", "meta_description")
+POSTS_AI_MERGE_REQUIRED = ("meta_title", "meta_description")
+# Mọi key của schema (stream: key đầu tiên ngoài danh sách → hủy sớm)
+POSTS_AI_KEYS = POSTS_AI_REQUIRED + (
+    "auto_category", "image_prompt", "suggested_tags", "affiliate_cta", "local_payments",
+    "seo_keywords", "version_notes", "competition_angle",
+)
+
+# Template prompt theo category (dựng 1 lần khi import, không tạo lại mỗi bài)
+CATEGORY_TEMPLATES = {
+    "Bonus": {
+        "specific_requirements": "Focus on bonus terms, wagering requirements, Philippines-specific bonuses, GCash/PayMaya deposit bonuses",
+        "writing_style": "Exciting, promotional, emphasizing value and local payment advantages"
+    },
+    "Review": {
+        "specific_requirements": "Detailed analysis, pros/cons, Philippines player perspective, local banking compatibility",
+        "writing_style": "Analytical, trustworthy, unbiased review with Filipino player insights"
+    },
+    "Payment": {
+        "specific_requirements": "Deep dive into PH payment methods: GCash, PayMaya, BPI, BDO, Metrobank, UnionBank",
+        "writing_style": "Informative, step-by-step, addressing Filipino banking concerns"
+    },
+    "GameGuide": {
+        "specific_requirements": "Practical strategies, beginner-friendly for Filipino players, mobile-first approach",
+        "writing_style": "Educational, encouraging, using Filipino gaming culture references"
+    },
+    "News": {
+        "specific_requirements": "Latest updates relevant to Philippines gambling laws, new casino launches for PH market",
+        "writing_style": "News-worthy, timely, with local market implications"
+    }
+}
+
+# Version-specific style adjustments
+VERSION_STYLES = {
+    1: "Professional, formal tone",
+    2: "Casual, friendly approach",
+    3: "Enthusiastic, energetic writing",
+    4: "Expert, technical analysis",
+    5: "Story-telling, narrative style"
+}
+
 
 class AIContentProcessor:
     """Lớp chính xử lý nội dung posts với AI"""
@@ -36,8 +83,10 @@ class AIContentProcessor:
         # Setup logging
         self.setup_logging()
 
-        # MySQL connection
+        # MySQL connection (1 connection dùng chung → các stage song song phải giữ db_lock)
         self.connection = None
+        self.db_lock = threading.RLock()
+        self.stats_lock = threading.Lock()
         self.connect_mysql()
 
         # OpenAI setup
@@ -80,6 +129,7 @@ class AIContentProcessor:
             if self.connection.is_connected():
                 self.logger.info("✅ Kết nối MySQL thành công")
                 self.create_posts_ai_table()
+                self.create_ai_usage_table()
             else:
                 raise ConnectionError("MySQL connection failed")
 
@@ -121,6 +171,73 @@ class AIContentProcessor:
             self.logger.error(f"❌ Lỗi tạo bảng posts_ai: {e}")
             raise
 
+    def create_ai_usage_table(self):
+        """Tạo bảng ai_usage (token, chi phí, latency của từng call AI theo post/version/stage)"""
+        create_table_sql = """
+        CREATE TABLE IF NOT EXISTS ai_usage (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            run_id VARCHAR(64),
+            post_id INT,
+            site_version TINYINT,
+            stage VARCHAR(20) NOT NULL,
+            strategy VARCHAR(100) NOT NULL,
+            category VARCHAR(100),
+            provider VARCHAR(20) NOT NULL,
+            model VARCHAR(100) NOT NULL,
+            prompt_tokens INT NOT NULL DEFAULT 0,
+            completion_tokens INT NOT NULL DEFAULT 0,
+            cached_tokens INT NOT NULL DEFAULT 0,
+            images INT NOT NULL DEFAULT 0,
+            latency_ms INT NOT NULL DEFAULT 0,
+            cost_usd DECIMAL(12, 6) NOT NULL DEFAULT 0,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_post (post_id, site_version),
+            KEY idx_run (run_id),
+            KEY idx_created (created_date)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+        """
+
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(create_table_sql)
+            cursor.close()
+            self.logger.info("✅ Bảng 'ai_usage' đã sẵn sàng")
+
+        except Error as e:
+            self.logger.error(f"❌ Lỗi tạo bảng ai_usage: {e}")
+
+    def _flush_usage(self):
+        """Lưu các dòng usage đã ghi (ai_usage.usage_context) vào bảng ai_usage"""
+        from ai_usage import drain_usage_rows
+
+        rows = drain_usage_rows()
+        if not rows:
+            return
+        columns = ("run_id", "post_id", "site_version", "stage", "strategy", "category", "provider", "model",
+                   "prompt_tokens", "completion_tokens", "cached_tokens", "images", "latency_ms", "cost_usd")
+        sql = f"INSERT INTO ai_usage ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        try:
+            with self.db_lock:
+                cursor = self.connection.cursor()
+                cursor.executemany(sql, [tuple(row[column] for column in columns) for row in rows])
+                cursor.close()
+        except Error as e:
+            self.logger.error(f"❌ Lỗi lưu ai_usage ({len(rows)} dòng): {e}")
+
+    @staticmethod
+    def _usage_context(job: Dict[str, Any], stage: str):
+        """Gắn run/post/version/stage/category cho mọi call AI của job trong stage này"""
+        from ai_usage import usage_context
+
+        return usage_context(
+            run_id=job.get("run_id"), post_id=job["post"]["id"], site_version=job["site_version"],
+            stage=stage, category=job.get("category", ""),
+        )
+
+    @staticmethod
+    def _new_run_id() -> str:
+        return f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
     def _auto_categorize_content(self, title: str, content: str) -> str:
         """
         🤖 AUTO CATEGORIZE content dựa trên AI analysis
@@ -175,56 +292,40 @@ class AIContentProcessor:
         Returns:
             Dict chứa prompt template specific
         """
-        # Base templates cho từng category
-        templates = {
-            "Bonus": {
-                "specific_requirements": "Focus on bonus terms, wagering requirements, Philippines-specific bonuses, GCash/PayMaya deposit bonuses",
-                "writing_style": "Exciting, promotional, emphasizing value and local payment advantages"
-            },
-            "Review": {
-                "specific_requirements": "Detailed analysis, pros/cons, Philippines player perspective, local banking compatibility",
-                "writing_style": "Analytical, trustworthy, unbiased review with Filipino player insights"
-            },
-            "Payment": {
-                "specific_requirements": "Deep dive into PH payment methods: GCash, PayMaya, BPI, BDO, Metrobank, UnionBank",
-                "writing_style": "Informative, step-by-step, addressing Filipino banking concerns"
-            },
-            "GameGuide": {
-                "specific_requirements": "Practical strategies, beginner-friendly for Filipino players, mobile-first approach",
-                "writing_style": "Educational, encouraging, using Filipino gaming culture references"
-            },
-            "News": {
-                "specific_requirements": "Latest updates relevant to Philippines gambling laws, new casino launches for PH market",
-                "writing_style": "News-worthy, timely, with local market implications"
-            }
-        }
-        
-        # Version-specific style adjustments
-        version_styles = {
-            1: "Professional, formal tone",
-            2: "Casual, friendly approach", 
-            3: "Enthusiastic, energetic writing",
-            4: "Expert, technical analysis",
-            5: "Story-telling, narrative style"
-        }
-        
         # Get base template hoặc fallback
-        base_template = templates.get(category, templates["Bonus"])
+        base_template = CATEGORY_TEMPLATES.get(category, CATEGORY_TEMPLATES["Bonus"])
         
         # Customize theo version
-        template = base_template.copy()
-        template["writing_style"] += f" | Version {site_version}: {version_styles.get(site_version, 'Balanced approach')}"
-        
-        return template
+        return {
+            "specific_requirements": base_template["specific_requirements"],
+            "writing_style": f"{base_template['writing_style']} | Version {site_version}: "
+                             f"{VERSION_STYLES.get(site_version, 'Balanced approach')}",
+        }
 
     def setup_openai(self):
-        """Thiết lập OpenAI API"""
+        """Thiết lập OpenAI API (+ Gemini dự phòng nếu có key) qua AI gateway"""
         try:
             openai.api_key = Config.OPENAI_API_KEY
 
             if not openai.api_key:
                 raise ValueError("OPENAI_API_KEY không được thiết lập trong config")
 
+            from ai_gateway import AIGateway
+
+            # Retry do RetryPolicy đảm nhận → tắt retry của SDK
+            self.openai_client = openai.OpenAI(
+                api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL,
+                max_retries=0, timeout=Config.AI_REQUEST_TIMEOUT,
+            )
+            gemini_model = None
+            if Config.GEMINI_API_KEY:
+                import google.generativeai as genai
+
+                genai.configure(api_key=Config.GEMINI_API_KEY)
+                gemini_model = genai.GenerativeModel(Config.GEMINI_MODEL)
+
+            self.gateway = AIGateway(openai_client=self.openai_client, gemini_model=gemini_model, preferred="openai")
+
             self.logger.info("✅ OpenAI API đã được thiết lập")
 
         except Exception as e:
@@ -267,39 +368,103 @@ class AIContentProcessor:
             self.logger.error(f"❌ Lỗi lấy posts chưa xử lý: {e}")
             return []
 
-    def process_content_with_ai(
-        self, original_content: str, title: str, category: str = "", site_version: int = 1
-    ) -> Dict[str, Any]:
+    def get_usage_history(self) -> Dict[str, Dict[str, float]]:
         """
-        🇵🇭 PHILIPPINES MULTI-SITE AI CONTENT PIPELINE
-        Deep rewrite + Auto categorize + Local info + Multi-version
-
-        Args:
-            original_content: Nội dung gốc
-            title: Tiêu đề bài viết
-            category: Danh mục (auto-detect nếu rỗng)
-            site_version: Version cho site khác nhau (1-5)
+        Lịch sử ai_usage (RUN_BUDGET_HISTORY_DAYS ngày) để ước tính chi phí job mới
 
-        Returns:
-            Dict chứa nội dung đã xử lý với Philippines local info
+        Returns: category → {"jobs", "completion_tokens" (/ request text), "images" (/ job)}; "*" = mọi category
+        """
+        sql = """
+        SELECT category,
+            COUNT(DISTINCT run_id, post_id, site_version) AS jobs,
+            AVG(CASE WHEN stage = 'text' THEN completion_tokens END) AS completion_tokens,
+            SUM(images) / COUNT(DISTINCT run_id, post_id, site_version) AS images
+        FROM ai_usage
+        WHERE post_id IS NOT NULL AND created_date >= NOW() - INTERVAL %s DAY
+        GROUP BY category WITH ROLLUP
         """
         try:
-            # 🎯 AUTO CATEGORIZE nếu chưa có category
-            if not category:
-                category = self._auto_categorize_content(title, original_content)
-            
-            # 🚀 CHỌN PROMPT TEMPLATE theo category và site version
-            prompt_template = self._get_category_prompt_template(category, site_version)
-            
-            # 🇵🇭 XÂY DỰNG PROMPT PHILIPPINES SPECIFIC
-            prompt = f"""
+            with self.db_lock:
+                cursor = self.connection.cursor(dictionary=True)
+                cursor.execute(sql, (Config.RUN_BUDGET_HISTORY_DAYS,))
+                rows = cursor.fetchall()
+                cursor.close()
+        except Error as e:
+            self.logger.error(f"❌ Lỗi đọc lịch sử ai_usage: {e}")
+            return {}
+
+        # Dòng ROLLUP (category NULL) = trung bình chung
+        return {
+            "*" if row["category"] is None else row["category"]: {
+                "jobs": int(row["jobs"] or 0),
+                "completion_tokens": float(row["completion_tokens"] or 0),
+                "images": float(row["images"] or 0),
+            }
+            for row in rows if row["completion_tokens"] is not None
+        }
+
+    def _plan_jobs(self, jobs: List[Tuple[Dict[str, Any], int]]) -> List[Dict[str, Any]]:
+        """
+        💰 Ước tính chi phí từng job (post, version) + xếp thứ tự ưu tiên khi chạy có ngân sách
+        Ưu tiên: version 1 của mọi bài trước version phụ → category theo RUN_PRIORITY_CATEGORIES → bài mới trước
+
+        Returns: [{"post", "site_version", "category", "estimate": {"usd", "tokens"}}]
+        """
+        from spend_budget import CostModel
+        from token_budget import count_tokens, input_budget
+
+        model = Config.AI_MODEL or "gpt-3.5-turbo"
+        cost_model = CostModel(model, self.get_usage_history())
+        system_tokens = count_tokens(POSTS_AI_SYSTEM, model)
+        categories, sources, planned = {}, {}, []
+
+        for order, (post, site_version) in enumerate(jobs):
+            if post["id"] not in categories:
+                categories[post["id"]] = post.get("category") or self._auto_categorize_content(
+                    post["title"], post["content"]
+                )
+                sources[post["id"]] = count_tokens(post["content"] or "", model)
+            category, source_tokens = categories[post["id"]], sources[post["id"]]
+
+            _, make_prompt = self._post_prompt(post["title"], category, site_version)
+            overhead = count_tokens(make_prompt(""), model) + system_tokens
+            budget = max(0, input_budget(model, 2000) - overhead)
+            if source_tokens <= budget or not Config.AI_CHUNKED_REWRITE:
+                requests, prompt_tokens = 1, overhead + min(source_tokens, budget)
+            else:
+                # Chia phần: mỗi phần template + 1 đoạn nguồn; call gộp đọc lại toàn bộ nội dung đã viết
+                sections = -(-source_tokens // max(1, Config.AI_CHUNK_TOKENS))
+                requests, prompt_tokens = sections + 1, overhead * (sections + 1) + source_tokens * 2
+
+            planned.append({
+                "post": post, "site_version": site_version, "category": category, "order": order,
+                "estimate": cost_model.estimate(prompt_tokens, category, requests),
+            })
+
+        rank = {category: index for index, category in enumerate(Config.RUN_PRIORITY_CATEGORIES)}
+        planned.sort(key=lambda item: (item["site_version"], rank.get(item["category"], len(rank)), item["order"]))
+        return planned
+
+    def _post_prompt(self, title: str, category: str, site_version: int) -> Tuple[Dict[str, str], Callable[[str], str]]:
+        """
+        Template category/version + hàm dựng prompt (nguồn đã cắt → prompt)
+        Dùng chung cho call trực tiếp và Batch API
+
+        Returns: (prompt_template, make_prompt)
+        """
+        prompt_template = self._get_category_prompt_template(category, site_version)
+
+        # 🇵🇭 XÂY DỰNG PROMPT PHILIPPINES SPECIFIC
+        # Phần tĩnh (chỉ phụ thuộc category/version) đứng trước → prefix giống hệt nhau giữa các bài,
+        # được provider cache; dữ liệu từng bài (title, nội dung cắt theo token budget) đặt cuối cùng
+        instructions = f"""
             🇵🇭 PHILIPPINES CASINO CONTENT EXPERT - MULTI-SITE VERSION {site_version}
-            
+        
             MISSION: Create UNIQUE, SEO-optimized content for Philippines market with local payment methods, culture, and regulations.
-            
+        
             📋 TARGET CATEGORY: {category}
             📊 SITE VERSION: {site_version}/5 (Must be completely unique from other versions)
-            
+        
             🎯 REQUIREMENTS:
             1. 🔥 DEEP REWRITE (100% unique, no duplicate detection)
             2. 🇵🇭 Add Philippines local info: GCash, PayMaya, BPI, Metrobank, local bonuses
@@ -307,13 +472,9 @@ class AIContentProcessor:
             4. 📱 Include mobile-first approach (Filipinos use mobile heavily)
             5. 🏆 Add competitive advantages vs other PH casinos
             6. 💰 Include peso (₱) currency mentions
-            
-            📝 ORIGINAL:
-            Title: {title}
-            Content: {original_content[:2500]}...
-            
+        
             🎨 STYLE FOR VERSION {site_version}: {prompt_template['writing_style']}
-            
+        
             📤 OUTPUT JSON:
             {{
                 "ai_content": "COMPLETELY rewritten content with PH local info, payment methods, cultural references",
@@ -330,47 +491,88 @@ class AIContentProcessor:
             }}
             """
 
-            # Gọi OpenAI API (v1.0+ syntax)
-            from openai import OpenAI
+        def make_prompt(source: str) -> str:
+            return f"""{instructions}
+            📝 ORIGINAL:
+            Title: {title}
+            Content: {source}
+            """
 
-            client = OpenAI(api_key=Config.OPENAI_API_KEY)
+        return prompt_template, make_prompt
 
-            response = client.chat.completions.create(
-                model=Config.AI_MODEL or "gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Bạn là chuyên gia content marketing và SEO chuyên nghiệp.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
+    def _parse_ai_response(self, ai_response: str, label: str = "posts_ai") -> Dict[str, Any]:
+        """
+        JSON response của AI → ai_result (parser chịu lỗi + validate POSTS_AI_REQUIRED)
+        Raises: JSONOutputError nếu cả call sửa cũng không ra JSON đủ field
+        """
+        return self.gateway.parse_json_response(ai_response, POSTS_AI_REQUIRED, label=label)
+
+    def process_content_with_ai(
+        self, original_content: str, title: str, category: str = "", site_version: int = 1
+    ) -> Dict[str, Any]:
+        """
+        🇵🇭 PHILIPPINES MULTI-SITE AI CONTENT PIPELINE
+        Deep rewrite + Auto categorize + Local info + Multi-version
+
+        Args:
+            original_content: Nội dung gốc
+            title: Tiêu đề bài viết
+            category: Danh mục (auto-detect nếu rỗng)
+            site_version: Version cho site khác nhau (1-5)
+
+        Returns:
+            Dict chứa nội dung đã xử lý với Philippines local info
+        """
+        try:
+            # 🎯 AUTO CATEGORIZE nếu chưa có category
+            if not category:
+                category = self._auto_categorize_content(title, original_content)
+            
+            # 🚀 CHỌN PROMPT TEMPLATE theo category và site version + dựng prompt
+            prompt_template, make_prompt = self._post_prompt(title, category, site_version)
+
+            from chunked_rewrite import needs_chunking
+            from token_budget import build_prompt
+
+            system = POSTS_AI_SYSTEM
+            model = Config.AI_MODEL or "gpt-3.5-turbo"
+
+            # Bài dài hơn token budget → viết lại theo phần thay vì bỏ phần đuôi
+            if needs_chunking(make_prompt, original_content, model, max_tokens=2000, system=system):
+                ai_result = self._rewrite_in_sections(
+                    original_content, title, category, site_version, prompt_template, system, model
+                )
+                self.logger.info(f"✅ AI xử lý thành công (chia phần): {title[:50]}...")
+                return ai_result
+
+            prompt, prompt_tokens = build_prompt(
+                make_prompt, original_content, model, max_tokens=2000, system=system, label="posts_ai"
+            )
+            self.logger.info(f"🧮 Prompt {prompt_tokens} tokens: {title[:50]}...")
+
+            # Gọi AI qua gateway (retry, circuit breaker, failover, hedging nếu AI_HEDGING)
+            # JSON mode + parse/validate field bắt buộc, response hỏng → 1 call sửa rẻ
+            response = self.gateway.complete_json(
+                prompt,
+                POSTS_AI_REQUIRED,
+                system=system,
                 max_tokens=2000,
                 temperature=0.7,
+                model=model,
+                label="posts_ai",
+                stream_keys=POSTS_AI_KEYS,
             )
-
-            # Parse response
-            ai_response = response.choices[0].message.content.strip()
-
-            # Thử parse JSON response
-            try:
-                ai_result = json.loads(ai_response)
-            except json.JSONDecodeError:
-                # Nếu AI không trả về JSON đúng format, tạo fallback
-                ai_result = {
-                    "ai_content": ai_response,
-                    "meta_title": title[:70],
-                    "meta_description": original_content[:160] + "...",
-                    "image_prompt": f"Professional image related to {category or 'business'}",
-                    "suggested_tags": "",
-                    "notes": "AI response không đúng JSON format",
-                }
+            ai_result = response["data"]
 
             self.logger.info(f"✅ AI xử lý thành công: {title[:50]}...")
             return ai_result
 
         except Exception as e:
+            from retry_policy import record_fallback
+
             self.logger.error(f"❌ Lỗi AI processing: {e}")
-            # Fallback nếu AI fails
+            record_fallback("openai.chat")
+            # Fallback nếu AI fails (ai_fallback → job bị đánh dấu error, không lưu "completed")
             return {
                 "ai_content": original_content,
                 "meta_title": title[:70],
@@ -378,8 +580,94 @@ class AIContentProcessor:
                 "image_prompt": f"Professional image related to {category or 'business'}",
                 "suggested_tags": "",
                 "notes": f"AI processing failed: {str(e)}",
+                "ai_fallback": True,
             }
 
+    def _rewrite_in_sections(
+        self, original_content: str, title: str, category: str, site_version: int,
+        prompt_template: Dict[str, str], system: str, model: str
+    ) -> Dict[str, Any]:
+        """
+        Map-reduce cho bài dài: viết lại từng phần song song, rồi 1 call nhỏ sinh title/meta/tags
+        Phần đã viết lại được cache → phần lỗi thử lại riêng, không gọi lại cả bài
+        """
+        from chunked_rewrite import map_reduce_rewrite
+
+        # Giống prompt 1 lần gọi: phần tĩnh trước (prefix cache được), dữ liệu bài/phần sau cùng
+        section_instructions = f"""
+            🇵🇭 PHILIPPINES CASINO CONTENT EXPERT - MULTI-SITE VERSION {site_version}
+
+            Rewrite ONE PART of a longer {category} article.
+            🎯 REQUIREMENTS:
+            1. 🔥 DEEP REWRITE (100% unique), keep every fact of this part
+            2. 🇵🇭 Philippines local context (GCash, PayMaya, peso ₱) where it fits naturally
+            3. 🎰 {prompt_template['specific_requirements']}
+            4. Continue seamlessly from the previous part; no article title, no conclusion unless this is the last part
+
+            🎨 STYLE FOR VERSION {site_version}: {prompt_template['writing_style']}
+
+            📤 OUTPUT: only the rewritten text of this part (no JSON, no explanations)
+            """
+        merge_instructions = f"""
+            🇵🇭 PHILIPPINES CASINO CONTENT EXPERT - MULTI-SITE VERSION {site_version}
+
+            The article below has already been rewritten for the Philippines market ({category}).
+
+            📤 OUTPUT JSON:
+            {{
+                "auto_category": "Auto-detected category (Bonus/Review/Payment/GameGuide/News)",
+                "meta_title": "SEO title 60-65 chars with PH keywords",
+                "meta_description": "Meta desc 150-160 chars with local appeal",
+                "image_prompt": "Professional image prompt for {category} content (English)",
+                "suggested_tags": "PH-specific tags: philippines-casino, gcash-deposit, etc",
+                "affiliate_cta": "Strong CTA with urgency for PH market",
+                "local_payments": "GCash, PayMaya, bank transfer options mentioned",
+                "seo_keywords": "Primary keywords for PH SEO ranking",
+                "version_notes": "What makes this Version {site_version} unique",
+                "competition_angle": "Unique selling points vs competitors"
+            }}
+            """
+
+        def make_section_prompt(section: str, index: int, total: int) -> str:
+            return f"""{section_instructions}
+            📝 ARTICLE: {title}
+            ORIGINAL PART {index}/{total}:
+            {section}
+            """
+
+        def make_merge_prompt(content: str) -> str:
+            return f"""{merge_instructions}
+            📝 REWRITTEN ARTICLE: {title}
+            {content}
+            """
+
+        def complete(prompt: str, max_tokens: int) -> str:
+            return self.gateway.complete(
+                prompt, system=system, max_tokens=max_tokens, temperature=0.7, model=model, validate=bool,
+                label="posts_ai",
+            )["text"]
+
+        def complete_merge(prompt: str, max_tokens: int) -> str:
+            data = self.gateway.complete_json(
+                prompt, POSTS_AI_MERGE_REQUIRED, system=system, max_tokens=max_tokens, temperature=0.7, model=model,
+                label="posts_ai.merge", stream_keys=POSTS_AI_KEYS,
+            )["data"]
+            return json.dumps(data, ensure_ascii=False)
+
+        rewritten = map_reduce_rewrite(
+            original_content, make_section_prompt, make_merge_prompt, complete,
+            model=model, system=system, section_max_tokens=2000, merge_max_tokens=800, label="posts_ai",
+            complete_merge=complete_merge,
+        )
+        self.logger.info(
+            f"🧩 Viết lại {len(rewritten['sections'])} phần (cache {rewritten['cached']}): {title[:50]}..."
+        )
+
+        ai_result = json.loads(rewritten["merge_text"])
+        ai_result["ai_content"] = rewritten["content"]
+        ai_result["chunked_sections"] = len(rewritten["sections"])
+        return ai_result
+
     def generate_image_with_ai(self, image_prompt: str) -> str:
         """
         Generate image URL with AI (OpenAI DALL-E)
@@ -395,20 +683,28 @@ class AIContentProcessor:
                 self.logger.warning("❌ Image prompt quá ngắn hoặc rỗng")
                 return ""
 
-            from openai import OpenAI
+            from ai_usage import record_image_usage
+            from retry_policy import call_with_retry
 
-            client = OpenAI(api_key=Config.OPENAI_API_KEY)
+            client = self.openai_client
 
             self.logger.info(f"🎨 Generating image: {image_prompt[:50]}...")
 
-            response = client.images.generate(
-                model="dall-e-3",
-                prompt=image_prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1,
+            start = time.monotonic()
+            response = call_with_retry(
+                "openai.images",
+                lambda timeout: client.images.generate(
+                    model="dall-e-3",
+                    prompt=image_prompt,
+                    size="1024x1024",
+                    quality="standard",
+                    n=1,
+                    timeout=timeout,
+                ),
             )
 
+            record_image_usage("posts_ai.image", "dall-e-3", "1024x1024", "standard", time.monotonic() - start)
+
             image_url = response.data[0].url
             self.logger.info(f"✅ Image generated successfully: {image_url[:50]}...")
             return image_url
@@ -441,8 +737,6 @@ class AIContentProcessor:
             bool: True nếu thành công
         """
         try:
-            cursor = self.connection.cursor()
-
             # 🎯 CHUẨN BỊ DỮ LIỆU với Philippines info
             auto_category = ai_result.get("auto_category", category)
             tags = ai_result.get("suggested_tags", "") or original_tags
@@ -499,8 +793,10 @@ class AIContentProcessor:
                 "completed",
             )
 
-            cursor.execute(insert_sql, values)
-            cursor.close()
+            with self.db_lock:
+                cursor = self.connection.cursor()
+                cursor.execute(insert_sql, values)
+                cursor.close()
 
             self.logger.info(f"✅ Saved Post ID {post_id} (v{site_version}) - {auto_category}")
             return True
@@ -512,6 +808,7 @@ class AIContentProcessor:
     def process_single_post(self, post: Dict[str, Any], site_version: int = 1) -> Dict[str, Any]:
         """
         🇵🇭 XỬ LÝ MỘT POST VỚI AI - PHILIPPINES MULTI-VERSION
+        (chạy tuần tự 3 stage text → image → save của pipeline batch)
         
         Args:
             post: Dict chứa thông tin post
@@ -520,90 +817,144 @@ class AIContentProcessor:
         Returns:
             Dict chứa kết quả xử lý
         """
-        post_id = post["id"]
-        title = post["title"]
-        content = post["content"]
-        category = post.get("category", "")
-        tags = post.get("tags", "")
-
-        result = {"post_id": post_id, "site_version": site_version, "success": False, "error": None}
+        job = {"post": post, "site_version": site_version, "run_id": self._new_run_id()}
 
         try:
-            self.logger.info(f"🔄 Processing Post ID {post_id} (v{site_version}): {title[:50]}...")
+            job = self._stage_save(self._stage_image(self._stage_text(job)))
+        except Exception as e:
+            self._job_failed(job, e)
+
+        return self._job_result(job)
+
+    def _stage_text(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Stage 1: viết lại nội dung bằng AI"""
+        post, site_version = job["post"], job["site_version"]
+        self.logger.info(f"🔄 Processing Post ID {post['id']} (v{site_version}): {post['title'][:50]}...")
 
-            # Cập nhật trạng thái processing
-            self.update_processing_status(post_id, "processing")
+        # Cập nhật trạng thái processing
+        self.update_processing_status(post["id"], "processing")
 
-            # 🚀 XỬ LÝ VỚI AI - PHILIPPINES VERSION
-            ai_result = self.process_content_with_ai(content, title, category, site_version)
+        # 🎯 AUTO CATEGORIZE trước → usage của job được gắn đúng category
+        job["category"] = post.get("category") or self._auto_categorize_content(post["title"], post["content"])
 
-            # 🎨 GENERATE IMAGE nếu có image_prompt
-            image_url = ""
-            image_prompt = ai_result.get("image_prompt", "")
-            if image_prompt and len(image_prompt.strip()) > 10:
-                self.logger.info(f"🎨 Generating image for Post ID {post_id} (v{site_version})...")
+        # 🚀 XỬ LÝ VỚI AI - PHILIPPINES VERSION
+        with self._usage_context(job, "text"):
+            job["ai_result"] = self.process_content_with_ai(
+                post["content"], post["title"], job["category"], site_version
+            )
+        # AI lỗi hẳn (hết retry) → không lưu nội dung gốc như bài đã viết lại
+        if job["ai_result"].get("ai_fallback"):
+            raise Exception(job["ai_result"]["notes"])
+        return job
+
+    def _stage_image(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Stage 2: 🎨 GENERATE IMAGE nếu có image_prompt"""
+        post_id, site_version, ai_result = job["post"]["id"], job["site_version"], job["ai_result"]
+
+        image_prompt = ai_result.get("image_prompt", "")
+        if image_prompt and len(image_prompt.strip()) > 10:
+            self.logger.info(f"🎨 Generating image for Post ID {post_id} (v{site_version})...")
+            with self._usage_context(job, "image"):
                 image_url = self.generate_image_with_ai(image_prompt)
-                if image_url:
-                    ai_result["image_url"] = image_url
-                    self.logger.info(f"✅ Image generated: {image_url[:50]}...")
-                else:
-                    self.logger.warning(f"⚠️ Image generation failed for Post ID {post_id}")
-
-            # 💾 LƯU KẾT QUẢ với version info
-            if self.save_ai_result(post_id, title, ai_result, category, tags, site_version):
-                result["success"] = True
-                result["category"] = ai_result.get("auto_category", category)
-                result["version_notes"] = ai_result.get("version_notes", "")
-                self.stats["success"] += 1
-                self.logger.info(f"🎉 Completed Post ID {post_id} (v{site_version}) - {ai_result.get('auto_category', category)}")
+            if image_url:
+                ai_result["image_url"] = image_url
+                self.logger.info(f"✅ Image generated: {image_url[:50]}...")
             else:
-                raise Exception("Lỗi lưu AI result")
+                self.logger.warning(f"⚠️ Image generation failed for Post ID {post_id}")
+        return job
 
-        except Exception as e:
-            error_msg = str(e)
-            self.logger.error(f"❌ Lỗi xử lý Post ID {post_id} (v{site_version}): {error_msg}")
-
-            # Cập nhật trạng thái lỗi
-            self.update_processing_status(post_id, "error", error_msg)
+    def _stage_save(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Stage 3: 💾 LƯU KẾT QUẢ với version info"""
+        post, site_version, ai_result = job["post"], job["site_version"], job["ai_result"]
+        category = post.get("category", "")
 
-            result["error"] = error_msg
-            self.stats["errors"] += 1
+        if not self.save_ai_result(post["id"], post["title"], ai_result, category, post.get("tags", ""), site_version):
+            raise Exception("Lỗi lưu AI result")
 
-        self.stats["total_processed"] += 1
+        job["success"] = True
+        self._count("success")
+        self._flush_usage()
+        self.logger.info(
+            f"🎉 Completed Post ID {post['id']} (v{site_version}) - {ai_result.get('auto_category', category)}"
+        )
+        return job
+
+    def _job_failed(self, job: Dict[str, Any], error: Exception):
+        """Ghi lỗi của 1 job (ở bất kỳ stage nào)"""
+        post_id, site_version = job["post"]["id"], job["site_version"]
+        error_msg = str(error)
+        self.logger.error(f"❌ Lỗi xử lý Post ID {post_id} (v{site_version}): {error_msg}")
+
+        # Cập nhật trạng thái lỗi
+        self.update_processing_status(post_id, "error", error_msg)
+
+        job["success"] = False
+        job["error"] = error_msg
+        self._count("errors")
+        self._flush_usage()
+
+    def _count(self, key: str):
+        """Tăng stats (gọi từ nhiều worker thread)"""
+        with self.stats_lock:
+            self.stats[key] += 1
+            self.stats["total_processed"] += 1
+
+    @staticmethod
+    def _job_result(job: Dict[str, Any]) -> Dict[str, Any]:
+        result = {
+            "post_id": job["post"]["id"],
+            "site_version": job["site_version"],
+            "success": job.get("success", False),
+            "error": job.get("error"),
+        }
+        if result["success"]:
+            ai_result = job["ai_result"]
+            result["ai_result"] = ai_result
+            result["category"] = ai_result.get("auto_category", job["post"].get("category", ""))
+            result["version_notes"] = ai_result.get("version_notes", "")
         return result
 
     def update_processing_status(self, post_id: int, status: str, notes: str = ""):
         """Cập nhật trạng thái xử lý"""
         try:
-            cursor = self.connection.cursor()
-
-            if status == "processing":
-                # Insert processing record
-                sql = """
-                INSERT INTO posts_ai (post_id, title, ai_content, processing_status, ai_notes)
-                VALUES (%s, 'Processing...', 'Processing...', %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    processing_status = VALUES(processing_status),
-                    ai_notes = VALUES(ai_notes),
-                    updated_date = CURRENT_TIMESTAMP
-                """
-                cursor.execute(sql, (post_id, status, notes))
-            else:
-                # Update existing record
-                sql = """
-                UPDATE posts_ai 
-                SET processing_status = %s, ai_notes = CONCAT(COALESCE(ai_notes, ''), %s), updated_date = CURRENT_TIMESTAMP
-                WHERE post_id = %s
-                """
-                cursor.execute(sql, (status, f" | {notes}" if notes else "", post_id))
+            with self.db_lock:
+                cursor = self.connection.cursor()
+
+                if status == "processing":
+                    # Insert processing record
+                    sql = """
+                    INSERT INTO posts_ai (post_id, title, ai_content, processing_status, ai_notes)
+                    VALUES (%s, 'Processing...', 'Processing...', %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        processing_status = VALUES(processing_status),
+                        ai_notes = VALUES(ai_notes),
+                        updated_date = CURRENT_TIMESTAMP
+                    """
+                    cursor.execute(sql, (post_id, status, notes))
+                else:
+                    # Update existing record
+                    sql = """
+                    UPDATE posts_ai 
+                    SET processing_status = %s, ai_notes = CONCAT(COALESCE(ai_notes, ''), %s), updated_date = CURRENT_TIMESTAMP
+                    WHERE post_id = %s
+                    """
+                    cursor.execute(sql, (status, f" | {notes}" if notes else "", post_id))
 
-            cursor.close()
+                cursor.close()
 
         except Error as e:
             self.logger.error(f"❌ Lỗi cập nhật status: {e}")
 
     def process_batch(
-        self, limit: Optional[int] = None, delay: float = 1.0, multi_version: bool = False, num_versions: int = 3
+        self,
+        limit: Optional[int] = None,
+        delay: float = 1.0,
+        multi_version: bool = False,
+        num_versions: int = 3,
+        publish: bool = False,
+        budget_usd: Optional[float] = None,
+        budget_tokens: Optional[int] = None,
+        resume: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         🇵🇭 XỬ LÝ BATCH POSTS VỚI AI - PHILIPPINES MULTI-VERSION
@@ -613,6 +964,10 @@ class AIContentProcessor:
             delay: Delay giữa các request (giây)
             multi_version: Có tạo nhiều version không
             num_versions: Số version tạo cho multi-site (1-5)
+            publish: Publish ngay version k lên site k (theo sites.json)
+            budget_usd: Ngân sách USD của run (None = RUN_BUDGET_USD, 0 = không giới hạn)
+            budget_tokens: Ngân sách token của run (None = RUN_BUDGET_TOKENS, 0 = không giới hạn)
+            resume: run_id / file checkpoint → chỉ chạy các job còn lại của run đó
 
         Returns:
             Dict chứa thống kê kết quả
@@ -625,65 +980,163 @@ class AIContentProcessor:
         else:
             print("📝 SINGLE VERSION MODE")
 
+        from spend_budget import SpendBudget, load_checkpoint, save_checkpoint
+
         # Reset stats
         self.stats = {"total_processed": 0, "success": 0, "errors": 0, "skipped": 0}
+        versions_to_process = list(range(1, num_versions + 1)) if multi_version else [1]
+
+        if resume:
+            # Chạy tiếp run đã dừng: đúng các (post, version) chưa gửi
+            checkpoint = load_checkpoint(resume)
+            posts_by_id = self.get_posts_by_ids(sorted({post_id for post_id, _ in checkpoint["remaining"]}))
+            jobs = [(posts_by_id[post_id], version) for post_id, version in checkpoint["remaining"]
+                    if post_id in posts_by_id]
+            publish = publish or checkpoint.get("publish", False)
+            # Không truyền ngân sách → chạy tiếp với cùng mức ngân sách của run cũ
+            if budget_usd is None and budget_tokens is None:
+                limits = checkpoint.get("budget", {}).get("limits", {})
+                budget_usd, budget_tokens = limits.get("usd"), limits.get("tokens")
+            print(f"♻️ Resume run {checkpoint['run_id']}: {len(jobs)} job còn lại")
+        else:
+            # Lấy posts chưa xử lý
+            jobs = [(post, version) for post in self.get_unprocessed_posts(limit) for version in versions_to_process]
 
-        # Lấy posts chưa xử lý
-        posts = self.get_unprocessed_posts(limit)
-
-        if not posts:
+        if not jobs:
             print("ℹ️ Không có posts nào cần xử lý!")
             return self.stats
 
+        # 💰 Có ngân sách → ước tính chi phí từng job, job giá trị cao chạy trước
+        budget = SpendBudget(budget_usd, budget_tokens)
+        if budget.enabled:
+            planned = self._plan_jobs(jobs)
+            estimated = sum(item["estimate"]["usd"] for item in planned)
+            print(f"💰 Budget {budget.describe()} | ước tính toàn bộ: ${estimated:.4f} cho {len(planned)} job")
+        else:
+            planned = [{"post": post, "site_version": version} for post, version in jobs]
+
         # Tính total processing với multi-version
-        total_processing = len(posts) * (num_versions if multi_version else 1)
+        total_processing = len(planned)
         
-        print(f"📊 Posts to process: {len(posts)}")
+        print(f"📊 Posts to process: {len({item['post']['id'] for item in planned})}")
         print(f"🔄 Total operations: {total_processing}")
         print(f"⏱️ Delay between requests: {delay}s")
 
-        # Bắt đầu xử lý
+        # 🌐 Fan-out publisher: mỗi site 1 hàng đợi + connection pool riêng
+        fanout = None
+        if publish:
+            from multisite_publisher import MultiSitePublisher
+
+            fanout = MultiSitePublisher()
+
+        from adaptive_concurrency import print_limiter_stats, status_line
+        from ai_gateway import print_gateway_stats
+        from retry_policy import print_retry_stats
+        from chunked_rewrite import print_chunk_stats
+        from token_budget import print_token_stats
+        from stage_pipeline import Stage, StagePipeline
+
+        # Pipeline: text (TEXT_WORKERS) → image (IMAGE_GEN_WORKERS) → save (1 worker, giữ db_lock)
+        # → ảnh của post N được tạo trong lúc text của post N+1 đang chạy
         start_time = time.time()
+        run_id = self._new_run_id()
+        submitted, stop_reason = 0, None
 
         with tqdm(total=total_processing, desc="🇵🇭 PH AI Processing") as pbar:
-            for post in posts:
-                try:
-                    # Xử lý multi-version hoặc single version
-                    versions_to_process = range(1, num_versions + 1) if multi_version else [1]
-                    
-                    for version in versions_to_process:
-                        # Xử lý post với version specific
-                        result = self.process_single_post(post, version)
-
-                        # Cập nhật progress bar
-                        status = "✅" if result["success"] else "❌"
-                        category_info = result.get("category", "")
-                        pbar.set_postfix_str(f"{status} Post {result['post_id']} v{version} [{category_info}]")
-                        pbar.update(1)
-
-                        # Delay giữa requests
-                        if delay > 0:
-                            time.sleep(delay)
 
-                except KeyboardInterrupt:
-                    print("\n⚠️ Bị dừng bởi người dùng")
-                    break
-                except Exception as e:
-                    self.logger.error(f"❌ Exception trong batch processing: {e}")
-                    self.stats["errors"] += 1
-                    pbar.update(1)
+            def on_result(job: Dict[str, Any]):
+                budget.release((job["post"]["id"], job["site_version"]))
+                # Đưa sang site của version này, không chờ publish xong
+                if fanout:
+                    fanout.submit(
+                        job["post"]["id"],
+                        job["site_version"],
+                        self._ai_result_to_wp_content(job["post"], job["ai_result"]),
+                        job["ai_result"].get("image_url"),
+                    )
+                result = self._job_result(job)
+                pbar.set_postfix_str(
+                    f"✅ Post {result['post_id']} v{result['site_version']} [{result['category']}] "
+                    f"{pipeline.status_line()} | {status_line()}"
+                )
+                pbar.update(1)
+
+            def on_error(stage_name: str, job: Dict[str, Any], error: Exception):
+                budget.release((job["post"]["id"], job["site_version"]))
+                self._job_failed(job, error)
+                pbar.set_postfix_str(f"❌ Post {job['post']['id']} v{job['site_version']} ({stage_name})")
+                pbar.update(1)
+
+            pipeline = StagePipeline(
+                [
+                    Stage("text", self._stage_text, workers=Config.TEXT_WORKERS),
+                    Stage("image", self._stage_image, workers=Config.IMAGE_GEN_WORKERS),
+                    Stage("save", self._stage_save, workers=1),
+                ],
+                on_result=on_result,
+                on_error=on_error,
+            ).start()
+
+            try:
+                for item in planned:
+                    post, version = item["post"], item["site_version"]
+                    # Tổng dự kiến (đã chi + job đang chạy + job này) vượt ngân sách → dừng gửi
+                    if budget.enabled and not budget.admit((post["id"], version), item["estimate"]):
+                        stop_reason = "budget"
+                        break
+
+                    # Block khi stage text đầy (backpressure)
+                    pipeline.submit({"post": post, "site_version": version, "run_id": run_id})
+                    submitted += 1
+
+                    # Delay giữa các request gửi vào pipeline
+                    if delay > 0:
+                        time.sleep(delay)
+
+            except KeyboardInterrupt:
+                print("\n⚠️ Bị dừng bởi người dùng")
+                stop_reason = "interrupted"
+            finally:
+                pipeline.close()
+
+        if fanout:
+            self.stats["publish"] = fanout.close()
+        self._flush_usage()
+
+        # 💾 Job chưa gửi → checkpoint để resume-run (giữ đúng thứ tự ưu tiên)
+        remaining = [[item["post"]["id"], item["site_version"]] for item in planned[submitted:]]
+        if remaining:
+            path = save_checkpoint(run_id, {
+                "reason": stop_reason, "remaining": remaining, "publish": publish,
+                "resumed_from": checkpoint["run_id"] if resume else None, "budget": budget.summary(),
+            })
+            self.stats["checkpoint"] = str(path)
+            print(f"\n🛑 Dừng ({stop_reason}): còn {len(remaining)} job → {path}")
+            print(f"   ▶️ Chạy tiếp: python ai_content_processor.py resume-run {run_id} [budget_usd]")
+        if resume:
+            save_checkpoint(checkpoint["run_id"], {**checkpoint, "resumed_by": run_id})
+        if budget.enabled:
+            self.stats["budget"] = budget.summary()
 
         # Tính thời gian và in kết quả
         end_time = time.time()
         duration = end_time - start_time
 
         print(f"\n📈 🇵🇭 PHILIPPINES AI PROCESSING RESULTS:")
+        print(f"   Run: {run_id}")
         print(f"   Total operations: {self.stats['total_processed']}")
         print(f"   Success: {self.stats['success']}")
         print(f"   Errors: {self.stats['errors']}")
         print(f"   Duration: {duration:.2f}s")
         if self.stats["total_processed"] > 0:
             print(f"   Speed: {self.stats['total_processed']/duration:.2f} operations/s")
+        pipeline.print_summary(duration)
+        print_limiter_stats()
+        print_retry_stats()
+        print_gateway_stats()
+        print_token_stats()
+        print_chunk_stats()
+        budget.print_summary()
         
         if multi_version:
             print(f"   🌐 Multi-site versions created: {num_versions}")
@@ -691,6 +1144,22 @@ class AIContentProcessor:
 
         return self.stats
 
+    @staticmethod
+    def _ai_result_to_wp_content(post: Dict[str, Any], ai_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Chuyển kết quả AI của 1 version thành content_data cho WordPressPublisher"""
+        from wp_batch_publisher import posts_ai_to_content
+
+        return posts_ai_to_content(
+            {
+                "title": post["title"],
+                "ai_content": ai_result.get("ai_content", ""),
+                "meta_title": ai_result.get("meta_title", ""),
+                "meta_description": ai_result.get("meta_description", ""),
+                "tags": ai_result.get("suggested_tags", "") or post.get("tags", ""),
+                "category": ai_result.get("auto_category", "") or post.get("category", ""),
+            }
+        )
+
     def get_processing_stats(self) -> Dict[str, Any]:
         """Lấy thống kê xử lý"""
         try:
@@ -712,6 +1181,28 @@ class AIContentProcessor:
             )
             status_stats = cursor.fetchall()
 
+            # Chi phí / token / latency thực tế (bảng ai_usage): theo run, stage + strategy, category
+            usage_columns = """
+                COUNT(*) AS requests, SUM(prompt_tokens) AS prompt_tokens, SUM(cached_tokens) AS cached_tokens,
+                SUM(completion_tokens) AS completion_tokens, SUM(images) AS images,
+                ROUND(SUM(cost_usd), 4) AS cost_usd, ROUND(AVG(latency_ms)) AS avg_latency_ms,
+                COUNT(DISTINCT post_id, site_version) AS posts
+            """
+            rollups = {}
+            for key, group_by, order_by in (
+                ("usage_by_run", "run_id", "MAX(created_date) DESC LIMIT 10"),
+                ("usage_by_strategy", "stage, strategy", "cost_usd DESC"),
+                ("usage_by_category", "category", "cost_usd DESC"),
+            ):
+                cursor.execute(f"SELECT {group_by}, {usage_columns} FROM ai_usage GROUP BY {group_by} ORDER BY {order_by}")
+                rollups[key] = {
+                    " / ".join(str(row.pop(column.strip()) or "-") for column in group_by.split(",")): {
+                        field: float(value) if field == "cost_usd" else int(value or 0)
+                        for field, value in row.items()
+                    }
+                    for row in cursor.fetchall()
+                }
+
             cursor.close()
 
             stats = {
@@ -721,6 +1212,7 @@ class AIContentProcessor:
                 "by_status": {
                     item["processing_status"]: item["count"] for item in status_stats
                 },
+                **rollups,
             }
 
             return stats
@@ -729,6 +1221,212 @@ class AIContentProcessor:
             self.logger.error(f"❌ Lỗi lấy stats: {e}")
             return {}
 
+    @staticmethod
+    def print_processing_stats(stats: Dict[str, Any]):
+        """In kết quả get_processing_stats (rollup usage: mỗi nhóm 1 dòng)"""
+        for key, value in stats.items():
+            if not key.startswith("usage_by_"):
+                print(f"   {key}: {value}")
+                continue
+            print(f"   {key}:")
+            for group, item in value.items():
+                print(f"      {group}: {item['requests']} req, {item['posts']} bài | prompt {item['prompt_tokens']} "
+                      f"(cached {item['cached_tokens']}) | output {item['completion_tokens']} | "
+                      f"{item['images']} ảnh | ${item['cost_usd']:.4f} | {item['avg_latency_ms']} ms/req")
+
+    def get_completed_ai_posts(self, limit: Optional[int] = None) -> List[Dict]:
+        """Lấy các row posts_ai đã xử lý xong (để push/re-meta lên WordPress)"""
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+
+            sql = """
+            SELECT post_id, title, ai_content, meta_title, meta_description, tags, category
+            FROM posts_ai
+            WHERE processing_status = 'completed'
+            ORDER BY updated_date DESC
+            """
+
+            if limit:
+                sql += f" LIMIT {int(limit)}"
+
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        except Error as e:
+            self.logger.error(f"❌ Lỗi lấy posts_ai: {e}")
+            return []
+
+    def push_to_wordpress(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        📤 PUSH posts_ai LÊN WORDPRESS (bulk, qua /wp-json/batch/v1 nếu site hỗ trợ)
+
+        Args:
+            limit: Giới hạn số posts push
+
+        Returns:
+            Dict thống kê {total, success, errors, results}
+        """
+        from module_wp_publisher import WordPressPublisher
+        from publish_index import PublishIndex
+        from wp_batch_publisher import WPBatchPublisher, posts_ai_to_content
+
+        rows = self.get_completed_ai_posts(limit)
+        if not rows:
+            print("ℹ️ Không có posts_ai nào để push!")
+            return {"total": 0, "success": 0, "errors": 0, "results": {}}
+
+        publisher = WordPressPublisher(Config.WP_URL or "", Config.WP_USERNAME or "", Config.WP_PASSWORD or "",
+                                       index=PublishIndex())
+        batch_publisher = WPBatchPublisher(publisher)
+
+        print(f"📤 Push {len(rows)} posts lên {Config.WP_URL}...")
+        results = batch_publisher.create_posts(
+            [{"source_id": row["post_id"], "content_data": posts_ai_to_content(row)} for row in rows]
+        )
+
+        success = sum(1 for result in results.values() if result["success"])
+        for post_id, result in results.items():
+            if result["success"]:
+                self.logger.info(f"✅ Post ID {post_id} → WP #{result['wp_post_id']} {result['link']}")
+            else:
+                self.logger.error(f"❌ Post ID {post_id} push failed: {result['error']}")
+
+        return {"total": len(rows), "success": success, "errors": len(rows) - success, "results": results}
+
+    def get_posts_by_ids(self, post_ids: List[int]) -> Dict[int, Dict]:
+        """Lấy posts gốc theo id (dùng khi collect kết quả Batch API)"""
+        if not post_ids:
+            return {}
+        try:
+            with self.db_lock:
+                cursor = self.connection.cursor(dictionary=True)
+                placeholders = ", ".join(["%s"] * len(post_ids))
+                cursor.execute(
+                    f"SELECT id, title, content, category, tags FROM posts WHERE id IN ({placeholders})",
+                    tuple(post_ids),
+                )
+                posts = cursor.fetchall()
+                cursor.close()
+            return {post["id"]: post for post in posts}
+        except Error as e:
+            self.logger.error(f"❌ Lỗi lấy posts theo id: {e}")
+            return {}
+
+    def submit_batch(self, limit: Optional[int] = None, num_versions: int = 1) -> List[str]:
+        """
+        📦 OPENAI BATCH API: render prompt cho mọi post chưa xử lý → upload JSONL → tạo batch
+        Kết quả lấy về bằng collect_batch(); custom_id = post-<id>-v<version>
+
+        Bài dài được cắt theo token budget như call thường (Batch API không chạy được chế độ chia phần)
+        """
+        from openai_batch import BatchClient, chat_request, custom_id
+        from token_budget import build_prompt, print_token_stats
+
+        posts = self.get_unprocessed_posts(limit)
+        if not posts:
+            print("✅ Không có post nào cần xử lý!")
+            return []
+
+        model = Config.AI_MODEL or "gpt-3.5-turbo"
+        requests, items = [], {}
+        for post in posts:
+            category = post.get("category") or self._auto_categorize_content(post["title"], post["content"])
+            for site_version in range(1, num_versions + 1):
+                _, make_prompt = self._post_prompt(post["title"], category, site_version)
+                prompt, _ = build_prompt(
+                    make_prompt, post["content"], model, max_tokens=2000, system=POSTS_AI_SYSTEM, label="posts_ai.batch"
+                )
+                request_id = custom_id(post["id"], site_version)
+                requests.append(chat_request(
+                    request_id, prompt, POSTS_AI_SYSTEM, model, max_tokens=2000, temperature=0.7, json_mode=True
+                ))
+                items[request_id] = {"post_id": post["id"], "site_version": site_version, "category": category}
+
+        batch_ids = BatchClient(self.openai_client, label="posts_ai.batch").submit(
+            requests, items, description=f"posts_ai backfill: {len(posts)} posts x {num_versions} versions"
+        )
+
+        # Đánh dấu processing → lần submit sau không gửi trùng
+        for post in posts:
+            self.update_processing_status(post["id"], "processing", f"Batch API: {', '.join(batch_ids)}")
+
+        print(f"📦 Đã submit {len(requests)} requests ({len(posts)} posts) trong {len(batch_ids)} batch")
+        print_token_stats()
+        return batch_ids
+
+    def collect_batch(self, batch_id: Optional[str] = None, wait: bool = True) -> Dict[str, Any]:
+        """
+        📥 Lấy kết quả batch (mặc định: mọi batch chưa collect), lưu qua cùng đường parse → image → save_ai_result
+        wait=False: batch chưa xong thì bỏ qua, lần sau collect tiếp
+        """
+        from ai_gateway import print_gateway_stats
+        from ai_usage import usage_context
+        from openai_batch import TERMINAL_STATUSES, BatchClient, parse_custom_id
+
+        client = BatchClient(self.openai_client, label="posts_ai.batch")
+        batch_ids = [batch_id] if batch_id else client.pending()
+        totals = {"batches": 0, "success": 0, "errors": 0, "pending": 0}
+        if not batch_ids:
+            print("✅ Không có batch nào đang chờ collect")
+            return totals
+
+        for current_id in batch_ids:
+            manifest = client.load_manifest(current_id)
+            batch = client.wait(current_id, timeout=None if wait else 0.001)
+            if batch.status not in TERMINAL_STATUSES:
+                print(f"⏳ Batch {current_id} chưa xong ({batch.status}) → collect lại sau")
+                totals["pending"] += 1
+                continue
+
+            items = manifest["items"]
+            posts = self.get_posts_by_ids(sorted({item["post_id"] for item in items.values()}))
+            summary = {"success": 0, "errors": 0}
+            seen = set()
+
+            def finish(request_id: str, text: Optional[str], error: Optional[str]):
+                item = items.get(request_id)
+                if item is None:
+                    post_id, site_version = parse_custom_id(request_id)
+                    item = {"post_id": post_id, "site_version": site_version, "category": ""}
+                post = posts.get(item["post_id"]) or {"id": item["post_id"], "title": "", "content": ""}
+                job = {"post": post, "site_version": item["site_version"], "run_id": current_id,
+                       "category": item["category"]}
+                try:
+                    if item["post_id"] not in posts:
+                        raise Exception("Post gốc không còn trong bảng posts")
+                    if error:
+                        raise Exception(f"Batch API: {error}")
+                    with self._usage_context(job, "text"):
+                        job["ai_result"] = self._parse_ai_response(text, label="posts_ai.batch")
+                    self._stage_save(self._stage_image(job))
+                    summary["success"] += 1
+                except Exception as e:
+                    self._job_failed(job, e)
+                    summary["errors"] += 1
+
+            with usage_context(run_id=current_id):
+                for request_id, text, error in client.results(batch):
+                    seen.add(request_id)
+                    finish(request_id, text, error)
+            # Request không có trong output/error file (batch expired/cancelled giữa chừng)
+            for request_id in items:
+                if request_id not in seen:
+                    finish(request_id, None, f"không có kết quả (batch {batch.status})")
+
+            self._flush_usage()
+            client.mark_collected(current_id, summary)
+            totals["batches"] += 1
+            totals["success"] += summary["success"]
+            totals["errors"] += summary["errors"]
+            print(f"📥 Batch {current_id} ({batch.status}): ✅ {summary['success']} | ❌ {summary['errors']}")
+
+        print(f"\n🎯 Collect: {totals['batches']} batch | ✅ {totals['success']} | ❌ {totals['errors']} | "
+              f"⏳ {totals['pending']} batch chưa xong")
+        print_gateway_stats()
+        return totals
+
     def close(self):
         """Đóng kết nối"""
         if self.connection and self.connection.is_connected():
@@ -758,21 +1456,41 @@ def main():
                 delay = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
                 multi_version = sys.argv[4].lower() == "true" if len(sys.argv) > 4 else False
                 num_versions = int(sys.argv[5]) if len(sys.argv) > 5 else 3
-                stats = processor.process_batch(limit, delay, multi_version, num_versions)
+                budget_usd = float(sys.argv[6]) if len(sys.argv) > 6 else None
+                stats = processor.process_batch(limit, delay, multi_version, num_versions, budget_usd=budget_usd)
 
             elif command == "multi":
                 # Multi-version processing
                 limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
                 delay = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
                 num_versions = int(sys.argv[4]) if len(sys.argv) > 4 else 3
-                stats = processor.process_batch(limit, delay, True, num_versions)
+                budget_usd = float(sys.argv[5]) if len(sys.argv) > 5 else None
+                stats = processor.process_batch(limit, delay, True, num_versions, budget_usd=budget_usd)
+
+            elif command == "resume-run":
+                # Chạy tiếp run đã dừng vì hết ngân sách (không có run_id: liệt kê checkpoint đang chờ)
+                from spend_budget import pending_checkpoints
+
+                if len(sys.argv) < 3:
+                    run_ids = pending_checkpoints()
+                    print("\n".join(f"  {run_id}" for run_id in run_ids) or "✅ Không có run nào đang chờ resume")
+                else:
+                    budget_usd = float(sys.argv[3]) if len(sys.argv) > 3 else None
+                    delay = float(sys.argv[4]) if len(sys.argv) > 4 else 2.0
+                    stats = processor.process_batch(delay=delay, budget_usd=budget_usd, resume=sys.argv[2])
+
+            elif command == "multi-publish":
+                # Multi-version + publish version k lên site k
+                limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+                delay = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+                num_versions = int(sys.argv[4]) if len(sys.argv) > 4 else 3
+                stats = processor.process_batch(limit, delay, True, num_versions, publish=True)
 
             elif command == "stats":
                 # Hiển thị thống kê
                 stats = processor.get_processing_stats()
                 print(f"\n📊 AI PROCESSING STATISTICS:")
-                for key, value in stats.items():
-                    print(f"   {key}: {value}")
+                processor.print_processing_stats(stats)
 
             elif command == "single":
                 # Xử lý 1 post
@@ -782,19 +1500,42 @@ def main():
                 # Test multi-version với 1 post
                 stats = processor.process_batch(limit=1, delay=0, multi_version=True, num_versions=2)
 
+            elif command == "push-wp":
+                # Bulk push posts_ai lên WordPress
+                limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+                stats = processor.push_to_wordpress(limit)
+                print(f"🎯 Pushed {stats['success']}/{stats['total']} posts")
+
+            elif command == "submit-batch":
+                # OpenAI Batch API: submit mọi post chưa xử lý (collect sau)
+                limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+                num_versions = min(int(sys.argv[3]) if len(sys.argv) > 3 else 1, 5)
+                processor.submit_batch(limit, num_versions)
+
+            elif command == "collect-batch":
+                # Lấy kết quả batch đã submit (--no-wait: bỏ qua batch chưa xong)
+                args = [arg for arg in sys.argv[2:] if arg != "--no-wait"]
+                processor.collect_batch(args[0] if args else None, wait="--no-wait" not in sys.argv)
+
             else:
                 print(f"❌ Lệnh không hợp lệ: {command}")
                 print("🇵🇭 PHILIPPINES AI CONTENT PROCESSOR")
                 print("Usage: python ai_content_processor.py [command] [args...]")
                 print("\nCommands:")
-                print("  batch [limit] [delay] [multi_version] [num_versions] - Batch processing")
-                print("  multi [limit] [delay] [num_versions] - Multi-version processing")
+                print("  batch [limit] [delay] [multi_version] [num_versions] [budget_usd] - Batch processing")
+                print("  multi [limit] [delay] [num_versions] [budget_usd] - Multi-version processing")
+                print("  resume-run [run_id|checkpoint.json] [budget_usd] [delay] - Continue a run stopped by its budget")
+                print("  multi-publish [limit] [delay] [num_versions] - Multi-version + publish v<k> to site k (sites.json)")
                 print("  stats - Show statistics")
                 print("  single - Process 1 post")
                 print("  test-multi - Test multi-version with 1 post")
+                print("  push-wp [limit] - Bulk push completed posts_ai to WordPress")
+                print("  submit-batch [limit] [num_versions] - OpenAI Batch API: submit unprocessed posts")
+                print("  collect-batch [batch_id] [--no-wait] - Collect Batch API results into posts_ai")
                 print("\nExamples:")
                 print("  python ai_content_processor.py batch 10 2.0 false 1")
                 print("  python ai_content_processor.py multi 5 2.0 3")
+                print("  python ai_content_processor.py multi 1000 0 5 20.0")
                 print("  python ai_content_processor.py test-multi")
                 print("  python ai_content_processor.py stats")
         else:
@@ -836,8 +1577,7 @@ def main():
                     elif choice == "4":
                         stats = processor.get_processing_stats()
                         print(f"\n📊 THỐNG KÊ:")
-                        for key, value in stats.items():
-                            print(f"   {key}: {value}")
+                        processor.print_processing_stats(stats)
                     elif choice == "5":
                         stats = processor.process_batch(limit=1, delay=0)
                     elif choice == "6":
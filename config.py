@@ -12,12 +12,22 @@ class Config:
     # API Keys
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # None = api.openai.com; trỏ tới stub khi test
 
     # WordPress
     WP_URL = os.getenv("WP_URL")
     WP_USERNAME = os.getenv("WP_USERNAME")
     WP_PASSWORD = os.getenv("WP_PASSWORD")
     WP_API_URL = f"{WP_URL}/wp-json/wp/v2" if WP_URL else None
+    WP_DEFAULT_CATEGORY_ID = int(os.getenv("WP_DEFAULT_CATEGORY_ID", 1))
+    WP_MAX_CONCURRENCY = int(os.getenv("WP_MAX_CONCURRENCY", 4))  # request đồng thời / site
+    SITES_FILE = os.getenv("SITES_FILE", "sites.json")  # multi-site registry
+
+    # Local cache (taxonomy IDs, ...)
+    CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+    WP_TAXONOMY_TTL = int(os.getenv("WP_TAXONOMY_TTL", 86400))  # giây
+    PUBLISH_INDEX_DB = os.getenv("PUBLISH_INDEX_DB", os.path.join(CACHE_DIR, "publish_index.sqlite3"))
+    MEDIA_VERIFY_TTL = int(os.getenv("MEDIA_VERIFY_TTL", 7 * 86400))  # giây
 
     # Google Sheets
     GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
@@ -29,11 +39,99 @@ class Config:
     AI_MODEL = os.getenv("AI_MODEL", "gpt-3.5-turbo")
     MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 2000))
     IMAGE_SIZE = os.getenv("IMAGE_SIZE", "1024x1024")
+    
+    # Image optimization (trước khi upload WordPress)
+    IMAGE_OPTIMIZE = os.getenv("IMAGE_OPTIMIZE", "true").lower() == "true"
+    IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp")  # webp | jpeg
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 82))
+    IMAGE_MAX_WIDTH = int(os.getenv("IMAGE_MAX_WIDTH", 1200))
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 0))  # 0 = số CPU
+    IMAGE_SPOOL_DIR = os.getenv("IMAGE_SPOOL_DIR", os.path.join(CACHE_DIR, "images"))
+    IMAGE_SPOOL_TTL = int(os.getenv("IMAGE_SPOOL_TTL", 2 * 86400))  # giây
 
     # Processing
     BATCH_SIZE = int(os.getenv("BATCH_SIZE", 5))
     CONCURRENT_REQUESTS = int(os.getenv("CONCURRENT_REQUESTS", 3))
     REQUEST_DELAY = int(os.getenv("REQUEST_DELAY", 2))
+    # Rate submit việc (việc/giây, 0 = không giới hạn); mặc định 1 việc mỗi REQUEST_DELAY giây
+    REQUEST_RATE = float(os.getenv("REQUEST_RATE", 1 / REQUEST_DELAY if REQUEST_DELAY else 0))
+    MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", CONCURRENT_REQUESTS * 2))
+
+    # Adaptive concurrency (AIMD theo endpoint: OpenAI, Gemini, Sheets, WordPress host)
+    ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+    AIMD_INITIAL_LIMIT = int(os.getenv("AIMD_INITIAL_LIMIT", CONCURRENT_REQUESTS))
+    AIMD_MAX_LIMIT = int(os.getenv("AIMD_MAX_LIMIT", MAX_CONCURRENT_REQUESTS * 2))
+    AIMD_LATENCY_TOLERANCE = float(os.getenv("AIMD_LATENCY_TOLERANCE", 2.0))  # p95 ≤ baseline × tolerance
+
+    # Retry OpenAI/Gemini (backoff lũy thừa + jitter, tôn trọng Retry-After)
+    AI_RETRY_ATTEMPTS = int(os.getenv("AI_RETRY_ATTEMPTS", 5))
+    AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", 1.0))  # giây
+    AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", 30.0))  # trần mỗi lần chờ
+    AI_RETRY_DEADLINE = float(os.getenv("AI_RETRY_DEADLINE", 180.0))  # tổng thời gian tối đa 1 lời gọi
+    AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", 120.0))  # timeout 1 lần thử
+
+    # Circuit breaker + failover OpenAI ↔ Gemini
+    AI_FAILOVER = os.getenv("AI_FAILOVER", "true").lower() == "true"
+    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    CB_FAILURE_THRESHOLD = int(os.getenv("CB_FAILURE_THRESHOLD", 5))  # lỗi liên tiếp → OPEN
+    CB_SLOW_CALL_SECONDS = float(os.getenv("CB_SLOW_CALL_SECONDS", 60.0))  # call chậm hơn = lỗi
+    CB_OPEN_SECONDS = float(os.getenv("CB_OPEN_SECONDS", 60.0))  # thời gian OPEN trước khi thăm dò
+    CB_HALF_OPEN_PROBES = int(os.getenv("CB_HALF_OPEN_PROBES", 1))
+
+    # Hedged requests: quá p90 latency → gửi thêm 1 request (tăng chi phí tối đa HEDGE_BUDGET)
+    AI_HEDGING = os.getenv("AI_HEDGING", "false").lower() == "true"
+    HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", 0.1))  # tỉ lệ request thêm tối đa
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))  # số mẫu latency trước khi hedge
+    HEDGE_PROVIDER = os.getenv("HEDGE_PROVIDER", "same")  # same | alternate
+
+    # Token budget cho input AI (0 = chỉ giới hạn theo context window của model)
+    AI_INPUT_TOKEN_BUDGET = int(os.getenv("AI_INPUT_TOKEN_BUDGET", 3000))
+
+    # Bài dài vượt token budget → viết lại theo phần (map) + 1 call gộp title/meta/tags (reduce)
+    AI_CHUNKED_REWRITE = os.getenv("AI_CHUNKED_REWRITE", "true").lower() == "true"
+    AI_CHUNK_TOKENS = int(os.getenv("AI_CHUNK_TOKENS", 1200))  # token nguồn mỗi phần
+    AI_CHUNK_WORKERS = int(os.getenv("AI_CHUNK_WORKERS", 3))  # số phần viết lại đồng thời / bài
+    SECTION_CACHE_DB = os.getenv("SECTION_CACHE_DB", os.path.join(CACHE_DIR, "section_cache.sqlite3"))
+
+    # OpenAI Batch API (backfill qua đêm: rẻ hơn, không chiếm rate limit thường)
+    OPENAI_BATCH_DIR = os.getenv("OPENAI_BATCH_DIR", os.path.join(CACHE_DIR, "batches"))  # JSONL + manifest
+    OPENAI_BATCH_WINDOW = os.getenv("OPENAI_BATCH_WINDOW", "24h")
+    OPENAI_BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", 60.0))
+    OPENAI_BATCH_MAX_REQUESTS = int(os.getenv("OPENAI_BATCH_MAX_REQUESTS", 50000))  # giới hạn mỗi batch
+
+    # Prompt template registry (prompts/*.json, reload khi file đổi)
+    PROMPTS_DIR = os.getenv("PROMPTS_DIR", "prompts")
+    PROMPTS_RELOAD_INTERVAL = float(os.getenv("PROMPTS_RELOAD_INTERVAL", 2.0))  # giây giữa 2 lần kiểm tra mtime
+
+    # Structured output: JSON mode của provider + 1 call sửa rẻ khi response hỏng/thiếu field
+    AI_JSON_MODE = os.getenv("AI_JSON_MODE", "true").lower() == "true"
+    AI_REPAIR_MODEL = os.getenv("AI_REPAIR_MODEL", "gpt-4o-mini")
+    AI_JSON_REPAIR = os.getenv("AI_JSON_REPAIR", "true").lower() == "true"
+
+    # Streaming cho text stage: kiểm tra JSON khi token về, hủy + gọi lại sớm nếu sai format
+    AI_STREAMING = os.getenv("AI_STREAMING", "false").lower() == "true"
+    AI_STREAM_PROBE_CHARS = int(os.getenv("AI_STREAM_PROBE_CHARS", 200))  # phải thấy '{' + key đầu trong chừng này ký tự
+    AI_STREAM_RETRIES = int(os.getenv("AI_STREAM_RETRIES", 1))  # số lần gọi lại ngay khi stream bị hủy
+
+    # Ngân sách mỗi run batch (0 = không giới hạn): hết ngân sách → dừng + checkpoint để resume-run
+    RUN_BUDGET_USD = float(os.getenv("RUN_BUDGET_USD", 0))
+    RUN_BUDGET_TOKENS = int(os.getenv("RUN_BUDGET_TOKENS", 0))
+    RUN_BUDGET_HISTORY_DAYS = int(os.getenv("RUN_BUDGET_HISTORY_DAYS", 30))  # lịch sử ai_usage để ước tính
+    # Thứ tự ưu tiên category khi có ngân sách (trước = giá trị cao hơn)
+    RUN_PRIORITY_CATEGORIES = [
+        item.strip() for item in os.getenv("RUN_PRIORITY_CATEGORIES", "Bonus,Review,Payment,GameGuide,News").split(",")
+        if item.strip()
+    ]
+    RUN_CHECKPOINT_DIR = os.getenv("RUN_CHECKPOINT_DIR", os.path.join(CACHE_DIR, "runs"))
+
+    # Staged pipeline: số worker mỗi stage (text AI, image AI)
+    TEXT_WORKERS = int(os.getenv("TEXT_WORKERS", CONCURRENT_REQUESTS))
+    IMAGE_GEN_WORKERS = int(os.getenv("IMAGE_GEN_WORKERS", CONCURRENT_REQUESTS))
+
+    # HTTP connection pool (WordPress + download ảnh)
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", CONCURRENT_REQUESTS * 2))
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+    HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.5))
 
     # Google Sheet columns mapping
     SHEET_COLUMNS = {
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ADAPTIVE CONCURRENCY
+Bộ điều khiển AIMD (additive increase / multiplicative decrease) giới hạn số request đồng thời theo endpoint
+
+- Mỗi endpoint (openai.chat, openai.images, gemini, sheets, http:<host>, ...) có 1 limiter riêng
+- Sau mỗi "vòng" (limit request thành công): p95 latency và tỉ lệ lỗi ổn → limit + 1
+- 429 / 5xx / timeout → limit × 0.5 (tối đa 1 lần mỗi khoảng ~latency, tránh giảm dồn)
+- Limiter chặn (block) thread gọi khi đã đủ limit request đang chạy
+- limited(endpoint): context manager dùng quanh lời gọi API; ControlledHTTPAdapter (http_helper) cho requests
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Optional
+
+from config import Config
+
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+OVERLOAD_NAME_HINTS = ("Timeout", "RateLimit", "ResourceExhausted", "ServiceUnavailable", "Overloaded")
+
+
+def status_of(error: Exception) -> Optional[int]:
+    """HTTP status của exception từ OpenAI/Gemini/requests (nếu có)"""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_overload_error(error: Exception) -> bool:
+    """429/5xx/timeout = tín hiệu quá tải → giảm concurrency"""
+    if isinstance(error, TimeoutError):
+        return True
+    status = status_of(error)
+    if status in OVERLOAD_STATUSES or (status is not None and status >= 500):
+        return True
+    return any(hint in type(error).__name__ for hint in OVERLOAD_NAME_HINTS)
+
+
+class AIMDLimiter:
+    """Giới hạn concurrency tự điều chỉnh cho 1 endpoint"""
+
+    def __init__(self, name: str, initial: Optional[int] = None, min_limit: int = 1,
+                 max_limit: Optional[int] = None, tolerance: Optional[float] = None, window: int = 50):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit or Config.AIMD_MAX_LIMIT
+        self.limit = float(max(min_limit, min(initial or Config.AIMD_INITIAL_LIMIT, self.max_limit)))
+        self.tolerance = tolerance or Config.AIMD_LATENCY_TOLERANCE
+        self.in_flight = 0
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.baseline_p95: Optional[float] = None
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.stats = {
+            "requests": 0, "overloads": 0, "errors": 0, "increases": 0, "decreases": 0,
+            "wait_time": 0.0, "min_seen": int(self.limit), "max_seen": int(self.limit),
+        }
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def acquire(self):
+        """Chờ tới khi in_flight < limit"""
+        start = time.monotonic()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            self.stats["wait_time"] += time.monotonic() - start
+
+    def release(self, latency: float, outcome: str = "ok"):
+        """outcome: 'ok' | 'overload' (429/5xx/timeout) | 'error' (lỗi khác, không giảm limit)"""
+        with self._cond:
+            self.in_flight -= 1
+            self.stats["requests"] += 1
+            self.outcomes.append(outcome)
+            if outcome == "overload":
+                self.stats["overloads"] += 1
+                self._decrease()
+            elif outcome == "error":
+                self.stats["errors"] += 1
+            else:
+                self.latencies.append(latency)
+                self._maybe_increase()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """with limiter.slot(): gọi API - tự phân loại exception"""
+        self.acquire()
+        start = time.monotonic()
+        outcome = "ok"
+        try:
+            yield
+        except Exception as e:
+            outcome = "overload" if is_overload_error(e) else "error"
+            raise
+        finally:
+            self.release(time.monotonic() - start, outcome)
+
+    def _percentile(self, q: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[max(0, int(len(ordered) * q) - 1)] if ordered else 0.0
+
+    def _decrease(self):
+        now = time.monotonic()
+        # Nhiều request cùng lúc nhận 429 → chỉ tính 1 lần giảm trong 1 khoảng latency
+        if now - self._last_decrease < max(self._percentile(0.5), 1.0):
+            return
+        self._last_decrease = now
+        self._successes = 0
+        new_limit = max(self.min_limit, self.limit * 0.5)
+        if int(new_limit) < int(self.limit):
+            self.stats["decreases"] += 1
+        self.limit = new_limit
+        self.stats["min_seen"] = min(self.stats["min_seen"], int(self.limit))
+
+    def _maybe_increase(self):
+        self._successes += 1
+        if self._successes < int(self.limit):
+            return
+        # Hết 1 vòng ở limit hiện tại → đánh giá sức khỏe endpoint
+        self._successes = 0
+        p95 = self._percentile(0.95)
+        if len(self.latencies) >= 10:
+            self.baseline_p95 = p95 if self.baseline_p95 is None else min(self.baseline_p95, p95)
+
+        failures = sum(1 for outcome in self.outcomes if outcome != "ok")
+        error_rate = failures / len(self.outcomes) if self.outcomes else 0.0
+        latency_ok = self.baseline_p95 is None or p95 <= self.baseline_p95 * self.tolerance
+
+        if error_rate < 0.05 and latency_ok and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.stats["increases"] += 1
+            self.stats["max_seen"] = max(self.stats["max_seen"], int(self.limit))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(
+                self.stats,
+                limit=int(self.limit),
+                in_flight=self.in_flight,
+                p95=self._percentile(0.95),
+                baseline_p95=self.baseline_p95,
+            )
+
+
+_limiters: Dict[str, AIMDLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(endpoint: str, **kwargs) -> AIMDLimiter:
+    """Limiter dùng chung trong process cho endpoint"""
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            _limiters[endpoint] = AIMDLimiter(endpoint, **kwargs)
+        return _limiters[endpoint]
+
+
+def limited(endpoint: str):
+    """Context manager giới hạn concurrency cho 1 lời gọi (no-op nếu ADAPTIVE_CONCURRENCY=false)"""
+    if not Config.ADAPTIVE_CONCURRENCY:
+        return nullcontext()
+    return get_limiter(endpoint).slot()
+
+
+def status_line() -> str:
+    """Limit hiện tại theo endpoint, vd. 'openai.chat 4/6 | sheets 1/2' (in_flight/limit)"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return " | ".join(f"{l.name} {l.in_flight}/{l.current_limit}" for l in limiters)
+
+
+def print_limiter_stats():
+    """In limit hiện tại + số lần tăng/giảm theo endpoint"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    if not limiters:
+        return
+    print("   🎚️ Adaptive concurrency:")
+    for limiter in limiters:
+        stats = limiter.snapshot()
+        print(f"      {limiter.name}: limit {stats['limit']} (range {stats['min_seen']}-{stats['max_seen']}) | "
+              f"{stats['requests']} req | ⚠️ {stats['overloads']} overload | "
+              f"↑{stats['increases']} ↓{stats['decreases']} | p95 {stats['p95']:.2f}s | "
+              f"chờ slot {stats['wait_time']:.1f}s")
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI GATEWAY
+Lớp gọi AI chung cho OpenAI + Gemini: failover theo circuit breaker + chuẩn hóa output
+
+- Thứ tự provider: provider ưu tiên (DEFAULT_AI_PROVIDER hoặc tham số) → provider còn lại
+- Mỗi provider có circuit breaker riêng; provider đang OPEN bị bỏ qua ngay, request mới đi provider khỏe
+- Mỗi lần gọi đi qua RetryPolicy (backoff, Retry-After) + limiter AIMD của endpoint
+- parse_json_content / normalize_fields: 2 provider trả về cùng 1 bộ field JSON
+- AI_HEDGING: request chậm hơn p90 → gửi thêm 1 bản (hedging.Hedger), lấy response hợp lệ về trước
+- Token usage (gồm cached prompt tokens) ghi theo label của call site (ai_usage)
+- complete_json: JSON mode của provider + parse/validate field + 1 call sửa rẻ khi cần (json_output)
+- stream=True: đọc response dạng stream, hủy + gọi lại sớm khi rõ ràng không phải JSON (ai_stream)
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from ai_stream import StreamAbort, StreamMonitor, print_stream_stats
+from ai_usage import print_usage_stats, record_usage
+from circuit_breaker import CircuitOpenError, get_breaker, print_breaker_stats
+from config import Config
+from hedging import get_hedger, print_hedge_stats
+from json_output import REPAIR_SYSTEM, parse_json, parse_structured, print_parse_stats, supports_json_mode
+from retry_policy import call_with_retry
+
+PROVIDERS = ("openai", "gemini")
+ENDPOINTS = {"openai": "openai.chat", "gemini": "gemini"}
+
+# Tên field khác nhau giữa prompt/provider → tên chuẩn
+FIELD_ALIASES = {
+    "meta_description": ("meta_desc", "description", "metaDescription"),
+    "meta_desc": ("meta_description", "description", "metaDescription"),
+    "meta_title": ("seo_title", "metaTitle"),
+    "content": ("body", "html", "article"),
+    "image_prompt": ("imagePrompt", "image_description"),
+    "tags": ("keywords", "suggested_tags"),
+    "excerpt": ("summary",),
+}
+
+
+class AIUnavailableError(Exception):
+    """Mọi provider đều lỗi hoặc đang bị ngắt"""
+
+
+def parse_json_content(text: str) -> Optional[Dict[str, Any]]:
+    """Parse JSON từ response AI (bỏ ```json fence, dấu phẩy thừa, response bị cắt); None nếu không parse được"""
+    return parse_json(text)
+
+
+def normalize_fields(data: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Đưa dict từ bất kỳ provider nào về đúng bộ field
+    Args:
+        data: JSON đã parse
+        fields: {tên field: giá trị mặc định}; mặc định là list → field dạng list (tách theo dấu phẩy)
+    """
+    result = {}
+    for field, default in fields.items():
+        value = data.get(field)
+        if value in (None, ""):
+            value = next((data[alias] for alias in FIELD_ALIASES.get(field, ()) if data.get(alias)), default)
+
+        if isinstance(default, list):
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(",") if item.strip()]
+        elif isinstance(value, list):
+            value = ", ".join(str(item) for item in value)
+        elif value is not None and not isinstance(value, str):
+            value = str(value)
+        result[field] = value
+    return result
+
+
+class AIGateway:
+    """Gọi text completion với failover OpenAI ↔ Gemini"""
+
+    def __init__(self, openai_client=None, gemini_model=None, preferred: Optional[str] = None,
+                 failover: Optional[bool] = None):
+        """
+        Args:
+            openai_client: openai.OpenAI (None = không dùng OpenAI)
+            gemini_model: genai.GenerativeModel (None = không dùng Gemini)
+            preferred: provider ưu tiên (mặc định DEFAULT_AI_PROVIDER)
+            failover: cho phép chuyển provider (mặc định AI_FAILOVER)
+        """
+        self.clients = {"openai": openai_client, "gemini": gemini_model}
+        self.preferred = preferred or Config.DEFAULT_AI_PROVIDER
+        self.failover = Config.AI_FAILOVER if failover is None else failover
+
+    def providers(self, preferred: Optional[str] = None, failover: Optional[bool] = None) -> List[str]:
+        """Thứ tự thử provider (chỉ provider đã cấu hình)"""
+        first = preferred or self.preferred
+        if first not in PROVIDERS:
+            raise ValueError(f"Provider không hỗ trợ: {first}")
+        order = [first]
+        if self.failover if failover is None else failover:
+            order += [name for name in PROVIDERS if name != first]
+        return [name for name in order if self.clients.get(name) is not None]
+
+    def complete(self, prompt: str, system: str = "", max_tokens: int = 2000, temperature: float = 0.7,
+                 model: Optional[str] = None, provider: Optional[str] = None,
+                 failover: Optional[bool] = None, hedge: Optional[bool] = None,
+                 validate: Optional[Callable[[str], bool]] = None, label: str = "ai",
+                 json_mode: bool = False, stream: bool = False,
+                 stream_keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Gọi AI, tự chuyển provider khi provider ưu tiên lỗi / circuit mở
+        Args:
+            hedge: bật hedging (mặc định AI_HEDGING)
+            validate: kiểm tra text hợp lệ khi hedge (vd. parse được JSON)
+            label: tên call site cho thống kê token usage
+            json_mode: yêu cầu provider trả về JSON object (model không hỗ trợ → gọi thường)
+            stream: đọc dạng stream + kiểm tra JSON sớm (ghi TTFT, tokens/s)
+            stream_keys: key hợp lệ của JSON output (key đầu tiên ngoài danh sách → hủy stream)
+        Returns: {'text': str, 'provider': str}
+        Raises: AIUnavailableError nếu mọi provider đều không dùng được
+        """
+        order = self.providers(provider, failover)
+        if not order:
+            raise AIUnavailableError("Chưa cấu hình AI provider nào")
+
+        def attempt(providers: List[str]) -> Dict[str, Any]:
+            return self._complete(providers, prompt, system, max_tokens, temperature, model, label, json_mode,
+                                  stream, stream_keys)
+
+        if not (Config.AI_HEDGING if hedge is None else hedge):
+            return attempt(order)
+
+        # Bản hedge: cùng provider hoặc provider còn lại (nếu có)
+        backup_order = order
+        if Config.HEDGE_PROVIDER == "alternate" and len(order) > 1:
+            backup_order = order[1:] + order[:1]
+        return get_hedger(order[0]).run(
+            lambda: attempt(order),
+            lambda: attempt(backup_order),
+            validate=(lambda response: validate(response["text"])) if validate else None,
+        )
+
+    def complete_json(self, prompt: str, required: Iterable[str] = (), system: str = "", max_tokens: int = 2000,
+                      temperature: float = 0.7, model: Optional[str] = None, provider: Optional[str] = None,
+                      label: str = "ai", **kwargs) -> Dict[str, Any]:
+        """
+        complete() ở JSON mode + parse/validate field bắt buộc
+        Response hỏng/thiếu field → 1 call sửa rẻ (AI_REPAIR_MODEL, temperature 0) cùng provider
+        AI_STREAMING: đọc dạng stream, hủy sớm khi không phải JSON (stream_keys: mọi key của schema)
+        Returns: {'data': dict, 'text': str, 'provider': str}
+        Raises: AIUnavailableError, JSONOutputError
+        """
+        required = list(required)
+        kwargs.setdefault("validate", lambda text: parse_json(text) is not None)
+        kwargs.setdefault("stream", Config.AI_STREAMING)
+        response = self.complete(prompt, system=system, max_tokens=max_tokens, temperature=temperature, model=model,
+                                 provider=provider, label=label, json_mode=True, **kwargs)
+        data = self.parse_json_response(response["text"], required, provider=response["provider"], model=model,
+                                        max_tokens=max_tokens, label=label)
+        return dict(response, data=data)
+
+    def parse_json_response(self, text: str, required: Iterable[str] = (), provider: str = "openai",
+                            model: Optional[str] = None, max_tokens: int = 2000, label: str = "ai") -> Dict[str, Any]:
+        """
+        Parse + validate response đã có (vd. kết quả Batch API); hỏng → 1 call sửa qua provider đã sinh ra nó
+        Raises: JSONOutputError
+        """
+        def repair(repair_prompt: str) -> str:
+            return self.complete(repair_prompt, system=REPAIR_SYSTEM, max_tokens=max_tokens, temperature=0,
+                                 model=Config.AI_REPAIR_MODEL, provider=provider, failover=False, hedge=False,
+                                 label=f"{label}.repair", json_mode=True)["text"]
+
+        used_model = (model or Config.AI_MODEL or "gpt-3.5-turbo") if provider == "openai" else Config.GEMINI_MODEL
+        can_repair = self.clients.get(provider) is not None
+        return parse_structured(text, required, repair=repair if can_repair else None, model=used_model)
+
+    def _complete(self, order: List[str], prompt: str, system: str, max_tokens: int, temperature: float,
+                  model: Optional[str], label: str = "ai", json_mode: bool = False, stream: bool = False,
+                  stream_keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Thử lần lượt các provider trong order"""
+        errors = []
+        for name in order:
+            try:
+                text = self._attempt(name, prompt, system, max_tokens, temperature, model, label, json_mode,
+                                     stream, stream_keys)
+            except CircuitOpenError as e:
+                errors.append(str(e))
+                continue
+            except Exception as e:
+                errors.append(f"{name}: {str(e)[:200]}")
+                continue
+
+            if name != order[0]:
+                _record_failover(order[0], name)
+                print(f"🔀 [AI GATEWAY] {order[0]} không khả dụng → dùng {name}")
+            return {"text": text, "provider": name}
+
+        raise AIUnavailableError(" | ".join(errors))
+
+    def _attempt(self, name: str, prompt: str, system: str, max_tokens: int, temperature: float,
+                 model: Optional[str], label: str, json_mode: bool, stream: bool,
+                 stream_keys: Optional[Iterable[str]]) -> str:
+        """1 provider qua RetryPolicy; stream bị hủy sớm (StreamAbort) → gọi lại ngay, tối đa AI_STREAM_RETRIES lần"""
+        for attempt in range(Config.AI_STREAM_RETRIES + 1):
+            try:
+                return call_with_retry(
+                    ENDPOINTS[name],
+                    lambda timeout: self._call(name, prompt, system, max_tokens, temperature, model, label,
+                                               json_mode, stream, stream_keys, timeout),
+                    breaker=get_breaker(name),
+                )
+            except StreamAbort as e:
+                if attempt >= Config.AI_STREAM_RETRIES:
+                    raise
+                print(f"✂️ [AI GATEWAY] {name}: hủy stream ({str(e)[:100]}) → gọi lại")
+
+    def _call(self, name: str, prompt: str, system: str, max_tokens: int, temperature: float,
+              model: Optional[str], label: str = "ai", json_mode: bool = False, stream: bool = False,
+              stream_keys: Optional[Iterable[str]] = None, timeout: Optional[float] = None) -> str:
+        """timeout: timeout của lần thử (RetryPolicy tính theo deadline còn lại), None = timeout của client"""
+        # System message đứng trước prompt → giữ cố định để prefix được provider cache
+        if name == "openai":
+            model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+            messages = [{"role": "system", "content": system}] if system else []
+            messages.append({"role": "user", "content": prompt})
+            extra = {"response_format": {"type": "json_object"}} if json_mode and supports_json_mode(name, model) else {}
+            if stream:
+                return self._stream_openai(model, messages, max_tokens, temperature, extra, label, stream_keys,
+                                           timeout)
+            start = time.monotonic()
+            response = self.clients["openai"].chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                **extra,
+            )
+            record_usage(label, name, response, model=model, latency=time.monotonic() - start)
+            return (response.choices[0].message.content or "").strip()
+
+        # Gemini không có system role riêng ở SDK cũ → ghép vào đầu prompt
+        generation_config = {"max_output_tokens": max_tokens, "temperature": temperature}
+        if json_mode and supports_json_mode(name, Config.GEMINI_MODEL):
+            generation_config["response_mime_type"] = "application/json"
+        request_options = {"timeout": timeout} if timeout else None
+        if stream:
+            return self._stream_gemini(f"{system}\n\n{prompt}" if system else prompt, generation_config, label,
+                                       stream_keys, request_options)
+        start = time.monotonic()
+        response = self.clients["gemini"].generate_content(
+            f"{system}\n\n{prompt}" if system else prompt,
+            generation_config=generation_config,
+            request_options=request_options,
+        )
+        record_usage(label, name, response, model=Config.GEMINI_MODEL, latency=time.monotonic() - start)
+        return (response.text or "").strip()
+
+    def _stream_openai(self, model: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+                       extra: Dict[str, Any], label: str, stream_keys: Optional[Iterable[str]],
+                       timeout: Optional[float] = None) -> str:
+        """Chat completion dạng stream; usage lấy từ chunk cuối (stream_options.include_usage)"""
+        monitor = StreamMonitor(model, stream_keys)
+        response = self.clients["openai"].chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout,
+            **extra,
+        )
+        usage_chunk = None
+        try:
+            for chunk in response:
+                if getattr(chunk, "usage", None):
+                    usage_chunk = chunk
+                if chunk.choices:
+                    monitor.feed(chunk.choices[0].delta.content or "")
+        finally:
+            response.close()  # StreamAbort → đóng kết nối, không tải nốt phần còn lại
+
+        completion_tokens = None
+        if usage_chunk is not None:
+            completion_tokens = record_usage(label, "openai", usage_chunk, model=model,
+                                             latency=time.monotonic() - monitor.started_at)["completion_tokens"]
+        return monitor.finish(completion_tokens).strip()
+
+    def _stream_gemini(self, prompt: str, generation_config: Dict[str, Any], label: str,
+                       stream_keys: Optional[Iterable[str]], request_options: Optional[Dict[str, Any]] = None) -> str:
+        monitor = StreamMonitor(Config.GEMINI_MODEL, stream_keys)
+        response = self.clients["gemini"].generate_content(prompt, generation_config=generation_config, stream=True,
+                                                           request_options=request_options)
+        for chunk in response:
+            monitor.feed(chunk.text or "")
+        completion_tokens = record_usage(label, "gemini", response, model=Config.GEMINI_MODEL,
+                                         latency=time.monotonic() - monitor.started_at)["completion_tokens"]
+        return monitor.finish(completion_tokens).strip()
+
+
+_failovers: Dict[str, int] = {}
+_failovers_lock = threading.Lock()
+
+
+def _record_failover(source: str, target: str):
+    with _failovers_lock:
+        key = f"{source}→{target}"
+        _failovers[key] = _failovers.get(key, 0) + 1
+
+
+def print_gateway_stats():
+    """In trạng thái circuit breaker + số request đã chuyển provider + hedging + token usage + parse JSON + stream"""
+    print_breaker_stats()
+    print_hedge_stats()
+    with _failovers_lock:
+        failovers = dict(_failovers)
+    if failovers:
+        print("   🔀 Failover: " + ", ".join(f"{key} {count}" for key, count in failovers.items()))
+    print_usage_stats()
+    print_parse_stats()
+    print_stream_stats()
@@ -6,6 +6,19 @@ import base64
 from io import BytesIO
 from typing import Optional, Dict, Any
 from config import Config
+from retry_policy import call_with_retry, record_fallback
+from ai_gateway import ENDPOINTS, AIGateway, normalize_fields
+
+# Bộ field chung cho output của cả OpenAI và Gemini
+CONTENT_FIELDS = {
+    'title': '',
+    'content': '',
+    'image_prompt': '',
+    'meta_title': '',
+    'meta_description': ''
+}
+# Field bắt buộc: thiếu sau cả call sửa → ai_fallback (main.py đánh lỗi hàng, không đăng bài)
+REQUIRED_FIELDS = ('title', 'content', 'meta_title', 'meta_description')
 
 class AIHelper:
     """Lớp xử lý AI để sinh content, title, meta và ảnh"""
@@ -15,33 +28,46 @@ class AIHelper:
     
     def _setup_apis(self):
         """Thiết lập API keys cho các AI provider"""
+        gemini_model = None
+        
         # Setup OpenAI
         if Config.OPENAI_API_KEY:
-            self.openai_client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+            self.openai_client = openai.OpenAI(
+                api_key=Config.OPENAI_API_KEY, max_retries=0, timeout=Config.AI_REQUEST_TIMEOUT
+            )
             print("✅ Đã thiết lập OpenAI API")
         
         # Setup Gemini
         if Config.GEMINI_API_KEY:
             genai.configure(api_key=Config.GEMINI_API_KEY)
+            gemini_model = genai.GenerativeModel(Config.GEMINI_MODEL)
             print("✅ Đã thiết lập Gemini API")
+        
+        # Gateway: provider ưu tiên → provider còn lại khi circuit mở
+        self.gateway = AIGateway(openai_client=getattr(self, 'openai_client', None), gemini_model=gemini_model)
     
-    def generate_content(self, prompt: str, provider: str = None) -> Dict[str, Any]:
+    def generate_content(self, prompt: str, provider: str = None, failover: bool = None) -> Dict[str, Any]:
         """
         Sinh nội dung bài viết từ prompt
+        Args:
+            provider: provider ưu tiên (mặc định DEFAULT_AI_PROVIDER)
+            failover: False = chỉ dùng đúng provider (vd. kiểm tra API)
         Returns: {
             'title': str,
             'content': str,
             'image_prompt': str,
             'meta_title': str,
-            'meta_description': str
+            'meta_description': str,
+            'provider': str
         }
         """
         provider = provider or Config.DEFAULT_AI_PROVIDER
         
         try:
             # Tạo prompt chi tiết
+            # Hướng dẫn + JSON schema cố định trước → prefix được provider cache; yêu cầu bài viết sau cùng
             detailed_prompt = f"""
-            Hãy viết một bài blog chất lượng cao dựa trên yêu cầu sau: "{prompt}"
+            Hãy viết một bài blog chất lượng cao dựa trên yêu cầu ở cuối prompt.
             
             Yêu cầu:
             1. Tạo tiêu đề hấp dẫn (dưới 60 ký tự)
@@ -58,88 +84,30 @@ class AIHelper:
                 "meta_title": "Meta title SEO",
                 "meta_description": "Meta description SEO"
             }}
+            
+            YÊU CẦU BÀI VIẾT: "{prompt}"
             """
             
-            if provider == 'openai':
-                return self._generate_with_openai(detailed_prompt)
-            elif provider == 'gemini':
-                return self._generate_with_gemini(detailed_prompt)
-            else:
-                raise ValueError(f"Provider không hỗ trợ: {provider}")
-                
-        except Exception as e:
-            print(f"❌ Lỗi sinh content: {str(e)}")
-            return self._create_error_response(str(e))
-    
-    def _generate_with_openai(self, prompt: str) -> Dict[str, Any]:
-        """Sinh content bằng OpenAI GPT"""
-        try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Bạn là một copywriter chuyên nghiệp, viết tiếng Việt tự nhiên và hấp dẫn."},
-                    {"role": "user", "content": prompt}
-                ],
+            response = self.gateway.complete_json(
+                detailed_prompt,
+                REQUIRED_FIELDS,
+                system="Bạn là một copywriter chuyên nghiệp, viết tiếng Việt tự nhiên và hấp dẫn.",
                 max_tokens=3000,
-                temperature=0.7
+                temperature=0.7,
+                model="gpt-3.5-turbo",
+                provider=provider,
+                failover=failover,
+                label="ai_helper"
             )
-            
-            content = response.choices[0].message.content
-            
-            # Parse JSON response
-            import json
-            try:
-                if content:
-                    result = json.loads(content)
-                    return result
-                else:
-                    return self._create_error_response("No content returned")
-            except json.JSONDecodeError:
-                # Nếu không parse được JSON, tạo response thủ công
-                if content:
-                    return self._parse_text_response(content)
-                else:
-                    return self._create_error_response("Empty response")
-                
-        except Exception as e:
-            print(f"❌ Lỗi OpenAI: {str(e)}")
-            raise e
-    
-    def _generate_with_gemini(self, prompt: str) -> Dict[str, Any]:
-        """Sinh content bằng Google Gemini"""
-        try:
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
-            
-            content = response.text
-            
-            # Parse JSON response
-            import json
-            try:
-                result = json.loads(content)
-                return result
-            except json.JSONDecodeError:
-                return self._parse_text_response(content)
-                
-        except Exception as e:
-            print(f"❌ Lỗi Gemini: {str(e)}")
-            raise e
-    
-    def _parse_text_response(self, text: str) -> Dict[str, Any]:
-        """Parse response khi không có JSON format"""
-        lines = text.split('\n')
-        
-        # Logic đơn giản để extract thông tin
-        title = lines[0].strip() if lines else "Tiêu đề mặc định"
-        content = text
+            result = normalize_fields(response['data'], CONTENT_FIELDS)
+            result['provider'] = response['provider']
+            return result
         
-        return {
-            'title': title[:60],
-            'content': content,
-            'image_prompt': f"Professional illustration about {title}",
-            'meta_title': title[:60],
-            'meta_description': content[:160] + "..." if len(content) > 160 else content
-        }
+        except Exception as e:
+            # Gồm cả JSONOutputError (output không thành JSON đủ field): không dựng bài từ text thô
+            print(f"❌ Lỗi sinh content: {str(e)}")
+            record_fallback(ENDPOINTS.get(provider, provider))
+            return self._create_error_response(str(e))
     
     def generate_image(self, prompt: str, provider: str = None) -> Optional[str]:
         """
@@ -171,12 +139,16 @@ class AIHelper:
             vibrant colors, modern style
             """
             
-            response = self.openai_client.images.generate(
-                model="dall-e-3",
-                prompt=optimized_prompt,
-                size="1024x1024",  # Fixed size for DALL-E 3
-                quality="standard",
-                n=1
+            response = call_with_retry(
+                "openai.images",
+                lambda timeout: self.openai_client.images.generate(
+                    model="dall-e-3",
+                    prompt=optimized_prompt,
+                    size="1024x1024",  # Fixed size for DALL-E 3
+                    quality="standard",
+                    n=1,
+                    timeout=timeout
+                ),
             )
             
             image_url = response.data[0].url if response.data else None
@@ -197,16 +169,15 @@ class AIHelper:
             'content': f'Có lỗi xảy ra: {error_msg}',
             'image_prompt': 'Error illustration',
             'meta_title': 'Lỗi',
-            'meta_description': 'Có lỗi xảy ra khi sinh content'
+            'meta_description': 'Có lỗi xảy ra khi sinh content',
+            'ai_fallback': True
         }
     
     def optimize_for_seo(self, title: str, content: str) -> Dict[str, str]:
         """Tối ưu SEO cho title và content"""
         try:
             seo_prompt = f"""
-            Hãy tối ưu SEO cho bài viết sau:
-            Tiêu đề: {title}
-            Nội dung: {content[:500]}...
+            Hãy tối ưu SEO cho bài viết ở cuối prompt.
             
             Tạo:
             1. Meta title tối ưu SEO (dưới 60 ký tự)
@@ -219,22 +190,16 @@ class AIHelper:
                 "meta_description": "...",
                 "keywords": "..."
             }}
-            """
             
-            if Config.DEFAULT_AI_PROVIDER == 'openai':
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": seo_prompt}],
-                    max_tokens=500
-                )
-                content = response.choices[0].message.content or ""
-            else:
-                model = genai.GenerativeModel('gemini-1.5-flash')
-                response = model.generate_content(seo_prompt)
-                content = response.text
+            Tiêu đề: {title}
+            Nội dung: {content[:500]}...
+            """
             
-            import json
-            return json.loads(content)
+            response = self.gateway.complete_json(
+                seo_prompt, ('meta_title', 'meta_description'), max_tokens=500, model="gpt-3.5-turbo", label="ai_helper.seo"
+            )
+            data = response['data']
+            return normalize_fields(data, {'meta_title': title[:60], 'meta_description': content[:160], 'keywords': ''})
             
         except Exception as e:
             print(f"❌ Lỗi tối ưu SEO: {str(e)}")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI STREAM
+Streaming completion cho text stage: kiểm tra JSON ngay khi token về, hủy sớm response hỏng
+
+- StreamMonitor nhận từng đoạn text của stream:
+  + không có '{' trong AI_STREAM_PROBE_CHARS ký tự đầu (lời từ chối, văn bản thường, sai format) → hủy
+  + key đầu tiên của object không thuộc schema (keys) → hủy
+  → StreamAbort: gateway đóng stream và gọi lại ngay (AI_STREAM_RETRIES), không chờ đủ ~2000 token
+- Thống kê theo model: time-to-first-token (p50/p90), tokens/s sau token đầu, số stream bị hủy
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from config import Config
+from hedging import percentile
+from token_budget import count_tokens
+
+OPEN_FENCE = re.compile(r"^```(?:json|JSON)?\s*")
+FIRST_KEY = re.compile(r'\{\s*"((?:[^"\\]|\\.)*)"\s*:')
+
+
+class StreamAbort(Exception):
+    """Stream đang về rõ ràng không phải JSON hợp lệ → hủy để gọi lại"""
+
+
+class StreamMonitor:
+    """Gom text của 1 stream, kiểm tra sớm + đo TTFT / tokens/s"""
+
+    def __init__(self, model: str, keys: Optional[Iterable[str]] = None, probe_chars: Optional[int] = None):
+        """
+        Args:
+            keys: các key hợp lệ của JSON output (None = không kiểm tra key đầu tiên)
+            probe_chars: số ký tự đầu phải thấy '{' (mặc định AI_STREAM_PROBE_CHARS)
+        """
+        self.model = model
+        self.keys = set(keys) if keys else None
+        self.probe_chars = Config.AI_STREAM_PROBE_CHARS if probe_chars is None else probe_chars
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.parts: List[str] = []
+        self.checked = False
+
+    def feed(self, text: str):
+        """Thêm 1 đoạn text; Raises: StreamAbort"""
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.parts.append(text)
+        if not self.checked:
+            self._check()
+
+    def _check(self):
+        buffer = OPEN_FENCE.sub("", "".join(self.parts).lstrip())
+        if buffer.startswith("`"):
+            return  # fence chưa về đủ
+        start = buffer.find("{")
+        if (start < 0 and len(buffer) > self.probe_chars) or start > self.probe_chars:
+            self.abort(f"không có JSON trong {self.probe_chars} ký tự đầu: {buffer[:60]!r}")
+        if start < 0:
+            return
+
+        match = FIRST_KEY.match(buffer, start)
+        if match is None:
+            if len(buffer) - start > self.probe_chars:
+                self.abort(f"không phải JSON object: {buffer[start:start + 60]!r}")
+            return
+        if self.keys is not None and match.group(1) not in self.keys:
+            self.abort(f"key đầu tiên '{match.group(1)}' không thuộc schema")
+        self.checked = True
+
+    def abort(self, reason: str):
+        _record(self.model, self._ttft(), 0, 0.0, aborted=True)
+        raise StreamAbort(reason)
+
+    def _ttft(self) -> Optional[float]:
+        return self.first_token_at - self.started_at if self.first_token_at is not None else None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def finish(self, completion_tokens: Optional[int] = None) -> str:
+        """Stream kết thúc bình thường: ghi TTFT + tokens/s; trả text đầy đủ"""
+        text = self.text
+        tokens = completion_tokens or count_tokens(text, self.model)
+        duration = time.monotonic() - self.first_token_at if self.first_token_at is not None else 0.0
+        _record(self.model, self._ttft(), tokens, duration)
+        return text
+
+
+_stats: Dict[str, Dict] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(model: str, ttft: Optional[float], tokens: int, duration: float, aborted: bool = False):
+    with _stats_lock:
+        stats = _stats.setdefault(model, {"streams": 0, "aborted": 0, "tokens": 0, "seconds": 0.0,
+                                          "ttft": deque(maxlen=500)})
+        stats["streams"] += 1
+        stats["aborted"] += int(aborted)
+        if ttft is not None:
+            stats["ttft"].append(ttft)
+        if not aborted:
+            stats["tokens"] += tokens
+            stats["seconds"] += duration
+
+
+def stream_stats() -> Dict[str, Dict[str, float]]:
+    with _stats_lock:
+        return {
+            model: {
+                "streams": item["streams"],
+                "aborted": item["aborted"],
+                "ttft_p50": percentile(item["ttft"], 0.5),
+                "ttft_p90": percentile(item["ttft"], 0.9),
+                "tokens_per_second": item["tokens"] / item["seconds"] if item["seconds"] else 0.0,
+            }
+            for model, item in _stats.items()
+        }
+
+
+def print_stream_stats():
+    """In TTFT p50/p90, tokens/s, số stream bị hủy sớm theo model"""
+    for model, item in stream_stats().items():
+        print(f"   📡 Stream {model}: {item['streams']} stream | TTFT p50 {item['ttft_p50']:.2f}s "
+              f"p90 {item['ttft_p90']:.2f}s | {item['tokens_per_second']:.0f} tokens/s | "
+              f"✂️ {item['aborted']} hủy sớm")
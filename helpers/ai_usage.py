@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI USAGE
+Đọc token usage từ response OpenAI/Gemini, tính chi phí, thống kê theo call site
+
+- OpenAI: usage.prompt_tokens / completion_tokens / prompt_tokens_details.cached_tokens
+- Gemini: usage_metadata.prompt_token_count / candidates_token_count / cached_content_token_count
+- Tỉ lệ cached = token prompt được provider tính là prefix đã cache / tổng token prompt
+  (OpenAI chỉ cache prefix ≥ 1024 token giống hệt nhau → prompt để phần tĩnh trước, dữ liệu từng bài sau cùng)
+- Chi phí = token × bảng giá MODEL_PRICES (input chưa cache / input cached / output), Batch API giảm 50%
+- usage_context(post_id=..., site_version=..., stage=...): mọi call AI bên trong được ghi thành 1 dòng
+  (kèm model, latency, chi phí) vào buffer → pipeline lấy bằng drain_usage_rows() và lưu bảng ai_usage
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+# USD / 1M token: (input, input cached, output); khớp theo tiền tố dài nhất của tên model
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "gemini-1.5-flash": (0.075, 0.01875, 0.30),
+    "gemini-1.5-pro": (1.25, 0.3125, 5.00),
+    "gemini-2.0-flash": (0.10, 0.025, 0.40),
+}
+# USD / ảnh theo (model, quality, size)
+IMAGE_PRICES: Dict[Tuple[str, str, str], float] = {
+    ("dall-e-3", "standard", "1024x1024"): 0.040,
+    ("dall-e-3", "standard", "1024x1792"): 0.080,
+    ("dall-e-3", "standard", "1792x1024"): 0.080,
+    ("dall-e-3", "hd", "1024x1024"): 0.080,
+    ("dall-e-3", "hd", "1024x1792"): 0.120,
+    ("dall-e-3", "hd", "1792x1024"): 0.120,
+}
+BATCH_DISCOUNT = 0.5
+
+
+def usage_of(provider: str, response: Any) -> Dict[str, int]:
+    """Token usage của 1 response (0 nếu SDK không trả về)"""
+    if provider == "gemini":
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "completion_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0,
+        }
+
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+    }
+
+
+def price_of(model: str) -> Optional[Tuple[float, float, float]]:
+    matches = [prefix for prefix in MODEL_PRICES if model.startswith(prefix)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def cost_of(model: str, usage: Dict[str, int], batch: bool = False) -> float:
+    """Chi phí USD của 1 response (model không có trong bảng giá → 0)"""
+    prices = price_of(model or "")
+    if prices is None:
+        return 0.0
+    cached = min(usage["cached_tokens"], usage["prompt_tokens"])
+    cost = ((usage["prompt_tokens"] - cached) * prices[0] + cached * prices[1]
+            + usage["completion_tokens"] * prices[2]) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+_context: contextvars.ContextVar = contextvars.ContextVar("ai_usage_context", default={})
+
+
+@contextmanager
+def usage_context(**fields):
+    """Gắn post_id / site_version / stage / run_id / category cho mọi call AI bên trong (lồng nhau được)"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+_stats: Dict[str, Dict[str, float]] = {}
+_rows: List[Dict[str, Any]] = []
+_stats_lock = threading.Lock()
+
+
+def _add(label: str, provider: str, model: str, usage: Dict[str, int], cost: float,
+         latency: Optional[float], images: int = 0):
+    context = _context.get()
+    with _stats_lock:
+        stats = _stats.setdefault(f"{label} ({provider})",
+                                  dict.fromkeys(("requests",) + USAGE_FIELDS + ("images", "cost", "latency"), 0))
+        stats["requests"] += 1
+        for field in USAGE_FIELDS:
+            stats[field] += usage[field]
+        stats["images"] += images
+        stats["cost"] += cost
+        stats["latency"] += latency or 0.0
+        if context:
+            _rows.append(dict(
+                run_id=context.get("run_id"), post_id=context.get("post_id"),
+                site_version=context.get("site_version"), stage=context.get("stage", ""),
+                strategy=label, category=context.get("category", ""), provider=provider, model=model,
+                images=images, latency_ms=int((latency or 0.0) * 1000), cost_usd=round(cost, 6), **usage,
+            ))
+
+
+def record_usage(label: str, provider: str, response: Any, model: Optional[str] = None,
+                 latency: Optional[float] = None, batch: bool = False) -> Dict[str, int]:
+    """
+    Cộng usage + chi phí của response vào thống kê call site label; trả usage của response
+    Args:
+        model: model đã gọi (mặc định lấy từ response / config)
+        latency: thời gian gọi (giây)
+        batch: request qua Batch API (giảm giá)
+    """
+    usage = usage_of(provider, response)
+    model = model or getattr(response, "model", None) or (
+        Config.GEMINI_MODEL if provider == "gemini" else Config.AI_MODEL or "gpt-3.5-turbo"
+    )
+    _add(label, provider, str(model), usage, cost_of(str(model), usage, batch), latency)
+    return usage
+
+
+def record_image_usage(label: str, model: str, size: str, quality: str = "standard",
+                       latency: Optional[float] = None, count: int = 1):
+    """Ghi 1 lần sinh ảnh (tính tiền theo ảnh, không có token)"""
+    cost = IMAGE_PRICES.get((model, quality, size), 0.0) * count
+    _add(label, "openai", model, dict.fromkeys(USAGE_FIELDS, 0), cost, latency, images=count)
+
+
+def drain_usage_rows() -> List[Dict[str, Any]]:
+    """Lấy (và xóa khỏi buffer) các dòng usage đã ghi trong usage_context"""
+    with _stats_lock:
+        rows = list(_rows)
+        _rows.clear()
+    return rows
+
+
+def usage_stats() -> Dict[str, Dict[str, float]]:
+    with _stats_lock:
+        return {key: dict(item) for key, item in _stats.items()}
+
+
+def usage_totals() -> Dict[str, float]:
+    """Tổng chi phí / token (prompt + output) / request mọi call site từ lúc chạy process"""
+    stats = usage_stats().values()
+    return {
+        "cost": sum(item["cost"] for item in stats),
+        "tokens": sum(item["prompt_tokens"] + item["completion_tokens"] for item in stats),
+        "requests": sum(item["requests"] for item in stats),
+    }
+
+
+def average_cost(label: str) -> Optional[float]:
+    """Chi phí trung bình / request của call site (mọi provider), None nếu chưa có request"""
+    items = [item for key, item in usage_stats().items() if key.rsplit(" (", 1)[0] == label]
+    requests = sum(item["requests"] for item in items)
+    return sum(item["cost"] for item in items) / requests if requests else None
+
+
+def print_usage_stats():
+    """In token usage + tỉ lệ prompt token được cache + chi phí + latency theo call site"""
+    stats = usage_stats()
+    if not stats:
+        return
+    print("   💾 Token usage (prompt cache):")
+    for key, item in stats.items():
+        ratio = item["cached_tokens"] / item["prompt_tokens"] * 100 if item["prompt_tokens"] else 0.0
+        images = f" | {item['images']} ảnh" if item["images"] else ""
+        print(f"      {key}: {item['requests']} req | prompt {item['prompt_tokens']} "
+              f"(cached {item['cached_tokens']}, {ratio:.0f}%) | output {item['completion_tokens']}{images} | "
+              f"${item['cost']:.4f} | {item['latency'] / item['requests']:.1f}s/req")
+    print(f"      Tổng: ${sum(item['cost'] for item in stats.values()):.4f}")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BENCHMARK: WordPressPublisher (sync) vs AsyncWordPressPublisher
+Chạy với WP stub local, đo posts/phút ở các mức concurrency khác nhau
+
+Usage: python helpers/bench_wp_publisher.py [num_posts] [latency_s] [stub_workers]
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from config import Config
+from media_index import MediaIndex
+from module_async_wp_publisher import AsyncWordPressPublisher, publish_many
+from module_wp_publisher import WordPressPublisher
+from wp_stub_server import WPStubServer
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16]
+SAMPLE_IMAGE = b"\xff\xd8\xff" + b"0" * 200_000  # ~200KB "ảnh"
+
+
+def _sample_posts(num_posts: int):
+    return [
+        {
+            'content_data': {
+                'title': f'Benchmark post {i}',
+                'content': '<p>' + 'Lorem ipsum dolor sit amet. ' * 200 + '</p>',
+                'tags': ['benchmark', f'batch-{i % 5}'],
+                'category': 'Casino',
+            },
+            # Ảnh khác nhau từng bài: async không dedup media → sync cũng phải upload đủ mới so sánh được
+            'image_data': SAMPLE_IMAGE + i.to_bytes(4, 'big'),
+        }
+        for i in range(num_posts)
+    ]
+
+
+def bench_sync(server: WPStubServer, items) -> float:
+    media_index = MediaIndex(os.path.join(Config.CACHE_DIR, "media_index.sqlite3"))
+    publisher = WordPressPublisher(server.url, "bench", "bench", media_index=media_index)
+    start = time.time()
+    for item in items:
+        publisher.publish_complete_post(item['content_data'], item['image_data'])
+    return time.time() - start
+
+
+async def bench_async(server: WPStubServer, items, concurrency: int) -> float:
+    async with AsyncWordPressPublisher(server.url, "bench", "bench", max_concurrency=concurrency) as publisher:
+        start = time.time()
+        await publish_many(publisher, items)
+        return time.time() - start
+
+
+def main():
+    num_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    stub_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    # Cache taxonomy / publish index / media index riêng cho benchmark, không đụng cache thật
+    # (PUBLISH_INDEX_DB tính từ CACHE_DIR lúc import config → phải đặt lại)
+    Config.CACHE_DIR = tempfile.mkdtemp(prefix="wp_bench_")
+    Config.PUBLISH_INDEX_DB = os.path.join(Config.CACHE_DIR, "publish_index.sqlite3")
+    items = _sample_posts(num_posts)
+    results = []
+
+    # Tắt log từng bài của publisher để bảng kết quả dễ đọc
+    with WPStubServer(latency=latency, workers=stub_workers) as server, \
+            contextlib.redirect_stdout(io.StringIO()):
+        duration = bench_sync(server, items)
+        results.append(("sync (requests)", 1, duration))
+
+        for concurrency in CONCURRENCY_LEVELS:
+            duration = asyncio.run(bench_async(server, items, concurrency))
+            results.append(("async (httpx)", concurrency, duration))
+
+    print(f"\n📊 BENCHMARK: {num_posts} posts, latency {latency * 1000:.0f}ms, stub workers {stub_workers}")
+    print(f"{'Publisher':<18}{'Concurrency':>12}{'Time (s)':>10}{'Posts/min':>12}")
+    for name, concurrency, duration in results:
+        print(f"{name:<18}{concurrency:>12}{duration:>10.2f}{num_posts / duration * 60:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
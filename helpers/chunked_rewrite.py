@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CHUNKED REWRITE (map-reduce)
+Viết lại bài dài theo từng phần thay vì cắt bỏ phần đuôi
+
+- Map: chia nguồn thành các phần ≤ AI_CHUNK_TOKENS token (ranh giới đoạn văn/câu),
+  viết lại song song (AI_CHUNK_WORKERS); mỗi call vẫn đi qua retry + limiter AIMD của endpoint
+- Reduce: 1 call nhỏ sinh title/meta/tags... từ nội dung đã viết lại (cắt vừa token budget)
+- Cache theo phần (SQLite, key = hash prompt): phần lỗi được thử lại riêng, chạy lại bài
+  chỉ gọi AI cho các phần chưa có kết quả
+"""
+
+import contextvars
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import Config
+from token_budget import build_prompt, count_tokens, source_budget, split_text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS section_cache (
+    cache_key  TEXT PRIMARY KEY,
+    label      TEXT NOT NULL,
+    text       TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class SectionRewriteError(Exception):
+    """Còn phần chưa viết lại được sau khi thử lại (các phần đã xong nằm trong cache)"""
+
+
+class SectionCache:
+    """Kết quả viết lại theo phần: hash(label + model + system + prompt) → text"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = Path(db_path or Config.SECTION_CACHE_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+
+    @staticmethod
+    def key(label: str, model: str, system: str, prompt: str) -> str:
+        payload = "\x1f".join((label, model, system, prompt))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM section_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, cache_key: str, label: str, text: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO section_cache (cache_key, label, text, created_at) VALUES (?, ?, ?, ?)",
+                (cache_key, label, text, time.time()),
+            )
+
+
+_cache: Optional[SectionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_section_cache() -> SectionCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SectionCache()
+        return _cache
+
+
+def needs_chunking(make_prompt: Callable[[str], str], source: str, model: Optional[str] = None,
+                   max_tokens: int = 2000, system: str = "") -> bool:
+    """Nguồn không vừa 1 prompt (sẽ bị cắt) và chế độ chia phần đang bật"""
+    if not Config.AI_CHUNKED_REWRITE:
+        return False
+    return count_tokens(source, model) > source_budget(make_prompt, model, max_tokens, system)
+
+
+def map_reduce_rewrite(source: str,
+                       make_section_prompt: Callable[[str, int, int], str],
+                       make_merge_prompt: Callable[[str], str],
+                       complete: Callable[[str, int], str],
+                       model: Optional[str] = None, system: str = "",
+                       section_max_tokens: int = 2000, merge_max_tokens: int = 800,
+                       label: str = "rewrite",
+                       complete_merge: Optional[Callable[[str, int], str]] = None) -> Dict[str, Any]:
+    """
+    Viết lại nguồn theo phần rồi gộp metadata
+    Args:
+        make_section_prompt: (phần nguồn, số thứ tự từ 1, tổng số phần) → prompt viết lại phần đó
+        make_merge_prompt: nội dung đã viết lại (đã cắt vừa budget) → prompt sinh metadata
+        complete: (prompt, max_tokens) → text (vd. AIGateway.complete hoặc client của strategy)
+        complete_merge: riêng cho call gộp (vd. JSON mode + validate), mặc định = complete
+    Returns: {'content': nội dung ghép, 'sections': [...], 'merge_text': response call gộp,
+              'cached': số phần lấy từ cache}
+    Raises: SectionRewriteError nếu còn phần lỗi sau khi thử lại
+    """
+    model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+    budget = source_budget(lambda section: make_section_prompt(section, 1, 1), model, section_max_tokens, system)
+    sections = split_text(source, min(Config.AI_CHUNK_TOKENS, budget) or Config.AI_CHUNK_TOKENS, model)
+    total = len(sections)
+    prompts = [make_section_prompt(section, index + 1, total) for index, section in enumerate(sections)]
+
+    cache = get_section_cache()
+    keys = [SectionCache.key(label, model, system, prompt) for prompt in prompts]
+    results: List[Optional[str]] = [cache.get(key) for key in keys]
+    cached = sum(result is not None for result in results)
+
+    def rewrite(index: int) -> str:
+        text = (complete(prompts[index], section_max_tokens) or "").strip()
+        if not text:
+            raise ValueError(f"phần {index + 1}/{total}: AI trả về rỗng")
+        cache.put(keys[index], label, text)
+        return text
+
+    pending = [index for index, result in enumerate(results) if result is None]
+    errors: Dict[int, Exception] = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(Config.AI_CHUNK_WORKERS, len(pending))),
+                                thread_name_prefix="section") as executor:
+            # Mỗi phần chạy trong bản copy context của caller (giữ usage_context post/stage)
+            futures = {index: executor.submit(contextvars.copy_context().run, rewrite, index) for index in pending}
+            for index, future in futures.items():
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    errors[index] = e
+
+    # Phần lỗi → thử lại riêng từng phần (các phần khác đã có kết quả/cache)
+    retried = len(errors)
+    for index in list(errors):
+        print(f"🔁 [CHUNKED] {label}: thử lại phần {index + 1}/{total}")
+        try:
+            results[index] = rewrite(index)
+            del errors[index]
+        except Exception as e:
+            errors[index] = e
+
+    _record(label, total, cached, retried, len(errors))
+    if errors:
+        detail = "; ".join(f"phần {index + 1}: {str(error)[:100]}" for index, error in sorted(errors.items()))
+        raise SectionRewriteError(f"{len(errors)}/{total} phần viết lại lỗi ({detail})")
+
+    content = "\n\n".join(results)
+    merge_prompt, _ = build_prompt(make_merge_prompt, content, model, max_tokens=merge_max_tokens,
+                                   system=system, label=f"{label}.merge")
+    merge_text = (complete_merge or complete)(merge_prompt, merge_max_tokens)
+    return {"content": content, "sections": results, "merge_text": merge_text, "cached": cached}
+
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(label: str, sections: int, cached: int, retried: int, failed: int):
+    with _stats_lock:
+        stats = _stats.setdefault(label, {"articles": 0, "sections": 0, "cached": 0, "retried": 0, "failed": 0})
+        stats["articles"] += 1
+        stats["sections"] += sections
+        stats["cached"] += cached
+        stats["retried"] += retried
+        stats["failed"] += failed
+
+
+def print_chunk_stats():
+    """In số bài/phần viết lại theo phần (bỏ qua nếu không có bài nào phải chia)"""
+    with _stats_lock:
+        stats = {label: dict(item) for label, item in _stats.items()}
+    for label, item in stats.items():
+        print(f"   🧩 Chia phần {label}: {item['articles']} bài, {item['sections']} phần "
+              f"(cache {item['cached']}, thử lại {item['retried']}, lỗi {item['failed']})")
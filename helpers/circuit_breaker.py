@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CIRCUIT BREAKER
+Circuit breaker theo AI provider (openai, gemini)
+
+- CLOSED: gọi bình thường; CB_FAILURE_THRESHOLD lỗi liên tiếp (hoặc call chậm hơn CB_SLOW_CALL_SECONDS) → OPEN
+- OPEN: từ chối ngay (không tốn timeout) trong CB_OPEN_SECONDS → HALF_OPEN
+- HALF_OPEN: cho tối đa CB_HALF_OPEN_PROBES request thăm dò; thành công → CLOSED, lỗi → OPEN lại
+- Thống kê thời gian ở mỗi trạng thái, số lần mở, số request bị chặn
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import Config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+
+class CircuitOpenError(Exception):
+    """Provider đang bị ngắt (circuit OPEN) - caller nên chuyển provider khác"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit {name} đang mở")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Breaker cho 1 provider (thread-safe)"""
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, slow_call_seconds: Optional[float] = None,
+                 open_seconds: Optional[float] = None, half_open_probes: Optional[int] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.CB_FAILURE_THRESHOLD
+        self.slow_call_seconds = slow_call_seconds or Config.CB_SLOW_CALL_SECONDS
+        self.open_seconds = open_seconds or Config.CB_OPEN_SECONDS
+        self.half_open_probes = half_open_probes or Config.CB_HALF_OPEN_PROBES
+        self._state = CLOSED
+        self._state_since = time.monotonic()
+        self._failures = 0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "successes": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opens": 0,
+            "time_in_state": {state: 0.0 for state in STATES},
+        }
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _transition(self, state: str):
+        now = time.monotonic()
+        self.stats["time_in_state"][self._state] += now - self._state_since
+        self._state, self._state_since = state, now
+        self._failures = 0
+        self._probes = 0
+        if state == OPEN:
+            self.stats["opens"] += 1
+        print(f"⚡ [CIRCUIT] {self.name}: → {state.upper()}")
+
+    def _refresh(self):
+        if self._state == OPEN and time.monotonic() - self._state_since >= self.open_seconds:
+            self._transition(HALF_OPEN)
+
+    def allow(self) -> bool:
+        """True nếu được phép gọi provider (HALF_OPEN: chiếm 1 lượt thăm dò)"""
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self, latency: float):
+        """Call thành công; chậm hơn slow_call_seconds vẫn tính là lỗi"""
+        if latency > self.slow_call_seconds:
+            with self._lock:
+                self.stats["slow_calls"] += 1
+            self.record_failure()
+            return
+        with self._lock:
+            self.stats["successes"] += 1
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+            else:
+                self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            if self._state == HALF_OPEN:
+                self._transition(OPEN)
+                return
+            self._failures += 1
+            if self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def record_ignored(self):
+        """Lỗi không phải do provider (vd. 400 request sai) → trả lượt thăm dò, không đổi trạng thái"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            time_in_state = dict(self.stats["time_in_state"])
+            time_in_state[self._state] += time.monotonic() - self._state_since
+            return dict(self.stats, state=self._state, time_in_state=time_in_state)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Breaker dùng chung trong process theo provider"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def print_breaker_stats():
+    """In trạng thái + thời gian ở mỗi trạng thái theo provider"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    if not breakers:
+        return
+    print("   ⚡ Circuit breakers:")
+    for breaker in breakers:
+        stats = breaker.snapshot()
+        times = stats["time_in_state"]
+        print(f"      {breaker.name}: {stats['state'].upper()} | ✅ {stats['successes']} ❌ {stats['failures']} "
+              f"(🐢 {stats['slow_calls']} chậm) | mở {stats['opens']} lần, chặn {stats['rejected']} req | "
+              f"closed {times[CLOSED]:.0f}s / open {times[OPEN]:.0f}s / half-open {times[HALF_OPEN]:.0f}s")
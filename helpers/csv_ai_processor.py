@@ -9,7 +9,6 @@ Date: 2025-08-06
 """
 
 import csv
-import json
 import logging
 import os
 import sys
@@ -23,8 +22,15 @@ import pandas as pd
 from openai import OpenAI
 from tqdm import tqdm
 
+from ai_usage import print_usage_stats, record_usage
 # Import config để lấy API key
 from config import Config
+from json_output import REPAIR_SYSTEM, parse_structured, print_parse_stats, supports_json_mode
+from retry_policy import call_with_retry, print_retry_stats, record_fallback
+from token_budget import build_prompt, print_token_stats
+
+PARAPHRASE_SYSTEM = "Bạn là chuyên gia content marketing và SEO cho thị trường Philippines."
+CLASSIFY_SYSTEM = "Bạn là chuyên gia phân loại nội dung và SEO cho thị trường Philippines."
 
 
 class CSVAIProcessor:
@@ -68,7 +74,7 @@ class CSVAIProcessor:
     def setup_openai(self):
         """Thiết lập OpenAI API"""
         try:
-            self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
+            self.client = OpenAI(api_key=Config.OPENAI_API_KEY, max_retries=0, timeout=Config.AI_REQUEST_TIMEOUT)
 
             if not Config.OPENAI_API_KEY:
                 raise ValueError("OPENAI_API_KEY không được thiết lập trong config")
@@ -79,6 +85,43 @@ class CSVAIProcessor:
             self.logger.error(f"❌ Lỗi thiết lập OpenAI: {e}")
             sys.exit(1)
 
+    def _chat(self, prompt: str, system: str, max_tokens: int, temperature: float, label: str,
+              model: Optional[str] = None) -> str:
+        """1 lời gọi chat completion ở JSON mode (retry + limiter openai.chat), ghi token usage"""
+        model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+        extra = {"response_format": {"type": "json_object"}} if supports_json_mode("openai", model) else {}
+        start = time.monotonic()
+        response = call_with_retry(
+            "openai.chat",
+            lambda timeout: self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                **extra,
+            ),
+        )
+        record_usage(label, "openai", response, model=model, latency=time.monotonic() - start)
+        return (response.choices[0].message.content or "").strip()
+
+    def _chat_json(self, prompt: str, system: str, max_tokens: int, temperature: float, label: str,
+                   required: Tuple[str, ...]) -> Dict[str, Any]:
+        """
+        _chat + parse/validate field bắt buộc; response hỏng → 1 call sửa rẻ (AI_REPAIR_MODEL)
+        Raises: JSONOutputError
+        """
+        ai_response = self._chat(prompt, system, max_tokens, temperature, label)
+        return parse_structured(
+            ai_response, required,
+            repair=lambda repair_prompt: self._chat(repair_prompt, REPAIR_SYSTEM, max_tokens, 0,
+                                                    f"{label}.repair", model=Config.AI_REPAIR_MODEL),
+            model=Config.AI_MODEL or "gpt-3.5-turbo",
+        )
+
     def read_csv_file(self, csv_file_path: str) -> List[Dict[str, Any]]:
         """
         Bước 1: Đọc file posts.csv
@@ -124,70 +167,53 @@ class CSVAIProcessor:
             Dict chứa title và content mới
         """
         try:
-            # Prompt cho AI paraphrase
-            prompt = f"""
-            Bạn là chuyên gia content marketing và SEO cho thị trường Philippines. 
-            Hãy viết lại bài viết sau đây để:
+            # Prompt cho AI paraphrase (phần tĩnh trước → prefix được provider cache; dữ liệu bài sau cùng)
+            def make_prompt(source: str) -> str:
+                return f"""
+                Bạn là chuyên gia content marketing và SEO cho thị trường Philippines. 
+                Hãy viết lại bài viết ở cuối prompt để:
             
-            1. Tạo tiêu đề mới hoàn toàn khác nhưng giữ ý nghĩa (SEO-friendly cho Philippines)
-            2. Paraphrase toàn bộ nội dung với từ ngữ địa phương hóa cho Philippines
-            3. Tối ưu SEO và thu hút người đọc Philippines
-            4. Giữ nguyên cấu trúc và độ dài tương tự
-            5. Sử dụng từ khóa phù hợp với thị trường Philippines
+                1. Tạo tiêu đề mới hoàn toàn khác nhưng giữ ý nghĩa (SEO-friendly cho Philippines)
+                2. Paraphrase toàn bộ nội dung với từ ngữ địa phương hóa cho Philippines
+                3. Tối ưu SEO và thu hút người đọc Philippines
+                4. Giữ nguyên cấu trúc và độ dài tương tự
+                5. Sử dụng từ khóa phù hợp với thị trường Philippines
             
-            TIÊU ĐỀ GỐC: {title}
+                Yêu cầu output dạng JSON:
+                {{
+                    "new_title": "Tiêu đề mới SEO-friendly cho Philippines",
+                    "new_content": "Nội dung đã được paraphrase và localize",
+                    "notes": "Ghi chú về quá trình xử lý"
+                }}
             
-            NỘI DUNG GỐC:
-            {content[:3000]}...
+                TIÊU ĐỀ GỐC: {title}
             
-            Yêu cầu output dạng JSON:
-            {{
-                "new_title": "Tiêu đề mới SEO-friendly cho Philippines",
-                "new_content": "Nội dung đã được paraphrase và localize",
-                "notes": "Ghi chú về quá trình xử lý"
-            }}
-            """
-
-            response = self.client.chat.completions.create(
-                model=Config.AI_MODEL or "gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Bạn là chuyên gia content marketing và SEO cho thị trường Philippines.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=4000,
-                temperature=0.7,
+                NỘI DUNG GỐC:
+                {source}
+                """
+
+            prompt, _ = build_prompt(
+                make_prompt, content, Config.AI_MODEL,
+                max_tokens=4000, system=PARAPHRASE_SYSTEM, label="csv.paraphrase"
             )
 
-            ai_response = response.choices[0].message.content
-            if ai_response:
-                ai_response = ai_response.strip()
-            else:
-                ai_response = "{}"
-
-            # Parse JSON response
-            try:
-                result = json.loads(ai_response)
-            except json.JSONDecodeError:
-                # Fallback nếu AI không trả về JSON
-                result = {
-                    "new_title": title,
-                    "new_content": content,
-                    "notes": "AI response không đúng JSON format",
-                }
+            # JSON mode + validate; không ra JSON đủ field → exception → ai_fallback (không lưu nội dung gốc)
+            result = self._chat_json(
+                prompt, PARAPHRASE_SYSTEM, 4000, 0.7, "csv.paraphrase", required=("new_title", "new_content")
+            )
 
             self.logger.info(f"✅ Paraphrase thành công: {title[:50]}...")
             return result
 
         except Exception as e:
             self.logger.error(f"❌ Lỗi paraphrase với AI: {e}")
-            # Fallback
+            record_fallback("openai.chat")
+            # Fallback (ai_fallback → post bị tính lỗi, không ghi nội dung gốc ra posts_ready)
             return {
                 "new_title": title,
                 "new_content": content,
                 "notes": f"AI paraphrase failed: {str(e)}",
+                "ai_fallback": True,
             }
 
     def classify_content_with_ai(self, title: str, content: str) -> Dict[str, str]:
@@ -202,72 +228,52 @@ class CSVAIProcessor:
             Dict chứa category và keywords
         """
         try:
-            # Prompt cho AI phân loại
-            prompt = f"""
-            Bạn là chuyên gia phân loại nội dung và SEO cho thị trường Philippines.
-            Hãy phân tích bài viết sau và đưa ra:
+            # Prompt cho AI phân loại (phần tĩnh trước, dữ liệu bài sau cùng)
+            def make_prompt(source: str) -> str:
+                return f"""
+                Bạn là chuyên gia phân loại nội dung và SEO cho thị trường Philippines.
+                Hãy phân tích bài viết ở cuối prompt và đưa ra:
             
-            1. Category phù hợp (chọn 1 trong các category sau):
-               - Casino & Gaming
-               - Online Betting 
-               - Sports Betting
-               - Slot Games
-               - Live Casino
-               - Promotions & Bonuses
-               - Payment Methods
-               - Gaming Tips
-               - News & Updates
-               - Mobile Gaming
+                1. Category phù hợp (chọn 1 trong các category sau):
+                   - Casino & Gaming
+                   - Online Betting 
+                   - Sports Betting
+                   - Slot Games
+                   - Live Casino
+                   - Promotions & Bonuses
+                   - Payment Methods
+                   - Gaming Tips
+                   - News & Updates
+                   - Mobile Gaming
             
-            2. Keywords SEO (5-8 từ khóa chính, phù hợp với Philippines market)
+                2. Keywords SEO (5-8 từ khóa chính, phù hợp với Philippines market)
             
-            TIÊU ĐỀ: {title}
+                Yêu cầu output dạng JSON:
+                {{
+                    "category": "Category phù hợp nhất",
+                    "keywords": "keyword1, keyword2, keyword3, keyword4, keyword5",
+                    "notes": "Lý do phân loại"
+                }}
             
-            NỘI DUNG: {content[:2000]}...
+                TIÊU ĐỀ: {title}
             
-            Yêu cầu output dạng JSON:
-            {{
-                "category": "Category phù hợp nhất",
-                "keywords": "keyword1, keyword2, keyword3, keyword4, keyword5",
-                "notes": "Lý do phân loại"
-            }}
-            """
-
-            response = self.client.chat.completions.create(
-                model=Config.AI_MODEL or "gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Bạn là chuyên gia phân loại nội dung và SEO cho thị trường Philippines.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=1000,
-                temperature=0.3,  # Lower temperature cho consistent classification
+                NỘI DUNG: {source}
+                """
+
+            prompt, _ = build_prompt(
+                make_prompt, content, Config.AI_MODEL,
+                max_tokens=1000, system=CLASSIFY_SYSTEM, label="csv.classify"
             )
 
-            ai_response = response.choices[0].message.content
-            if ai_response:
-                ai_response = ai_response.strip()
-            else:
-                ai_response = "{}"
-
-            # Parse JSON response
-            try:
-                result = json.loads(ai_response)
-            except json.JSONDecodeError:
-                # Fallback classification
-                result = {
-                    "category": "Casino & Gaming",
-                    "keywords": "casino, gaming, philippines, online, bonus",
-                    "notes": "AI classification failed - used fallback",
-                }
+            # Lower temperature cho consistent classification; không ra JSON đủ field → fallback classification
+            result = self._chat_json(prompt, CLASSIFY_SYSTEM, 1000, 0.3, "csv.classify", required=("category",))
 
             self.logger.info(f"✅ Phân loại thành công: {result['category']}")
             return result
 
         except Exception as e:
             self.logger.error(f"❌ Lỗi phân loại với AI: {e}")
+            record_fallback("openai.chat")
             # Fallback
             return {
                 "category": "Casino & Gaming",
@@ -307,6 +313,8 @@ class CSVAIProcessor:
             paraphrase_result = self.paraphrase_content_with_ai(
                 original_title, original_content
             )
+            if paraphrase_result.get("ai_fallback"):
+                raise Exception(paraphrase_result["notes"])
 
             new_title = paraphrase_result.get("new_title", original_title)
             new_content = paraphrase_result.get("new_content", original_content)
@@ -473,6 +481,10 @@ class CSVAIProcessor:
         if self.stats["total_processed"] > 0:
             print(f"   Tốc độ: {duration/self.stats['total_processed']:.2f} giây/post")
         print(f"   Output file: {output_csv}")
+        print_retry_stats()
+        print_token_stats()
+        print_usage_stats()
+        print_parse_stats()
 
         return self.stats
 
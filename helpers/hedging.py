@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HEDGED REQUESTS
+Giảm tail latency: request chưa xong sau p90 quan sát được → gửi thêm 1 bản (cùng/khác provider)
+
+- Lấy response hợp lệ (validate) về trước; bản còn lại bị bỏ (request đã gửi đi không hủy được
+  giữa chừng → thread chạy nốt, kết quả bị bỏ qua, vẫn ghi latency để thống kê)
+- Chỉ hedge khi đã có đủ mẫu latency (HEDGE_MIN_SAMPLES) → biết p90 thật
+- Ngân sách: số hedge ≤ HEDGE_BUDGET × số request → chi phí tăng tối đa HEDGE_BUDGET
+- Báo cáo: p50/p90/p99 của request gốc (như khi không hedge) và latency thực tế sau hedge
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(round(len(ordered) * q)) - 1)] if ordered else 0.0
+
+
+def _start(func: Callable[[], Any], on_done: Optional[Callable[[float], None]] = None) -> Future:
+    """Chạy func trong thread daemon riêng, trả Future (on_done nhận latency khi thành công)"""
+    future: Future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        start = time.monotonic()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        if on_done:
+            on_done(time.monotonic() - start)
+        future.set_result(result)
+
+    # Copy context → call trong thread hedge vẫn ghi usage đúng post/stage (ai_usage.usage_context)
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), name="hedge", daemon=True).start()
+    return future
+
+
+class Hedger:
+    """Hedging cho 1 nhóm request (vd. chat completion của 1 provider)"""
+
+    def __init__(self, name: str, budget: Optional[float] = None, min_samples: Optional[int] = None,
+                 window: int = 500):
+        self.name = name
+        self.budget = Config.HEDGE_BUDGET if budget is None else budget
+        self.min_samples = min_samples or Config.HEDGE_MIN_SAMPLES
+        self.primary_latencies: deque = deque(maxlen=window)  # latency request gốc (= không hedge)
+        self.effective_latencies: deque = deque(maxlen=window)  # latency caller thực sự chờ
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "budget_skips": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """p90 latency request gốc; None nếu chưa đủ mẫu"""
+        with self._lock:
+            if len(self.primary_latencies) < self.min_samples:
+                return None
+            return percentile(self.primary_latencies, 0.9)
+
+    def _record_primary(self, latency: float):
+        with self._lock:
+            self.primary_latencies.append(latency)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.stats["hedges"] + 1 > self.budget * self.stats["requests"]:
+                self.stats["budget_skips"] += 1
+                return False
+            self.stats["hedges"] += 1
+            return True
+
+    def run(self, primary: Callable[[], Any], backup: Callable[[], Any],
+            validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Chạy primary; quá p90 thì chạy thêm backup; trả kết quả hợp lệ đầu tiên
+        Không có kết quả hợp lệ → trả kết quả đầu tiên có được, hoặc raise lỗi của primary
+        """
+        validate = validate or (lambda result: True)
+        start = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+
+        futures = {_start(primary, self._record_primary): "primary"}
+        delay = self.hedge_delay()
+        done, _ = wait(futures, timeout=delay) if delay is not None else (set(), None)
+
+        if not done and delay is not None and self._take_budget():
+            print(f"🪞 [HEDGE] {self.name}: quá p90 ({delay:.1f}s) → gửi thêm 1 request")
+            futures[_start(backup)] = "backup"
+
+        pending = set(futures)
+        first_result, first_error = None, None
+        has_result = False
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    if futures[future] == "primary" or first_error is None:
+                        first_error = future.exception()
+                    continue
+                result = future.result()
+                if validate(result):
+                    self._finish(start, futures[future] == "backup")
+                    return result
+                if not has_result:
+                    first_result, has_result = result, True
+
+        self._finish(start, False)
+        if has_result:
+            return first_result
+        raise first_error
+
+    def _finish(self, start: float, backup_won: bool):
+        with self._lock:
+            self.effective_latencies.append(time.monotonic() - start)
+            if backup_won:
+                self.stats["hedge_wins"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            primary, effective = list(self.primary_latencies), list(self.effective_latencies)
+            stats = dict(self.stats)
+        for label, values in (("before", primary), ("after", effective)):
+            stats[label] = {f"p{int(q * 100)}": percentile(values, q) for q in (0.5, 0.9, 0.99)}
+        return stats
+
+
+_hedgers: Dict[str, Hedger] = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(name: str) -> Hedger:
+    with _hedgers_lock:
+        if name not in _hedgers:
+            _hedgers[name] = Hedger(name)
+        return _hedgers[name]
+
+
+def print_hedge_stats():
+    """In số hedge + latency p50/p90/p99 trước (request gốc) / sau hedge"""
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    for hedger in hedgers:
+        stats = hedger.snapshot()
+        if not stats["requests"]:
+            continue
+        before, after = stats["before"], stats["after"]
+        print(f"   🪞 Hedging {hedger.name}: {stats['hedges']}/{stats['requests']} hedged "
+              f"({stats['hedges'] / stats['requests'] * 100:.0f}%, budget {hedger.budget * 100:.0f}%) | "
+              f"backup thắng {stats['hedge_wins']}")
+        print(f"      latency không hedge p50 {before['p50']:.1f}s p90 {before['p90']:.1f}s p99 {before['p99']:.1f}s → "
+              f"có hedge p50 {after['p50']:.1f}s p90 {after['p90']:.1f}s p99 {after['p99']:.1f}s")
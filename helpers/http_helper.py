@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP HELPER
+Session factory dùng chung cho WordPress và download ảnh
+
+- HTTPAdapter với connection pool theo số worker, keep-alive
+- urllib3 Retry + backoff cho 429/5xx, tôn trọng Retry-After (chỉ method idempotent)
+- Metrics theo host: số request, lỗi, retry, thời gian, số connection đã mở
+- ControlledHTTPAdapter: số request đồng thời mỗi host do bộ điều khiển AIMD quyết định
+"""
+
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from adaptive_concurrency import get_limiter
+from config import Config
+
+IDEMPOTENT_METHODS = frozenset(["HEAD", "GET", "PUT", "DELETE", "OPTIONS", "TRACE"])
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_metrics_lock = threading.Lock()
+_host_metrics: Dict[str, Dict[str, Any]] = {}
+_sessions_lock = threading.Lock()
+_shared_sessions: Dict[str, requests.Session] = {}
+_all_sessions = weakref.WeakSet()
+
+
+class ControlledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter chờ slot của limiter AIMD theo host trước khi gửi"""
+
+    def send(self, request, **kwargs):
+        limiter = get_limiter(f"http:{urlparse(request.url).netloc}")
+        limiter.acquire()
+        start = time.monotonic()
+        outcome = "ok"
+        try:
+            response = super().send(request, **kwargs)
+            if response.status_code in RETRY_STATUSES:
+                outcome = "overload"
+            return response
+        except (requests.Timeout, requests.ConnectionError):
+            outcome = "overload"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            limiter.release(time.monotonic() - start, outcome)
+
+
+def _build_retry(max_retries: int, backoff_factor: float) -> Retry:
+    """Retry policy: chỉ retry method idempotent, tôn trọng Retry-After"""
+    return Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _record_response(response: requests.Response, *args, **kwargs):
+    """Response hook: cập nhật metrics theo host"""
+    host = urlparse(response.url).netloc or "unknown"
+    retries = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+
+    with _metrics_lock:
+        stats = _host_metrics.setdefault(
+            host, {"requests": 0, "errors": 0, "retries": 0, "total_time": 0.0}
+        )
+        stats["requests"] += 1
+        stats["retries"] += len(retries)
+        stats["total_time"] += response.elapsed.total_seconds()
+        if response.status_code >= 400:
+            stats["errors"] += 1
+
+
+def create_session(
+    pool_size: Optional[int] = None,
+    max_retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+) -> requests.Session:
+    """
+    Tạo requests.Session có connection pool + retry
+
+    Args:
+        pool_size: Số connection giữ lại mỗi host (mặc định Config.HTTP_POOL_SIZE)
+        max_retries: Số lần retry tối đa cho 429/5xx/lỗi kết nối
+        backoff_factor: Hệ số backoff (0.5 → 0.5s, 1s, 2s, ...)
+    """
+    pool_size = pool_size or Config.HTTP_POOL_SIZE
+    retry = _build_retry(
+        Config.HTTP_MAX_RETRIES if max_retries is None else max_retries,
+        Config.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor,
+    )
+
+    adapter_class = ControlledHTTPAdapter if Config.ADAPTIVE_CONCURRENCY else HTTPAdapter
+    adapter = adapter_class(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    session.hooks["response"].append(_record_response)
+
+    _all_sessions.add(session)
+    return session
+
+
+def get_session(name: str = "default") -> requests.Session:
+    """
+    Session dùng chung theo tên (vd. "images" cho download ảnh)
+    Không gắn auth vào session dùng chung - truyền auth theo từng request
+    """
+    with _sessions_lock:
+        if name not in _shared_sessions:
+            _shared_sessions[name] = create_session()
+        return _shared_sessions[name]
+
+
+def get_connection_stats() -> Dict[str, Dict[str, Any]]:
+    """Metrics theo host, kèm số connection đã mở từ các connection pool"""
+    with _metrics_lock:
+        stats = {host: dict(values) for host, values in _host_metrics.items()}
+
+    for session in list(_all_sessions):
+        for adapter in session.adapters.values():
+            pools = getattr(adapter.poolmanager, "pools", None)
+            if pools is None:
+                continue
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = f"{pool.host}:{pool.port}" if pool.port not in (80, 443, None) else pool.host
+                entry = stats.setdefault(
+                    host, {"requests": 0, "errors": 0, "retries": 0, "total_time": 0.0}
+                )
+                entry["connections_opened"] = entry.get("connections_opened", 0) + pool.num_connections
+
+    for entry in stats.values():
+        entry["avg_time"] = entry["total_time"] / entry["requests"] if entry["requests"] else 0.0
+        entry.setdefault("connections_opened", 0)
+        # Connection reuse: bao nhiêu request trên mỗi connection mở mới
+        entry["reuse_ratio"] = (
+            entry["requests"] / entry["connections_opened"] if entry["connections_opened"] else 0.0
+        )
+
+    return stats
+
+
+def print_connection_stats():
+    """In metrics connection theo host"""
+    stats = get_connection_stats()
+    if not stats:
+        return
+
+    print("🌐 HTTP connections theo host:")
+    for host, entry in sorted(stats.items()):
+        print(
+            f"   - {host}: {entry['requests']} requests, {entry['connections_opened']} connections, "
+            f"{entry['retries']} retries, {entry['errors']} errors, avg {entry['avg_time']:.2f}s"
+        )
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IMAGE OPTIMIZER
+Resize + re-encode ảnh (WebP/JPEG) trước khi upload WordPress
+
+- Chạy trong ProcessPoolExecutor: encode tốn CPU không chiếm GIL của các thread I/O
+- Resize về IMAGE_MAX_WIDTH, encode IMAGE_FORMAT với IMAGE_QUALITY, bỏ metadata (EXIF, ICC, text chunks)
+- Thống kê: bytes tiết kiệm, thời gian encode, thời gian upload ước tính giảm được
+"""
+
+import io
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from config import Config
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "jpg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+
+def _encode(image_data: bytes, max_width: int, fmt: str, quality: int) -> Dict[str, Any]:
+    """Chạy trong process con: decode → resize → encode (không copy metadata)"""
+    start = time.time()
+    img = Image.open(io.BytesIO(image_data))
+    img.load()
+
+    pil_format, mime, ext = FORMATS[fmt]
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+    if pil_format == "JPEG" and has_alpha:
+        # JPEG không có alpha → nền trắng
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    if max_width and img.width > max_width:
+        height = round(img.height * max_width / img.width)
+        img = img.resize((max_width, height), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    if pil_format == "WEBP":
+        img.save(output, format=pil_format, quality=quality, method=4)
+    else:
+        img.save(output, format=pil_format, quality=quality, optimize=True, progressive=True)
+
+    return {
+        "data": output.getvalue(),
+        "mime": mime,
+        "ext": ext,
+        "width": img.width,
+        "height": img.height,
+        "encode_time": time.time() - start,
+    }
+
+
+def _encode_file(path: str, max_width: int, fmt: str, quality: int) -> Dict[str, Any]:
+    """Như _encode nhưng process con tự đọc file (process cha không giữ ảnh gốc)"""
+    with open(path, "rb") as f:
+        return _encode(f.read(), max_width, fmt, quality)
+
+
+class ImageOptimizer:
+    """Pool process encode ảnh + thống kê"""
+
+    def __init__(self, max_width: Optional[int] = None, fmt: Optional[str] = None,
+                 quality: Optional[int] = None, max_workers: Optional[int] = None):
+        self.max_width = max_width or Config.IMAGE_MAX_WIDTH
+        self.fmt = (fmt or Config.IMAGE_FORMAT).lower()
+        if self.fmt not in FORMATS:
+            raise ValueError(f"IMAGE_FORMAT không hỗ trợ: {self.fmt} (webp|jpeg)")
+        self.quality = quality or Config.IMAGE_QUALITY
+        self.max_workers = max_workers or Config.IMAGE_WORKERS or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "images": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0, "encode_time": 0.0,
+            "uploads": 0, "upload_bytes": 0, "upload_time": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def optimize(self, image_data: bytes, filename: str = "image") -> Dict[str, Any]:
+        """
+        Optimize 1 ảnh (block thread gọi, CPU chạy ở process con)
+        Returns: {'data', 'mime', 'filename', 'width', 'height'}; lỗi → ảnh gốc
+        """
+        base = os.path.splitext(filename)[0] or "image"
+        try:
+            future = self._get_executor().submit(_encode, image_data, self.max_width, self.fmt, self.quality)
+            result = future.result()
+        except Exception as e:
+            print(f"⚠️ [IMAGE OPTIMIZER] Giữ ảnh gốc ({filename}): {str(e)}")
+            with self._lock:
+                self.stats["failed"] += 1
+            return {"data": image_data, "mime": "image/jpeg", "filename": filename}
+
+        # Ảnh gốc đã nhỏ hơn bản encode lại → giữ nguyên bytes, chỉ đổi nếu có lợi
+        if len(result["data"]) >= len(image_data):
+            result["data"] = image_data
+            result["mime"], result["ext"] = self._sniff(image_data)
+
+        with self._lock:
+            self.stats["images"] += 1
+            self.stats["bytes_in"] += len(image_data)
+            self.stats["bytes_out"] += len(result["data"])
+            self.stats["encode_time"] += result["encode_time"]
+
+        result["filename"] = f"{base}.{result['ext']}"
+        return result
+
+    def optimize_file(self, path: str, filename: str = "image") -> Dict[str, Any]:
+        """
+        Optimize ảnh trong spool, ghi kết quả vào spool
+        Returns: {'path', 'mime', 'filename'}; lỗi hoặc không nhỏ hơn → file gốc
+        """
+        from image_spool import get_spool
+
+        spool = get_spool()
+        base = os.path.splitext(filename)[0] or "image"
+        original_size = os.path.getsize(path)
+        original = {"path": path, "mime": spool.mime_type(path), "filename": f"{base}{Path(path).suffix}"}
+
+        try:
+            future = self._get_executor().submit(_encode_file, path, self.max_width, self.fmt, self.quality)
+            result = future.result()
+        except Exception as e:
+            print(f"⚠️ [IMAGE OPTIMIZER] Giữ ảnh gốc ({filename}): {str(e)}")
+            with self._lock:
+                self.stats["failed"] += 1
+            return original
+
+        optimized_size = min(len(result["data"]), original_size)
+        with self._lock:
+            self.stats["images"] += 1
+            self.stats["bytes_in"] += original_size
+            self.stats["bytes_out"] += optimized_size
+            self.stats["encode_time"] += result["encode_time"]
+
+        if len(result["data"]) >= original_size:
+            return original
+        return {
+            "path": spool.put(result["data"], result["ext"]),
+            "mime": result["mime"],
+            "filename": f"{base}.{result['ext']}",
+        }
+
+    @staticmethod
+    def _sniff(image_data: bytes):
+        if image_data[:8] == b"\x89PNG\r\n\x1a\n":
+            return "image/png", "png"
+        if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+            return "image/webp", "webp"
+        return "image/jpeg", "jpg"
+
+    def record_upload(self, num_bytes: int, seconds: float):
+        """Ghi thời gian upload thực tế (để ước tính thời gian tiết kiệm)"""
+        with self._lock:
+            self.stats["uploads"] += 1
+            self.stats["upload_bytes"] += num_bytes
+            self.stats["upload_time"] += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        saved = stats["bytes_in"] - stats["bytes_out"]
+        throughput = stats["upload_bytes"] / stats["upload_time"] if stats["upload_time"] else 0
+        stats["bytes_saved"] = saved
+        stats["saved_ratio"] = saved / stats["bytes_in"] if stats["bytes_in"] else 0
+        # Thời gian upload giảm ≈ bytes tiết kiệm / throughput upload đo được
+        stats["upload_time_saved"] = saved / throughput if throughput else 0
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_optimizer: Optional[ImageOptimizer] = None
+_optimizer_lock = threading.Lock()
+
+
+def get_optimizer() -> Optional[ImageOptimizer]:
+    """Optimizer dùng chung trong process (None nếu IMAGE_OPTIMIZE=false)"""
+    global _optimizer
+    if not Config.IMAGE_OPTIMIZE:
+        return None
+    with _optimizer_lock:
+        if _optimizer is None:
+            _optimizer = ImageOptimizer()
+        return _optimizer
+
+
+def print_image_stats():
+    """In thống kê optimize ảnh (bỏ qua nếu chưa xử lý ảnh nào)"""
+    if _optimizer is None:
+        return
+    stats = _optimizer.summary()
+    if not stats["images"]:
+        return
+    mb = 1024 * 1024
+    print(f"   🖼️ Ảnh: {stats['images']} optimized ({_optimizer.fmt}, q{_optimizer.quality}, "
+          f"≤{_optimizer.max_width}px) | {stats['bytes_in'] / mb:.1f} MB → {stats['bytes_out'] / mb:.1f} MB "
+          f"(-{stats['saved_ratio'] * 100:.0f}%) | encode {stats['encode_time']:.1f}s | "
+          f"upload giảm ~{stats['upload_time_saved']:.1f}s")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IMAGE SPOOL
+Thư mục tạm (content-addressed) cho ảnh AI trước khi upload WordPress
+
+- Download stream theo chunk thẳng xuống file, tính SHA-256 trong lúc ghi → không giữ cả ảnh trong RAM
+- File đặt tên theo SHA-256 (<sha256>.<ext>); URL → file được ghi lại để retry/site khác
+  dùng lại file, không download lại (URL DALL-E chỉ sống ~1 giờ)
+- Uploader mở file handle và stream body từ disk
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import Config
+from http_helper import get_session
+
+CHUNK_SIZE = 64 * 1024
+EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+MIME_TYPES = {ext: mime for mime, ext in EXTENSIONS.items()}
+
+
+class ImageSpool:
+    """Spool ảnh trên disk, key theo SHA-256 nội dung"""
+
+    def __init__(self, spool_dir: Optional[str] = None, ttl: Optional[int] = None):
+        self.spool_dir = Path(spool_dir or Config.IMAGE_SPOOL_DIR)
+        self.url_dir = self.spool_dir / "urls"
+        self.url_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = Config.IMAGE_SPOOL_TTL if ttl is None else ttl
+        self.stats = {"downloads": 0, "reused": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def digest(path: str) -> str:
+        """SHA-256 của file spool = tên file"""
+        return Path(path).stem
+
+    @staticmethod
+    def mime_type(path: str) -> str:
+        return MIME_TYPES.get(Path(path).suffix.lstrip(".").lower(), "image/jpeg")
+
+    def _url_key(self, url: str) -> Path:
+        # Key theo URL đầy đủ (query chứa chữ ký, mỗi ảnh DALL-E có URL riêng)
+        return self.url_dir / hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _lookup(self, url: str) -> Optional[str]:
+        try:
+            name = self._url_key(url).read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+        path = self.spool_dir / name
+        return str(path) if path.exists() else None
+
+    def fetch(self, url: str) -> Optional[str]:
+        """
+        Download ảnh về spool (1 lần cho mỗi URL)
+        Returns: đường dẫn file hoặc None nếu lỗi
+        """
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        with url_lock:
+            cached = self._lookup(url)
+            if cached:
+                with self._lock:
+                    self.stats["reused"] += 1
+                return cached
+
+            try:
+                with get_session("images").get(url, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+                    ext = EXTENSIONS.get(content_type, "png")
+                    path, size = self._write_stream(response.iter_content(CHUNK_SIZE), ext)
+            except Exception as e:
+                print(f"❌ [IMAGE SPOOL] Lỗi download ảnh: {str(e)}")
+                return None
+
+            self._write_atomic(self._url_key(url), Path(path).name)
+            with self._lock:
+                self.stats["downloads"] += 1
+                self.stats["bytes"] += size
+            return path
+
+    def put(self, data: bytes, ext: str) -> str:
+        """Ghi bytes có sẵn vào spool (vd. ảnh đã optimize)"""
+        path, _ = self._write_stream([data], ext)
+        return path
+
+    def _write_stream(self, chunks, ext: str):
+        """Ghi chunks ra file tạm, hash trong lúc ghi, rồi rename thành <sha256>.<ext>"""
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        sha.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            final_path = self.spool_dir / f"{sha.hexdigest()}.{ext}"
+            if final_path.exists():
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, final_path)
+            return str(final_path), size
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _write_atomic(path: Path, text: str):
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def cleanup(self, max_age: Optional[int] = None) -> int:
+        """Xóa file spool cũ hơn max_age giây (mặc định IMAGE_SPOOL_TTL)"""
+        cutoff = time.time() - (self.ttl if max_age is None else max_age)
+        removed = 0
+        for path in list(self.spool_dir.iterdir()) + list(self.url_dir.iterdir()):
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+_spool: Optional[ImageSpool] = None
+_spool_lock = threading.Lock()
+
+
+def get_spool() -> ImageSpool:
+    """Spool dùng chung trong process"""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = ImageSpool()
+            _spool.cleanup()
+        return _spool
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON OUTPUT
+Parse + validate JSON do AI trả về, dùng chung cho mọi call site
+
+- JSON mode của provider (OpenAI response_format json_object, Gemini response_mime_type) khi model hỗ trợ
+- Parser chịu lỗi: bỏ ```json fence (kể cả fence không đóng), lấy khối {...}, bỏ dấu phẩy thừa,
+  đóng chuỗi/ngoặc của response bị cắt giữa chừng (max_tokens)
+- Validate field bắt buộc theo call site; thiếu field / không parse được → 1 call sửa rẻ
+  (AI_REPAIR_MODEL, temperature 0) thay vì lưu text thô với meta giả
+- Đếm theo model: parse thẳng / sửa local / gọi sửa / thất bại
+"""
+
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+
+FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+OPEN_FENCE = re.compile(r"^\s*```(?:json|JSON)?\s*")
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+# Tiền tố model hỗ trợ JSON mode
+OPENAI_JSON_MODELS = ("gpt-4o", "gpt-4.1", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo", "o1", "o3", "o4")
+OPENAI_NO_JSON_MODELS = ("gpt-3.5-turbo-0613", "gpt-3.5-turbo-0301", "gpt-3.5-turbo-16k-0613", "gpt-3.5-turbo-instruct")
+GEMINI_JSON_MODELS = ("gemini-1.5", "gemini-2")
+
+REPAIR_SYSTEM = "You fix malformed JSON. Reply with one valid JSON object only."
+
+
+class JSONOutputError(ValueError):
+    """Response không thành JSON hợp lệ đủ field (kể cả sau khi gọi sửa)"""
+
+
+def supports_json_mode(provider: str, model: Optional[str]) -> bool:
+    if not Config.AI_JSON_MODE:
+        return False
+    model = model or ""
+    if provider == "gemini":
+        return model.startswith(GEMINI_JSON_MODELS)
+    return model.startswith(OPENAI_JSON_MODELS) and not model.startswith(OPENAI_NO_JSON_MODELS)
+
+
+def _close_truncated(text: str) -> str:
+    """Đóng chuỗi + ngoặc còn mở của JSON bị cắt"""
+    stack, in_string, escaped = [], False, False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    if escaped:
+        text = text[:-1]
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    elif text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack))
+
+
+def _loads(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(text, strict=False)  # strict=False: cho phép xuống dòng thật trong chuỗi
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _parse(text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Returns: (dict | None, cách parse: direct | cleaned | repaired | failed)"""
+    if not text or not text.strip():
+        return None, "failed"
+    data = _loads(text)
+    if data is not None:
+        return data, "direct"
+
+    fenced = FENCE.search(text)
+    cleaned = fenced.group(1) if fenced else OPEN_FENCE.sub("", text)
+    start = cleaned.find("{")
+    if start < 0:
+        return None, "failed"
+    end = cleaned.rfind("}")
+    if end > start:
+        data = _loads(cleaned[start:end + 1])
+        if data is not None:
+            return data, "cleaned"
+
+    # Sửa local: dấu phẩy thừa, response bị cắt → đóng chuỗi/ngoặc, lùi dần tới dấu phẩy trước
+    candidate = TRAILING_COMMA.sub(r"\1", cleaned[start:])
+    for _ in range(20):
+        data = _loads(_close_truncated(candidate))
+        if data is not None:
+            return data, "repaired"
+        cut = candidate.rfind(",")
+        if cut <= 0:
+            break
+        candidate = candidate[:cut]
+    return None, "failed"
+
+
+def parse_json(text: str) -> Optional[Dict[str, Any]]:
+    """Parse JSON object từ response AI (chịu fence, dấu phẩy thừa, response bị cắt); None nếu không được"""
+    return _parse(text)[0]
+
+
+def missing_fields(data: Dict[str, Any], required: Iterable[str]) -> List[str]:
+    return [field for field in required if data.get(field) in (None, "")]
+
+
+def repair_prompt(text: str, required: Iterable[str]) -> str:
+    fields = ", ".join(f'"{field}"' for field in required)
+    return (f"The text below should be one JSON object with the fields {fields}.\n"
+            f"Return it as valid JSON. Keep every existing value unchanged; if a required field is missing, "
+            f"write it from the other fields. No markdown, no explanations.\n\nTEXT:\n{text}")
+
+
+def parse_structured(text: str, required: Iterable[str] = (), repair: Optional[Callable[[str], str]] = None,
+                     model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parse + validate field bắt buộc; lỗi → gọi repair(prompt) 1 lần (nếu có)
+    Args:
+        repair: prompt sửa → text (call rẻ của call site)
+        model: model sinh ra response (cho thống kê)
+    Raises: JSONOutputError
+    """
+    required = list(required)
+    model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+    data, how = _parse(text)
+    missing = missing_fields(data, required) if data is not None else required
+    if data is not None and not missing:
+        _record(model, how)
+        return data
+
+    problem = f"thiếu field {', '.join(missing)}" if data is not None else "không parse được JSON"
+    if repair is None or not Config.AI_JSON_REPAIR:
+        _record(model, "failed", missing=data is not None)
+        raise JSONOutputError(f"AI response {problem}")
+
+    print(f"🩹 [JSON] {model}: {problem} → gọi sửa")
+    try:
+        repaired, _ = _parse(repair(repair_prompt(text, required)))
+    except Exception as e:
+        repaired = None
+        problem += f" (sửa lỗi: {str(e)[:100]})"
+    if repaired is not None and data is not None:
+        repaired = {**data, **{key: value for key, value in repaired.items() if value not in (None, "")}}
+    if repaired is not None and not missing_fields(repaired, required):
+        _record(model, "repair_call")
+        return repaired
+
+    _record(model, "failed", repair_call=True, missing=data is not None)
+    raise JSONOutputError(f"AI response {problem}, gọi sửa không thành công")
+
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(model: str, how: str, repair_call: bool = False, missing: bool = False):
+    with _stats_lock:
+        stats = _stats.setdefault(model, {"responses": 0, "direct": 0, "cleaned": 0, "repaired": 0,
+                                          "repair_call": 0, "repair_calls": 0, "failed": 0, "missing": 0})
+        stats["responses"] += 1
+        stats[how] += 1
+        stats["repair_calls"] += int(repair_call or how == "repair_call")
+        stats["missing"] += int(missing)
+
+
+def print_parse_stats():
+    """In số response parse được/phải sửa/thất bại theo model"""
+    with _stats_lock:
+        stats = {model: dict(item) for model, item in _stats.items()}
+    for model, item in stats.items():
+        print(f"   🧾 JSON {model}: {item['responses']} response | ✅ {item['direct']} thẳng, "
+              f"{item['cleaned']} bỏ fence, {item['repaired']} sửa local | 🩹 {item['repair_calls']} call sửa "
+              f"({item['repair_call']} thành công) | ❌ {item['failed']} lỗi parse ({item['missing']} thiếu field)")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MEDIA INDEX
+Index local (SQLite, cùng file với publish index): site + SHA-256 của bytes ảnh → media id đã upload
+
+- Cùng 1 ảnh (kết quả DALL-E lặp lại, ảnh stock fallback dùng lại) chỉ upload 1 lần mỗi site
+- Verify lazy: entry cũ hơn MEDIA_VERIFY_TTL thì GET media/{id} trước khi dùng lại;
+  media đã bị xóa trên site → xóa entry và upload lại
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_index (
+    site        TEXT    NOT NULL,
+    sha256      TEXT    NOT NULL,
+    media_id    INTEGER NOT NULL,
+    source_url  TEXT,
+    verified_at REAL    NOT NULL,
+    PRIMARY KEY (site, sha256)
+)
+"""
+
+
+def image_hash(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+class MediaIndex:
+    """Mapping (site, sha256) → media id"""
+
+    def __init__(self, db_path: Optional[str] = None, verify_ttl: Optional[int] = None):
+        self.db_path = Path(db_path or Config.PUBLISH_INDEX_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.verify_ttl = Config.MEDIA_VERIFY_TTL if verify_ttl is None else verify_ttl
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "bytes_saved": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+
+    @staticmethod
+    def site_key(site_url: str) -> str:
+        return site_url.rstrip("/").lower()
+
+    def find(self, site: str, digest: str, size: int = 0,
+             verify: Optional[Callable[[int], Optional[Dict[str, Any]]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Tìm media đã upload cho ảnh này
+        verify(media_id) → JSON media nếu còn tồn tại, None nếu đã bị xóa
+        verify lỗi (timeout, 5xx) → coi như miss, giữ entry: caller upload lại thay vì publish thiếu ảnh
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM media_index WHERE site = ? AND sha256 = ?",
+                (self.site_key(site), digest),
+            ).fetchone()
+
+        if not row:
+            self._count(misses=1)
+            return None
+
+        entry = dict(row)
+        if verify and time.time() - entry["verified_at"] > self.verify_ttl:
+            try:
+                media = verify(entry["media_id"])
+            except Exception as e:
+                print(f"⚠️ [MEDIA INDEX] Không verify được media {entry['media_id']}: {str(e)} → upload lại")
+                self._count(misses=1)
+                return None
+            if not media:
+                self._count(stale=1)
+                self.forget(site, digest)
+                return None
+            self.record(site, digest, entry["media_id"], media.get("source_url") or entry["source_url"])
+
+        self._count(hits=1, bytes_saved=size)
+        return entry
+
+    def _count(self, **deltas: int):
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def record(self, site: str, digest: str, media_id: int, source_url: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO media_index (site, sha256, media_id, source_url, verified_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (site, sha256) DO UPDATE SET
+                    media_id = excluded.media_id,
+                    source_url = excluded.source_url,
+                    verified_at = excluded.verified_at
+                """,
+                (self.site_key(site), digest, media_id, source_url, time.time()),
+            )
+
+    def forget(self, site: str, digest: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM media_index WHERE site = ? AND sha256 = ?",
+                (self.site_key(site), digest),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
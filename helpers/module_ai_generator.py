@@ -7,10 +7,26 @@ Chỉ xử lý việc tạo nội dung bằng AI
 
 import openai
 import google.generativeai as genai
-import requests
 import time
 from typing import Dict, Optional, Any
-import json
+
+from config import Config
+from http_helper import get_session
+from retry_policy import call_with_retry, record_fallback
+from ai_gateway import ENDPOINTS, AIGateway, normalize_fields
+from image_spool import get_spool
+
+# Bộ field chung cho output của cả OpenAI và Gemini
+CONTENT_FIELDS = {
+    'title': '',
+    'content': '',
+    'meta_title': '',
+    'meta_desc': '',
+    'tags': [],
+    'excerpt': ''
+}
+# Field bắt buộc: thiếu sau cả call sửa → ai_fallback (orchestrator đánh lỗi task, không publish)
+REQUIRED_FIELDS = ('title', 'content', 'meta_title', 'meta_desc')
 
 class AIContentGenerator:
     """Module độc lập tạo nội dung AI"""
@@ -20,17 +36,23 @@ class AIContentGenerator:
         self.gemini_key = gemini_key
         self.openai_client = None
         self.gemini_model = None
+        self.gateway = None
         self._setup_ai_clients()
     
     def _setup_ai_clients(self):
         """Thiết lập clients AI"""
         try:
             # Setup OpenAI
-            self.openai_client = openai.OpenAI(api_key=self.openai_key)
+            self.openai_client = openai.OpenAI(
+                api_key=self.openai_key, max_retries=0, timeout=Config.AI_REQUEST_TIMEOUT
+            )
             
             # Setup Gemini
             genai.configure(api_key=self.gemini_key)
-            self.gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+            self.gemini_model = genai.GenerativeModel(Config.GEMINI_MODEL)
+            
+            # Gateway: OpenAI trước, Gemini khi OpenAI lỗi / circuit mở
+            self.gateway = AIGateway(openai_client=self.openai_client, gemini_model=self.gemini_model)
             
             print("✅ [AI GENERATOR] Đã setup AI clients!")
             
@@ -41,13 +63,14 @@ class AIContentGenerator:
     def generate_content(self, prompt: str, use_gemini_backup: bool = False) -> Dict[str, Any]:
         """
         Tạo nội dung từ prompt
-        Returns: {title, content, meta_title, meta_desc, tags, excerpt}
+        use_gemini_backup: ưu tiên Gemini (vẫn chuyển sang OpenAI nếu Gemini lỗi)
+        Returns: {title, content, meta_title, meta_desc, tags, excerpt, provider}
         """
+        provider = 'gemini' if use_gemini_backup else 'openai'
         try:
+            # Hướng dẫn + JSON schema cố định trước → prefix được provider cache; yêu cầu bài viết sau cùng
             enhanced_prompt = f"""
-            Bạn là một chuyên gia viết content tiếng Việt. Tạo một bài viết blog chất lượng cao từ yêu cầu sau:
-            
-            YÊU CẦU: {prompt}
+            Bạn là một chuyên gia viết content tiếng Việt. Tạo một bài viết blog chất lượng cao từ yêu cầu ở cuối prompt.
             
             Hãy trả về JSON với format chính xác sau:
             {{
@@ -64,82 +87,31 @@ class AIContentGenerator:
             - Sử dụng HTML tags: <h2>, <h3>, <p>, <strong>, <ul>, <li>
             - Keyword tự nhiên, không spam
             - Phong cách gần gũi người Việt
-            """
             
-            # Thử OpenAI trước
-            if not use_gemini_backup:
-                try:
-                    return self._generate_with_openai(enhanced_prompt)
-                except Exception as e:
-                    print(f"⚠️ [AI GENERATOR] OpenAI failed: {str(e)}, switching to Gemini...")
-                    use_gemini_backup = True
+            YÊU CẦU: {prompt}
+            """
             
-            # Fallback hoặc chọn Gemini
-            if use_gemini_backup:
-                return self._generate_with_gemini(enhanced_prompt)
-                
+            response = self.gateway.complete_json(
+                enhanced_prompt,
+                REQUIRED_FIELDS,
+                system="Bạn là chuyên gia viết content tiếng Việt chuyên nghiệp.",
+                max_tokens=2000,
+                temperature=0.7,
+                model="gpt-3.5-turbo",
+                provider=provider,
+                label="ai_generator"
+            )
+            print(f"✅ [AI GENERATOR] {response['provider']} content generated successfully!")
+            result = normalize_fields(response['data'], CONTENT_FIELDS)
+            result['provider'] = response['provider']
+            return result
+        
         except Exception as e:
+            # Gồm cả JSONOutputError (output không thành JSON đủ field): không dựng bài từ text thô
             print(f"❌ [AI GENERATOR] Lỗi tạo content: {str(e)}")
+            record_fallback(ENDPOINTS[provider])
             return self._get_fallback_content(prompt)
     
-    def _generate_with_openai(self, prompt: str) -> Dict[str, Any]:
-        """Tạo content với OpenAI"""
-        response = self.openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Bạn là chuyên gia viết content tiếng Việt chuyên nghiệp."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        
-        content_text = response.choices[0].message.content.strip()
-        
-        # Parse JSON
-        try:
-            if content_text.startswith('```json'):
-                content_text = content_text.replace('```json', '').replace('```', '').strip()
-            
-            content_data = json.loads(content_text)
-            print("✅ [AI GENERATOR] OpenAI content generated successfully!")
-            return content_data
-            
-        except json.JSONDecodeError:
-            print("⚠️ [AI GENERATOR] JSON parse failed, using raw content")
-            return self._parse_raw_content(content_text)
-    
-    def _generate_with_gemini(self, prompt: str) -> Dict[str, Any]:
-        """Tạo content với Gemini"""
-        response = self.gemini_model.generate_content(prompt)
-        content_text = response.text.strip()
-        
-        # Parse JSON
-        try:
-            if content_text.startswith('```json'):
-                content_text = content_text.replace('```json', '').replace('```', '').strip()
-            
-            content_data = json.loads(content_text)
-            print("✅ [AI GENERATOR] Gemini content generated successfully!")
-            return content_data
-            
-        except json.JSONDecodeError:
-            print("⚠️ [AI GENERATOR] JSON parse failed, using raw content")
-            return self._parse_raw_content(content_text)
-    
-    def _parse_raw_content(self, raw_text: str) -> Dict[str, Any]:
-        """Parse raw content khi JSON fail"""
-        lines = raw_text.split('\n')
-        
-        return {
-            'title': lines[0][:80] if lines else 'Tiêu đề mặc định',
-            'content': raw_text,
-            'meta_title': lines[0][:60] if lines else 'SEO Title',
-            'meta_desc': lines[1][:160] if len(lines) > 1 else 'SEO Description',
-            'tags': ['ai', 'content', 'blog'],
-            'excerpt': lines[1][:150] if len(lines) > 1 else 'Tóm tắt bài viết'
-        }
-    
     def _get_fallback_content(self, prompt: str) -> Dict[str, Any]:
         """Content dự phòng khi AI fail"""
         return {
@@ -148,7 +120,8 @@ class AIContentGenerator:
             'meta_title': f'SEO: {prompt[:50]}',
             'meta_desc': f'Bài viết chuyên sâu về {prompt[:100]}...',
             'tags': ['blog', 'content'],
-            'excerpt': f'Tóm tắt về {prompt[:100]}...'
+            'excerpt': f'Tóm tắt về {prompt[:100]}...',
+            'ai_fallback': True
         }
     
     def generate_image(self, title: str, style: str = "professional") -> Optional[str]:
@@ -165,12 +138,16 @@ class AIContentGenerator:
             Colors: professional, eye-catching but not overwhelming
             """
             
-            response = self.openai_client.images.generate(
-                model="dall-e-3",
-                prompt=image_prompt,
-                size="1792x1024",
-                quality="standard",
-                n=1
+            response = call_with_retry(
+                "openai.images",
+                lambda timeout: self.openai_client.images.generate(
+                    model="dall-e-3",
+                    prompt=image_prompt,
+                    size="1792x1024",
+                    quality="standard",
+                    n=1,
+                    timeout=timeout
+                ),
             )
             
             image_url = response.data[0].url
@@ -184,7 +161,7 @@ class AIContentGenerator:
     def download_image(self, image_url: str, filename: str) -> Optional[bytes]:
         """Download ảnh từ URL"""
         try:
-            response = requests.get(image_url, timeout=30)
+            response = get_session("images").get(image_url, timeout=30)
             response.raise_for_status()
             
             print(f"✅ [AI GENERATOR] Downloaded image: {filename}")
@@ -193,6 +170,13 @@ class AIContentGenerator:
         except Exception as e:
             print(f"❌ [AI GENERATOR] Lỗi download ảnh: {str(e)}")
             return None
+    
+    def download_image_to_spool(self, image_url: str, filename: str) -> Optional[str]:
+        """Download ảnh (stream) vào spool trên disk, trả về đường dẫn file"""
+        image_path = get_spool().fetch(image_url)
+        if image_path:
+            print(f"✅ [AI GENERATOR] Downloaded image: {filename} → {image_path}")
+        return image_path
 
 # Test module
 if __name__ == "__main__":
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MODULE 3B: ASYNC WORDPRESS PUBLISHER
+Bản async của WordPressPublisher (httpx.AsyncClient)
+Cùng API: upload_image, create_post, publish_complete_post, update_post
+Giới hạn số request đồng thời mỗi site bằng semaphore (tránh quá tải shared hosting)
+"""
+
+import asyncio
+import base64
+import importlib.util
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from config import Config
+from wp_taxonomy_cache import WPTaxonomyCache
+
+# HTTP/2 chỉ bật được khi có package h2 (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class AsyncWordPressPublisher:
+    """Publisher async, mỗi instance ứng với 1 site"""
+
+    def __init__(self, wp_url: str, username: str, password: str,
+                 max_concurrency: Optional[int] = None, http2: Optional[bool] = None):
+        self.wp_url = wp_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.api_url = f"{self.wp_url}/wp-json/wp/v2/"
+        self.auth_header = self._create_auth_header()
+        self.max_concurrency = max_concurrency or Config.WP_MAX_CONCURRENCY
+        self.http2 = HTTP2_AVAILABLE if http2 is None else (http2 and HTTP2_AVAILABLE)
+
+        self.client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._term_lock: Optional[asyncio.Lock] = None
+        self.taxonomy = WPTaxonomyCache(
+            self.wp_url,
+            self.api_url,
+            headers={"Authorization": self.auth_header}
+        )
+
+    def _create_auth_header(self) -> str:
+        """Tạo Basic Auth header"""
+        credentials = f"{self.username}:{self.password}"
+        encoded_credentials = base64.b64encode(credentials.encode()).decode()
+        return f"Basic {encoded_credentials}"
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def start(self):
+        """Mở AsyncClient, test kết nối và preload taxonomy"""
+        if self.client is not None:
+            return
+
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": self.auth_header},
+            http2=self.http2,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            )
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._term_lock = asyncio.Lock()
+
+        await self._test_connection()
+
+        try:
+            if not self.taxonomy.load_cached():
+                await self._preload_taxonomy()
+        except Exception as e:
+            print(f"⚠️ [ASYNC WP PUBLISHER] Taxonomy preload error: {str(e)}")
+
+    async def aclose(self):
+        """Đóng AsyncClient"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Gửi request qua semaphore của site"""
+        if self.client is None:
+            await self.start()
+
+        async with self._semaphore:
+            return await self.client.request(method, f"{self.api_url}{path}", **kwargs)
+
+    async def _test_connection(self):
+        """Test kết nối WordPress"""
+        try:
+            response = await self._request("GET", "users/me", timeout=10)
+
+            if response.status_code == 200:
+                user_data = response.json()
+                protocol = response.http_version
+                print(f"✅ [ASYNC WP PUBLISHER] Connected as: {user_data.get('name', 'Unknown')} ({protocol})")
+            else:
+                print(f"❌ [ASYNC WP PUBLISHER] Auth failed: {response.status_code}")
+
+        except Exception as e:
+            print(f"❌ [ASYNC WP PUBLISHER] Connection error: {str(e)}")
+
+    async def _preload_taxonomy(self):
+        """Preload tags + categories (phân trang per_page=100) vào cache chung"""
+        for taxonomy in WPTaxonomyCache.TAXONOMIES:
+            mapping = {}
+            page, total_pages = 1, 1
+
+            while page <= total_pages:
+                response = await self._request(
+                    "GET", taxonomy,
+                    params={
+                        "per_page": WPTaxonomyCache.PER_PAGE,
+                        "page": page,
+                        "hide_empty": "false",
+                        "_fields": "id,name,slug"
+                    }
+                )
+                if response.status_code != 200:
+                    break
+
+                WPTaxonomyCache.add_listing(mapping, response.json())
+                total_pages = int(response.headers.get("X-WP-TotalPages", 1) or 1)
+                page += 1
+
+            self.taxonomy.set_terms(taxonomy, mapping)
+
+        self.taxonomy.save()
+
+    async def _resolve_terms(self, taxonomy: str, names: List[str]) -> List[int]:
+        """Resolve tên → ID, tạo các term còn thiếu (khóa để không tạo trùng giữa các task)"""
+        if not names:
+            return []
+
+        async with self._term_lock:
+            # Cache bị invalidate / chưa preload → preload async (resolve() tự load sẽ chặn event loop)
+            if not self.taxonomy.loaded and not self.taxonomy.load_cached():
+                try:
+                    await self._preload_taxonomy()
+                except Exception as e:
+                    print(f"⚠️ [ASYNC WP PUBLISHER] Taxonomy preload error: {str(e)}")
+
+            missing = self.taxonomy.missing(taxonomy, names)
+
+            for name in missing:
+                response = await self._request("POST", taxonomy, json={"name": name}, timeout=10)
+
+                if response.status_code == 201:
+                    self.taxonomy.remember(taxonomy, name, response.json()['id'])
+                    continue
+
+                body = WPTaxonomyCache._json_or_empty(response)
+                if body.get('code') == 'term_exists':
+                    self.taxonomy.remember(taxonomy, name, body['data']['term_id'])
+                else:
+                    print(f"❌ [ASYNC WP PUBLISHER] Create {taxonomy[:-1]} '{name}' failed: {response.status_code}")
+
+            if missing:
+                self.taxonomy.save()
+
+        return self.taxonomy.resolve(taxonomy, names, create_missing=False, autoload=False)
+
+    @staticmethod
+    def _split_names(names) -> list:
+        """Chấp nhận list hoặc chuỗi 'a, b, c'"""
+        if isinstance(names, str):
+            return [name.strip() for name in names.split(',') if name.strip()]
+        return list(names or [])
+
+    async def _build_post_data(self, content_data: Dict[str, Any], featured_image_id: Optional[int] = None) -> Dict[str, Any]:
+        """Chuẩn bị payload cho POST /posts (giống WordPressPublisher)"""
+        category_names = self._split_names(content_data.get('categories') or content_data.get('category') or [])
+        category_ids = await self._resolve_terms("categories", category_names)
+
+        post_data = {
+            "title": content_data.get('title', 'Untitled'),
+            "content": content_data.get('content', ''),
+            "excerpt": content_data.get('excerpt', ''),
+            "status": "publish",
+            "categories": category_ids or [Config.WP_DEFAULT_CATEGORY_ID],
+            "tags": await self._resolve_terms("tags", self._split_names(content_data.get('tags', []))),
+        }
+
+        if featured_image_id:
+            post_data["featured_media"] = featured_image_id
+
+        if content_data.get('meta_title') or content_data.get('meta_desc'):
+            post_data["meta"] = {
+                "_yoast_wpseo_title": content_data.get('meta_title', ''),
+                "_yoast_wpseo_metadesc": content_data.get('meta_desc', '')
+            }
+
+        return post_data
+
+    async def upload_image(self, image_data: bytes, filename: str) -> Optional[int]:
+        """
+        Upload ảnh lên WordPress Media Library
+        Returns: Media ID hoặc None nếu fail
+        """
+        try:
+            headers = {
+                "Content-Type": "image/jpeg",
+                "Content-Disposition": f'attachment; filename="{filename}"'
+            }
+
+            response = await self._request("POST", "media", headers=headers, content=image_data)
+
+            if response.status_code == 201:
+                media_data = response.json()
+                print(f"✅ [ASYNC WP PUBLISHER] Uploaded image ID: {media_data['id']}")
+                return media_data['id']
+            else:
+                print(f"❌ [ASYNC WP PUBLISHER] Upload failed: {response.status_code}")
+                return None
+
+        except Exception as e:
+            print(f"❌ [ASYNC WP PUBLISHER] Upload error: {str(e)}")
+            return None
+
+    async def create_post(self, content_data: Dict[str, Any], featured_image_id: Optional[int] = None) -> Optional[str]:
+        """
+        Tạo post WordPress
+        Returns: Post URL hoặc None nếu fail
+        """
+        try:
+            post_data = await self._build_post_data(content_data, featured_image_id)
+            response = await self._request("POST", "posts", json=post_data)
+
+            # Term IDs cũ → reload taxonomy và thử lại 1 lần
+            if WPTaxonomyCache.is_term_error(response):
+                print("⚠️ [ASYNC WP PUBLISHER] Term IDs không hợp lệ, reload taxonomy cache...")
+                self.taxonomy.invalidate()
+                await self._preload_taxonomy()
+                post_data = await self._build_post_data(content_data, featured_image_id)
+                response = await self._request("POST", "posts", json=post_data)
+
+            if response.status_code == 201:
+                post_info = response.json()
+                print(f"✅ [ASYNC WP PUBLISHER] Created post ID: {post_info['id']}")
+                return post_info['link']
+            else:
+                print(f"❌ [ASYNC WP PUBLISHER] Post creation failed: {response.status_code}")
+                return None
+
+        except Exception as e:
+            print(f"❌ [ASYNC WP PUBLISHER] Create post error: {str(e)}")
+            return None
+
+    async def publish_complete_post(self, content_data: Dict[str, Any], image_data: Optional[bytes] = None) -> Optional[str]:
+        """
+        Publish bài viết hoàn chỉnh (content + image)
+        Returns: Post URL hoặc None nếu fail
+        """
+        try:
+            featured_image_id = None
+
+            if image_data:
+                title_slug = content_data.get('title', 'image').lower().replace(' ', '-')
+                featured_image_id = await self.upload_image(image_data, f"{title_slug}.jpg")
+
+            post_url = await self.create_post(content_data, featured_image_id)
+
+            if post_url:
+                print(f"✅ [ASYNC WP PUBLISHER] Published complete post: {post_url}")
+            else:
+                print("❌ [ASYNC WP PUBLISHER] Failed to publish post")
+            return post_url
+
+        except Exception as e:
+            print(f"❌ [ASYNC WP PUBLISHER] Publish error: {str(e)}")
+            return None
+
+    async def get_post_info(self, post_id: int) -> Optional[Dict[str, Any]]:
+        """Lấy thông tin post"""
+        try:
+            response = await self._request("GET", f"posts/{post_id}", timeout=10)
+            return response.json() if response.status_code == 200 else None
+
+        except Exception as e:
+            print(f"❌ [ASYNC WP PUBLISHER] Get post info error: {str(e)}")
+            return None
+
+    async def update_post(self, post_id: int, update_data: Dict[str, Any]) -> bool:
+        """Cập nhật post existing"""
+        try:
+            response = await self._request("POST", f"posts/{post_id}", json=update_data)
+
+            if response.status_code == 200:
+                print(f"✅ [ASYNC WP PUBLISHER] Updated post ID: {post_id}")
+                return True
+            else:
+                print(f"❌ [ASYNC WP PUBLISHER] Update failed: {response.status_code}")
+                return False
+
+        except Exception as e:
+            print(f"❌ [ASYNC WP PUBLISHER] Update error: {str(e)}")
+            return False
+
+
+async def publish_many(publisher: AsyncWordPressPublisher,
+                       items: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """
+    Publish nhiều bài cùng lúc trên 1 site
+    items: [{'content_data': {...}, 'image_data': bytes|None}, ...]
+    Số request đồng thời vẫn bị giới hạn bởi semaphore của publisher
+    """
+    return await asyncio.gather(*[
+        publisher.publish_complete_post(item['content_data'], item.get('image_data'))
+        for item in items
+    ])
+
+
+# Test module
+if __name__ == "__main__":
+    async def _demo():
+        async with AsyncWordPressPublisher(
+            wp_url=Config.WP_URL or "",
+            username=Config.WP_USERNAME or "",
+            password=Config.WP_PASSWORD or ""
+        ) as wp_pub:
+            post_url = await wp_pub.create_post({
+                'title': 'Test Post from Async Module',
+                'content': '<p>This is a test post from the async WordPress publisher.</p>',
+                'tags': ['test', 'async']
+            })
+            print(f"Post URL: {post_url}")
+
+    asyncio.run(_demo())
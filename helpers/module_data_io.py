@@ -11,6 +11,8 @@ from datetime import datetime
 from typing import List, Dict, Optional, Any
 from google.oauth2.service_account import Credentials
 
+from adaptive_concurrency import limited
+
 class DataInputOutput:
     """Module độc lập xử lý Google Sheets I/O"""
     
@@ -50,7 +52,8 @@ class DataInputOutput:
         Returns: List of {prompt, row_number, status}
         """
         try:
-            all_records = self.worksheet.get_all_records()
+            with limited("sheets"):
+                all_records = self.worksheet.get_all_records()
             
             pending_tasks = []
             for i, record in enumerate(all_records, 2):
@@ -76,7 +79,8 @@ class DataInputOutput:
     def update_task_status(self, row_number: int, status: str):
         """Cập nhật trạng thái task"""
         try:
-            self.worksheet.update_cell(row_number, 2, status)
+            with limited("sheets"):
+                self.worksheet.update_cell(row_number, 2, status)
             print(f"✅ [INPUT/OUTPUT] Row {row_number}: {status}")
             time.sleep(0.5)  # Anti rate limit
             
@@ -100,7 +104,8 @@ class DataInputOutput:
             
             for col_num, value in updates.items():
                 if value:
-                    self.worksheet.update_cell(row_number, col_num, str(value))
+                    with limited("sheets"):
+                        self.worksheet.update_cell(row_number, col_num, str(value))
                     time.sleep(0.2)
             
             print(f"✅ [INPUT/OUTPUT] Đã lưu results cho row {row_number}")
@@ -112,7 +117,8 @@ class DataInputOutput:
         """Ghi log lỗi"""
         try:
             self.update_task_status(row_number, 'error')
-            self.worksheet.update_cell(row_number, 10, error_message)
+            with limited("sheets"):
+                self.worksheet.update_cell(row_number, 10, error_message)
             print(f"❌ [INPUT/OUTPUT] Logged error for row {row_number}: {error_message}")
             
         except Exception as e:
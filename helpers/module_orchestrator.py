@@ -8,13 +8,19 @@ MODULE 4: WORKFLOW ORCHESTRATOR
 import time
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 
 # Import các modules riêng biệt
 from module_data_io import DataInputOutput
 from module_ai_generator import AIContentGenerator  
 from module_wp_publisher import WordPressPublisher
+from publish_index import PublishIndex
+from adaptive_concurrency import print_limiter_stats, status_line
+from retry_policy import print_retry_stats
+from ai_gateway import print_gateway_stats
+from http_helper import print_connection_stats
+from image_optimizer import print_image_stats
+from stage_pipeline import Stage, StagePipeline
 
 class WorkflowOrchestrator:
     """Module điều phối toàn bộ workflow"""
@@ -34,6 +40,8 @@ class WorkflowOrchestrator:
         
         # Thread lock cho stats
         self.stats_lock = threading.Lock()
+        # Google Sheets: các stage read/sheet/log lỗi không ghi cùng lúc
+        self.sheet_lock = threading.Lock()
     
     def _init_modules(self):
         """Khởi tạo tất cả modules"""
@@ -54,7 +62,8 @@ class WorkflowOrchestrator:
             self.wp_publisher = WordPressPublisher(
                 wp_url=self.config['wp_url'],
                 username=self.config['wp_username'],
-                password=self.config['wp_password']
+                password=self.config['wp_password'],
+                index=PublishIndex()
             )
             
             print("✅ [ORCHESTRATOR] Tất cả modules đã được khởi tạo!")
@@ -66,108 +75,163 @@ class WorkflowOrchestrator:
     def process_single_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """
         Xử lý 1 task hoàn chỉnh: Input → AI → WordPress → Output
+        (chạy tuần tự các stage của pipeline batch)
         """
-        task_id = f"Task-{task['row_number']}"
-        prompt = task['prompt']
-        row_number = task['row_number']
+        job = self._new_job(task)
+        print(f"\n🚀 [ORCHESTRATOR] Bắt đầu {job['task_id']}: {job['prompt'][:50]}...")
         
-        print(f"\n🚀 [ORCHESTRATOR] Bắt đầu {task_id}: {prompt[:50]}...")
+        try:
+            for stage in self._build_stages({}):
+                job = stage.func(job)
+        except Exception as e:
+            self._job_failed(job, e)
         
-        results = {
-            'task_id': task_id,
-            'row_number': row_number,
+        return self._job_result(job)
+    
+    # ---- Stages: read → text → image → publish → sheet ----
+    
+    def _new_job(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'task': task,
+            'task_id': f"Task-{task['row_number']}",
+            'row_number': task['row_number'],
+            # Key publish index theo sheet + row (task không gắn row thật → None: luôn tạo bài mới)
+            'source_key': task.get('source_key', f"sheet:{self.config['google_sheet_id']}:{task['row_number']}"),
+            'prompt': task['prompt'],
+            'start_time': time.time(),
             'success': False,
-            'error_message': '',
-            'wp_url': '',
-            'processing_time': 0
         }
+    
+    def _build_stages(self, workers: Dict[str, int]) -> List[Stage]:
+        return [
+            Stage("read", self._stage_read, workers.get("read", 1)),
+            Stage("text", self._stage_text, workers.get("text", 1)),
+            Stage("image", self._stage_image, workers.get("image", 1)),
+            Stage("publish", self._stage_publish, workers.get("publish", 1)),
+            Stage("sheet", self._stage_sheet, workers.get("sheet", 1)),
+        ]
+    
+    def _stage_read(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """STEP 1: Nhận task, update status "processing" """
+        job['start_time'] = time.time()
+        with self.sheet_lock:
+            self.data_io.update_task_status(job['row_number'], 'processing')
+        return job
+    
+    def _stage_text(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """STEP 2: Generate AI content"""
+        print(f"🤖 [ORCHESTRATOR] {job['task_id']}: Generating content...")
+        content_data = self.ai_generator.generate_content(job['prompt'])
+        
+        if not content_data.get('title'):
+            raise Exception("AI không tạo được content hợp lệ")
+        if content_data.get('ai_fallback'):
+            # Hết retry cả OpenAI lẫn Gemini → task lỗi, không publish nội dung dự phòng
+            raise Exception("AI lỗi sau khi retry (chỉ có nội dung dự phòng)")
         
-        start_time = time.time()
+        job['content_data'] = content_data
+        return job
+    
+    def _stage_image(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """STEP 3: Generate image (optional) - lỗi không dừng task"""
+        job['image_url'] = None
+        job['image_path'] = None
         
         try:
-            # STEP 1: Update status "processing"
-            self.data_io.update_task_status(row_number, 'processing')
-            
-            # STEP 2: Generate AI content
-            print(f"🤖 [ORCHESTRATOR] {task_id}: Generating content...")
-            content_data = self.ai_generator.generate_content(prompt)
-            
-            if not content_data.get('title'):
-                raise Exception("AI không tạo được content hợp lệ")
-            
-            # STEP 3: Generate image (optional)
-            image_data = None
-            image_url = None
-            
-            try:
-                print(f"🎨 [ORCHESTRATOR] {task_id}: Generating image...")
-                image_url = self.ai_generator.generate_image(content_data['title'])
-                
-                if image_url:
-                    image_data = self.ai_generator.download_image(
-                        image_url, f"{task_id}.jpg"
-                    )
-            except Exception as img_error:
-                print(f"⚠️ [ORCHESTRATOR] {task_id}: Image gen failed: {str(img_error)}")
-                # Không dừng process, tiếp tục không có ảnh
-            
-            # STEP 4: Publish to WordPress
-            print(f"📝 [ORCHESTRATOR] {task_id}: Publishing to WordPress...")
-            wp_url = self.wp_publisher.publish_complete_post(content_data, image_data)
-            
-            if not wp_url:
-                raise Exception("Không thể publish lên WordPress")
-            
-            # STEP 5: Save results to Sheet
-            sheet_results = {
-                'title': content_data.get('title', ''),
-                'content_preview': content_data.get('content', '')[:200] + '...',
-                'wp_url': wp_url,
-                'image_url': image_url or '',
-                'meta_title': content_data.get('meta_title', ''),
-                'meta_desc': content_data.get('meta_desc', ''),
-                'error_log': ''
-            }
-            
-            self.data_io.save_results(row_number, sheet_results)
-            self.data_io.update_task_status(row_number, 'completed')
-            
-            # Update results
-            results.update({
-                'success': True,
-                'wp_url': wp_url,
-                'content_data': content_data,
-                'image_url': image_url
-            })
-            
-            processing_time = time.time() - start_time
-            results['processing_time'] = processing_time
-            
-            print(f"✅ [ORCHESTRATOR] {task_id} HOÀN THÀNH trong {processing_time:.1f}s")
-            print(f"   📄 Post: {wp_url}")
-            
-            return results
-            
-        except Exception as e:
-            error_msg = str(e)
-            processing_time = time.time() - start_time
-            
-            print(f"❌ [ORCHESTRATOR] {task_id} THẤT BẠI: {error_msg}")
-            
-            # Log error
-            self.data_io.log_error(row_number, error_msg)
+            print(f"🎨 [ORCHESTRATOR] {job['task_id']}: Generating image...")
+            job['image_url'] = self.ai_generator.generate_image(job['content_data']['title'])
             
+            if job['image_url']:
+                # Tải 1 lần về spool trên disk (URL tạm hết hạn), upload stream từ file
+                job['image_path'] = self.ai_generator.download_image_to_spool(
+                    job['image_url'], f"{job['task_id']}.jpg"
+                )
+        except Exception as img_error:
+            print(f"⚠️ [ORCHESTRATOR] {job['task_id']}: Image gen failed: {str(img_error)}")
+            # Không dừng process, tiếp tục không có ảnh
+        
+        return job
+    
+    def _stage_publish(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """STEP 4: Publish to WordPress"""
+        print(f"📝 [ORCHESTRATOR] {job['task_id']}: Publishing to WordPress...")
+        # Key theo sheet + row: chạy lại row đã publish → update/skip thay vì đăng trùng
+        wp_url = self.wp_publisher.publish_complete_post(
+            job['content_data'],
+            source_key=job['source_key'],
+            image_path=job['image_path']
+        )
+        
+        if not wp_url:
+            raise Exception("Không thể publish lên WordPress")
+        
+        job['wp_url'] = wp_url
+        return job
+    
+    def _stage_sheet(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """STEP 5: Save results to Sheet"""
+        content_data = job['content_data']
+        sheet_results = {
+            'title': content_data.get('title', ''),
+            'content_preview': content_data.get('content', '')[:200] + '...',
+            'wp_url': job['wp_url'],
+            'image_url': job['image_url'] or '',
+            'meta_title': content_data.get('meta_title', ''),
+            'meta_desc': content_data.get('meta_desc', ''),
+            'error_log': ''
+        }
+        
+        with self.sheet_lock:
+            self.data_io.save_results(job['row_number'], sheet_results)
+            self.data_io.update_task_status(job['row_number'], 'completed')
+        
+        job['success'] = True
+        job['processing_time'] = time.time() - job['start_time']
+        
+        print(f"✅ [ORCHESTRATOR] {job['task_id']} HOÀN THÀNH trong {job['processing_time']:.1f}s")
+        print(f"   📄 Post: {job['wp_url']}")
+        return job
+    
+    def _job_failed(self, job: Dict[str, Any], error: Exception):
+        """Task lỗi ở bất kỳ stage nào"""
+        error_msg = str(error)
+        job['success'] = False
+        job['error_message'] = error_msg
+        job['processing_time'] = time.time() - job['start_time']
+        
+        print(f"❌ [ORCHESTRATOR] {job['task_id']} THẤT BẠI: {error_msg}")
+        
+        # Log error
+        with self.sheet_lock:
+            self.data_io.log_error(job['row_number'], error_msg)
+    
+    @staticmethod
+    def _job_result(job: Dict[str, Any]) -> Dict[str, Any]:
+        results = {
+            'task_id': job['task_id'],
+            'row_number': job['row_number'],
+            'success': job['success'],
+            'error_message': job.get('error_message', ''),
+            'wp_url': job.get('wp_url', ''),
+            'processing_time': job.get('processing_time', 0)
+        }
+        if job['success']:
             results.update({
-                'success': False,
-                'error_message': error_msg,
-                'processing_time': processing_time
+                'content_data': job['content_data'],
+                'image_url': job['image_url']
             })
-            
-            return results
+        return results
     
-    def process_batch(self, max_workers: int = 2, max_tasks: Optional[int] = None) -> Dict[str, Any]:
+    def process_batch(self, max_workers: int = 2, max_tasks: Optional[int] = None,
+                      stage_workers: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
         """
-        Xử lý batch tasks với threading
+        Xử lý batch tasks bằng pipeline nhiều stage
+        
+        Args:
+            max_workers: Số worker mặc định cho các stage text/image/publish
+            max_tasks: Giới hạn số task
+            stage_workers: Số worker riêng từng stage, vd. {'image': 4, 'sheet': 1}
+                           (read/sheet mặc định 1 do Google Sheets giới hạn rate)
         """
         print("🔄 [ORCHESTRATOR] Bắt đầu batch processing...")
         
@@ -191,49 +255,41 @@ class WorkflowOrchestrator:
         if max_tasks and len(pending_tasks) > max_tasks:
             pending_tasks = pending_tasks[:max_tasks]
         
-        print(f"📋 [ORCHESTRATOR] Sẽ xử lý {len(pending_tasks)} tasks với {max_workers} workers")
+        workers = {'read': 1, 'text': max_workers, 'image': max_workers, 'publish': max_workers, 'sheet': 1}
+        workers.update(stage_workers or {})
+        print(f"📋 [ORCHESTRATOR] Sẽ xử lý {len(pending_tasks)} tasks | workers: "
+              + ", ".join(f"{name}={count}" for name, count in workers.items()))
         
-        # Process với ThreadPoolExecutor
         results = []
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit tất cả tasks
-            future_to_task = {
-                executor.submit(self.process_single_task, task): task 
-                for task in pending_tasks
-            }
-            
-            # Collect results
-            for future in as_completed(future_to_task):
-                task = future_to_task[future]
-                
-                try:
-                    result = future.result(timeout=300)  # 5 phút timeout
-                    results.append(result)
-                    
-                    # Update stats thread-safe
-                    with self.stats_lock:
-                        self.stats['total_processed'] += 1
-                        if result['success']:
-                            self.stats['successful'] += 1
-                        else:
-                            self.stats['failed'] += 1
-                            self.stats['errors'].append({
-                                'task_id': result['task_id'],
-                                'error': result['error_message']
-                            })
-                    
-                except Exception as e:
-                    error_msg = f"Executor error for {task['row_number']}: {str(e)}"
-                    print(f"❌ [ORCHESTRATOR] {error_msg}")
-                    
-                    with self.stats_lock:
-                        self.stats['total_processed'] += 1
-                        self.stats['failed'] += 1
-                        self.stats['errors'].append({
-                            'task_id': f"Task-{task['row_number']}",
-                            'error': error_msg
-                        })
+        def on_result(job: Dict[str, Any]):
+            result = self._job_result(job)
+            results.append(result)
+            with self.stats_lock:
+                self.stats['total_processed'] += 1
+                self.stats['successful'] += 1
+            print(f"🧩 [ORCHESTRATOR] {pipeline.status_line()}")
+            print(f"🎚️ [ORCHESTRATOR] Limits: {status_line()}")
+        
+        def on_error(stage_name: str, job: Dict[str, Any], error: Exception):
+            self._job_failed(job, error)
+            result = self._job_result(job)
+            results.append(result)
+            with self.stats_lock:
+                self.stats['total_processed'] += 1
+                self.stats['failed'] += 1
+                self.stats['errors'].append({
+                    'task_id': result['task_id'],
+                    'error': f"[{stage_name}] {result['error_message']}"
+                })
+        
+        # Mỗi stage có hàng đợi giới hạn → stage chậm tạo backpressure thay vì giữ worker của stage khác
+        pipeline = StagePipeline(self._build_stages(workers), on_result=on_result, on_error=on_error).start()
+        try:
+            for task in pending_tasks:
+                pipeline.submit(self._new_job(task))
+        finally:
+            pipeline.close()
         
         # Tính toán thời gian
         end_time = datetime.now()
@@ -253,10 +309,17 @@ class WorkflowOrchestrator:
         
         success_rate = (self.stats['successful'] / self.stats['total_processed']) * 100 if self.stats['total_processed'] > 0 else 0
         print(f"   📊 Tỷ lệ thành công: {success_rate:.1f}%")
+        pipeline.print_summary(total_time)
+        print_connection_stats()
+        print_limiter_stats()
+        print_retry_stats()
+        print_gateway_stats()
+        print_image_stats()
         
         self.stats['end_time'] = end_time
         self.stats['total_time'] = total_time
         self.stats['success_rate'] = success_rate
+        self.stats['stages'] = pipeline.snapshot()
         self.stats['results'] = results
         
         return self.stats
@@ -288,6 +351,7 @@ class WorkflowOrchestrator:
                 temp_task = {
                     'prompt': command,
                     'row_number': 999,  # Temp row
+                    'source_key': None,  # Không có row thật → không tra publish index
                     'status': 'processing'
                 }
                 
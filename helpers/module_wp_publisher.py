@@ -5,22 +5,51 @@ MODULE 3: WORDPRESS PUBLISHER
 Chỉ xử lý việc đăng bài lên WordPress
 """
 
-import requests
 import base64
+import os
+import requests
 from typing import Dict, Optional, Any
 import json
+import time
 from urllib.parse import urljoin
 
+from config import Config
+from http_helper import RETRY_STATUSES, create_session
+from image_spool import get_spool
+from image_optimizer import get_optimizer
+from media_index import MediaIndex, image_hash
+from publish_index import PublishIndex, content_hash, source_slug
+from wp_taxonomy_cache import WPTaxonomyCache
+
 class WordPressPublisher:
     """Module độc lập publish WordPress"""
     
-    def __init__(self, wp_url: str, username: str, password: str):
+    def __init__(self, wp_url: str, username: str, password: str, pool_size: Optional[int] = None,
+                 index: Optional[PublishIndex] = None, media_index: Optional[MediaIndex] = None):
         self.wp_url = wp_url.rstrip('/')
         self.username = username
         self.password = password
         self.api_url = f"{self.wp_url}/wp-json/wp/v2/"
         self.auth_header = self._create_auth_header()
+        self.index = index
+        # Ảnh trùng bytes đã upload lên site này → dùng lại media id
+        self.media_index = media_index or MediaIndex()
+        self.optimizer = get_optimizer()
+        # Session riêng cho site: connection pool + retry 429/5xx
+        self.session = create_session(pool_size=pool_size)
         self._test_connection()
+        
+        # Cache tag/category IDs (preload 1 lần, lưu disk giữa các lần chạy)
+        self.taxonomy = WPTaxonomyCache(
+            self.wp_url,
+            self.api_url,
+            headers={"Authorization": self.auth_header},
+            http=self.session
+        )
+        try:
+            self.taxonomy.load()
+        except Exception as e:
+            print(f"⚠️ [WP PUBLISHER] Taxonomy preload error: {str(e)}")
     
     def _create_auth_header(self) -> str:
         """Tạo Basic Auth header"""
@@ -31,7 +60,7 @@ class WordPressPublisher:
     def _test_connection(self):
         """Test kết nối WordPress"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.api_url}users/me",
                 headers={"Authorization": self.auth_header},
                 timeout=10
@@ -47,29 +76,73 @@ class WordPressPublisher:
         except Exception as e:
             print(f"❌ [WP PUBLISHER] Connection error: {str(e)}")
     
-    def upload_image(self, image_data: bytes, filename: str) -> Optional[int]:
+    def upload_image(self, image_data: bytes, filename: str, content_type: str = "image/jpeg") -> Optional[int]:
         """
         Upload ảnh lên WordPress Media Library
+        Ảnh đã upload trước đó (cùng SHA-256) → trả media id cũ, không upload lại
         Returns: Media ID hoặc None nếu fail
         """
+        return self._upload_media(lambda: image_data, len(image_data), image_hash(image_data),
+                                  filename, content_type)
+    
+    def upload_image_file(self, path: str, filename: str, content_type: Optional[str] = None) -> Optional[int]:
+        """
+        Upload ảnh từ file trong spool: body stream từ file handle, không đọc cả file vào RAM
+        Retry mở lại file, không cần download lại ảnh
+        """
+        spool = get_spool()
+        return self._upload_media(lambda: open(path, 'rb'), os.path.getsize(path), spool.digest(path),
+                                  filename, content_type or spool.mime_type(path))
+    
+    def _upload_media(self, open_body, size: int, digest: str, filename: str,
+                      content_type: str) -> Optional[int]:
+        """POST media (body = bytes hoặc file handle), retry lỗi kết nối/5xx/429"""
         try:
+            existing = self.media_index.find(self.wp_url, digest, size, verify=self._get_media)
+            if existing:
+                print(f"♻️ [WP PUBLISHER] Reused image ID: {existing['media_id']}")
+                return existing['media_id']
+            
             headers = {
                 "Authorization": self.auth_header,
-                "Content-Type": "image/jpeg",
+                "Content-Type": content_type,
+                "Content-Length": str(size),
                 "Content-Disposition": f'attachment; filename="{filename}"'
             }
             
-            response = requests.post(
-                f"{self.api_url}media",
-                headers=headers,
-                data=image_data,
-                timeout=30
-            )
+            # POST không được retry ở tầng session → retry ở đây, mỗi lần mở lại body
+            for attempt in range(Config.HTTP_MAX_RETRIES + 1):
+                if attempt:
+                    time.sleep(Config.HTTP_BACKOFF_FACTOR * (2 ** (attempt - 1)))
+                    print(f"🔄 [WP PUBLISHER] Retry upload {filename} (lần {attempt})...")
+                body = open_body()
+                upload_start = time.time()
+                try:
+                    response = self.session.post(
+                        f"{self.api_url}media",
+                        headers=headers,
+                        data=body,
+                        timeout=60
+                    )
+                except requests.ConnectionError as e:
+                    if attempt == Config.HTTP_MAX_RETRIES:
+                        raise
+                    print(f"⚠️ [WP PUBLISHER] Upload connection error: {str(e)}")
+                    continue
+                finally:
+                    if hasattr(body, 'close'):
+                        body.close()
+                if response.status_code not in RETRY_STATUSES:
+                    break
+            
+            if self.optimizer and response.status_code == 201:
+                self.optimizer.record_upload(size, time.time() - upload_start)
             
             if response.status_code == 201:
                 media_data = response.json()
                 media_id = media_data['id']
                 image_url = media_data['source_url']
+                self.media_index.record(self.wp_url, digest, media_id, image_url)
                 
                 print(f"✅ [WP PUBLISHER] Uploaded image ID: {media_id}")
                 print(f"   URL: {image_url}")
@@ -83,45 +156,62 @@ class WordPressPublisher:
             print(f"❌ [WP PUBLISHER] Upload error: {str(e)}")
             return None
     
+    def _get_media(self, media_id: int) -> Optional[Dict[str, Any]]:
+        """GET media/{id}; None nếu media không còn trên site"""
+        response = self.session.get(
+            f"{self.api_url}media/{media_id}",
+            headers={"Authorization": self.auth_header},
+            params={"_fields": "id,source_url"},
+            timeout=10
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+    
     def create_post(self, content_data: Dict[str, Any], featured_image_id: Optional[int] = None) -> Optional[str]:
         """
         Tạo post WordPress
         Returns: Post URL hoặc None nếu fail
         """
+        post_info = self._create_post_info(content_data, featured_image_id)
+        return post_info['link'] if post_info else None
+    
+    def _create_post_info(self, content_data: Dict[str, Any], featured_image_id: Optional[int] = None,
+                          slug: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Tạo post, trả về toàn bộ JSON post (id, slug, link, ...)"""
         try:
             # Chuẩn bị data
-            post_data = {
-                "title": content_data.get('title', 'Untitled'),
-                "content": content_data.get('content', ''),
-                "excerpt": content_data.get('excerpt', ''),
-                "status": "publish",
-                "categories": [1],  # Default category
-                "tags": self._get_tag_ids(content_data.get('tags', [])),
-            }
-            
-            # Thêm featured image nếu có
-            if featured_image_id:
-                post_data["featured_media"] = featured_image_id
-            
-            # Thêm SEO meta (nếu có plugin hỗ trợ)
-            if content_data.get('meta_title') or content_data.get('meta_desc'):
-                post_data["meta"] = {
-                    "_yoast_wpseo_title": content_data.get('meta_title', ''),
-                    "_yoast_wpseo_metadesc": content_data.get('meta_desc', '')
-                }
+            post_data = self._build_post_data(content_data, featured_image_id)
+            if slug:
+                post_data["slug"] = slug
             
             headers = {
                 "Authorization": self.auth_header,
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_url}posts",
                 headers=headers,
                 json=post_data,
                 timeout=30
             )
             
+            # Tag/category ID trong cache đã cũ (bị xóa trên site) → reload và thử lại 1 lần
+            if WPTaxonomyCache.is_term_error(response):
+                print("⚠️ [WP PUBLISHER] Term IDs không hợp lệ, reload taxonomy cache...")
+                self.taxonomy.invalidate()
+                post_data = self._build_post_data(content_data, featured_image_id)
+                if slug:
+                    post_data["slug"] = slug
+                response = self.session.post(
+                    f"{self.api_url}posts",
+                    headers=headers,
+                    json=post_data,
+                    timeout=30
+                )
+            
             if response.status_code == 201:
                 post_info = response.json()
                 post_url = post_info['link']
@@ -129,7 +219,7 @@ class WordPressPublisher:
                 
                 print(f"✅ [WP PUBLISHER] Created post ID: {post_id}")
                 print(f"   URL: {post_url}")
-                return post_url
+                return post_info
             else:
                 print(f"❌ [WP PUBLISHER] Post creation failed: {response.status_code}")
                 print(f"Response: {response.text}")
@@ -139,61 +229,77 @@ class WordPressPublisher:
             print(f"❌ [WP PUBLISHER] Create post error: {str(e)}")
             return None
     
-    def _get_tag_ids(self, tag_names: list) -> list:
-        """Chuyển đổi tag names thành IDs"""
+    def _build_post_data(self, content_data: Dict[str, Any], featured_image_id: Optional[int] = None) -> Dict[str, Any]:
+        """Chuẩn bị payload cho POST /posts"""
+        post_data = {
+            "title": content_data.get('title', 'Untitled'),
+            "content": content_data.get('content', ''),
+            "excerpt": content_data.get('excerpt', ''),
+            "status": "publish",
+            "categories": self._get_category_ids(content_data),
+            "tags": self._get_tag_ids(content_data.get('tags', [])),
+        }
+        
+        # Thêm featured image nếu có
+        if featured_image_id:
+            post_data["featured_media"] = featured_image_id
+        
+        # Thêm SEO meta (nếu có plugin hỗ trợ)
+        if content_data.get('meta_title') or content_data.get('meta_desc'):
+            post_data["meta"] = {
+                "_yoast_wpseo_title": content_data.get('meta_title', ''),
+                "_yoast_wpseo_metadesc": content_data.get('meta_desc', '')
+            }
+        
+        return post_data
+    
+    @staticmethod
+    def _split_names(names) -> list:
+        """Chấp nhận list hoặc chuỗi 'a, b, c'"""
+        if isinstance(names, str):
+            return [name.strip() for name in names.split(',') if name.strip()]
+        return list(names or [])
+    
+    def _get_category_ids(self, content_data: Dict[str, Any]) -> list:
+        """Chuyển category names thành IDs, fallback về default category"""
+        names = self._split_names(content_data.get('categories') or content_data.get('category') or [])
+        
         try:
-            tag_ids = []
-            
-            for tag_name in tag_names:
-                # Tìm tag existing
-                response = requests.get(
-                    f"{self.api_url}tags",
-                    headers={"Authorization": self.auth_header},
-                    params={"search": tag_name, "per_page": 1},
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    tags = response.json()
-                    if tags:
-                        tag_ids.append(tags[0]['id'])
-                        continue
-                
-                # Tạo tag mới nếu không tìm thấy
-                new_tag_response = requests.post(
-                    f"{self.api_url}tags",
-                    headers={
-                        "Authorization": self.auth_header,
-                        "Content-Type": "application/json"
-                    },
-                    json={"name": tag_name},
-                    timeout=10
-                )
-                
-                if new_tag_response.status_code == 201:
-                    new_tag = new_tag_response.json()
-                    tag_ids.append(new_tag['id'])
-                    print(f"✅ [WP PUBLISHER] Created tag: {tag_name}")
-            
-            return tag_ids
+            category_ids = self.taxonomy.resolve("categories", names) if names else []
+        except Exception as e:
+            print(f"❌ [WP PUBLISHER] Category processing error: {str(e)}")
+            category_ids = []
+        
+        return category_ids or [Config.WP_DEFAULT_CATEGORY_ID]
+    
+    def _get_tag_ids(self, tag_names) -> list:
+        """Chuyển đổi tag names thành IDs (qua taxonomy cache)"""
+        try:
+            return self.taxonomy.resolve("tags", self._split_names(tag_names))
             
         except Exception as e:
             print(f"❌ [WP PUBLISHER] Tag processing error: {str(e)}")
             return []
     
-    def publish_complete_post(self, content_data: Dict[str, Any], image_data: Optional[bytes] = None) -> Optional[str]:
+    def publish_complete_post(self, content_data: Dict[str, Any], image_data: Optional[bytes] = None,
+                              source_key: Optional[str] = None, version: int = 1,
+                              image_path: Optional[str] = None) -> Optional[str]:
         """
         Publish bài viết hoàn chỉnh (content + image)
+        image_path: ảnh trong spool (thay cho image_data) → upload stream từ disk
+        source_key (vd. "post:123", "sheet:<id>:5") + version: tra publish index trước khi tạo,
+        để re-run không đăng trùng (skip nếu nội dung không đổi, update nếu đã đổi)
         Returns: Post URL hoặc None nếu fail
         """
         try:
+            if source_key and self.index:
+                return self._publish_indexed(content_data, image_data, source_key, version, image_path)
+            
             featured_image_id = None
             
             # Upload ảnh trước (nếu có)
-            if image_data:
-                title_slug = content_data.get('title', 'image').lower().replace(' ', '-')
-                filename = f"{title_slug}.jpg"
-                featured_image_id = self.upload_image(image_data, filename)
+            if image_data or image_path:
+                featured_image_id = self._upload_featured(content_data, image_data, image_path)
             
             # Tạo post
             post_url = self.create_post(content_data, featured_image_id)
@@ -209,10 +315,86 @@ class WordPressPublisher:
             print(f"❌ [WP PUBLISHER] Publish error: {str(e)}")
             return None
     
+    def _upload_featured(self, content_data: Dict[str, Any], image_data: Optional[bytes] = None,
+                         image_path: Optional[str] = None) -> Optional[int]:
+        title_slug = content_data.get('title', 'image').lower().replace(' ', '-')
+        if image_path:
+            if self.optimizer:
+                optimized = self.optimizer.optimize_file(image_path, f"{title_slug}.jpg")
+                return self.upload_image_file(optimized['path'], optimized['filename'], optimized['mime'])
+            return self.upload_image_file(image_path, f"{title_slug}{os.path.splitext(image_path)[1]}")
+        if self.optimizer:
+            optimized = self.optimizer.optimize(image_data, f"{title_slug}.jpg")
+            return self.upload_image(optimized['data'], optimized['filename'], optimized['mime'])
+        return self.upload_image(image_data, f"{title_slug}.jpg")
+    
+    def _publish_indexed(self, content_data: Dict[str, Any], image_data: Optional[bytes],
+                         source_key: str, version: int, image_path: Optional[str] = None) -> Optional[str]:
+        """Publish có tra/ghi publish index (idempotent)"""
+        new_hash = content_hash(content_data)
+        action, entry = self.index.plan(source_key, self.wp_url, version, new_hash)
+        
+        if action == 'recover':
+            # Run trước đã gọi create nhưng chưa kịp ghi kết quả → tìm lại theo slug đã đặt
+            found = self.index.recover(source_key, self.wp_url, version, self._find_post_by_slug)
+            if found:
+                print(f"♻️ [WP PUBLISHER] Recovered {source_key} v{version} → post ID {found['id']}")
+                entry = self.index.get(source_key, self.wp_url, version)
+                action = 'skip' if entry['content_hash'] == new_hash else 'update'
+            else:
+                action = 'create'
+        
+        if action == 'skip':
+            print(f"⏭️ [WP PUBLISHER] {source_key} v{version} không đổi, skip: {entry['link']}")
+            return entry['link']
+        
+        featured_image_id = None
+        if image_data or image_path:
+            featured_image_id = self._upload_featured(content_data, image_data, image_path)
+        
+        if action == 'update':
+            post_data = self._build_post_data(content_data, featured_image_id)
+            if not self.update_post(entry['wp_post_id'], post_data):
+                return None
+            self.index.record(source_key, self.wp_url, version, entry['wp_post_id'],
+                              entry.get('slug'), entry.get('link'), new_hash)
+            return entry['link']
+        
+        slug = source_slug(content_data.get('title', ''), source_key, version)
+        self.index.reserve(source_key, self.wp_url, version, slug, new_hash)
+        post_info = self._create_post_info(content_data, featured_image_id, slug=slug)
+        if not post_info:
+            print("❌ [WP PUBLISHER] Failed to publish post")
+            return None
+        
+        self.index.record(source_key, self.wp_url, version, post_info['id'],
+                          post_info.get('slug'), post_info.get('link'), new_hash)
+        print(f"✅ [WP PUBLISHER] Published complete post: {post_info['link']}")
+        return post_info['link']
+    
+    def _find_post_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Tìm post theo slug chính xác (mọi status)"""
+        try:
+            response = self.session.get(
+                f"{self.api_url}posts",
+                headers={"Authorization": self.auth_header},
+                params={
+                    "slug": slug,
+                    "status": "publish,future,draft,pending,private",
+                    "_fields": "id,slug,link"
+                },
+                timeout=10
+            )
+            if response.status_code == 200 and response.json():
+                return response.json()[0]
+        except Exception as e:
+            print(f"⚠️ [WP PUBLISHER] Find post by slug error: {str(e)}")
+        return None
+    
     def get_post_info(self, post_id: int) -> Optional[Dict[str, Any]]:
         """Lấy thông tin post"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.api_url}posts/{post_id}",
                 headers={"Authorization": self.auth_header},
                 timeout=10
@@ -236,7 +418,7 @@ class WordPressPublisher:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.api_url}posts/{post_id}",
                 headers=headers,
                 json=update_data,
@@ -256,8 +438,6 @@ class WordPressPublisher:
 
 # Test module
 if __name__ == "__main__":
-    from config import Config
-    
     # Test WordPress Publisher
     wp_pub = WordPressPublisher(
         wp_url=Config.WP_URL or "",
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MULTI-SITE PUBLISHER
+Fan-out: version k của mỗi post → site k (theo SiteRegistry)
+
+- Mỗi site: 1 WordPressPublisher (connection pool riêng) + thread pool riêng = concurrency của site
+- Site chậm chỉ làm đầy hàng đợi của chính nó, không chặn các site khác
+- Site lỗi liên tiếp quá ngưỡng → tạm ngưng site đó, các site khác vẫn chạy
+- Progress + thống kê theo từng site
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from tqdm import tqdm
+
+from image_spool import get_spool
+from module_wp_publisher import WordPressPublisher
+from media_index import MediaIndex
+from publish_index import PublishIndex
+from site_registry import SiteRegistry
+
+
+class _SiteWorker:
+    """Publisher + executor + stats cho 1 site"""
+
+    def __init__(self, site: Dict[str, Any], position: int, max_consecutive_failures: int,
+                 index: Optional[PublishIndex] = None, media_index: Optional[MediaIndex] = None):
+        self.site = site
+        self.name = site["name"]
+        self.max_consecutive_failures = max_consecutive_failures
+        self.lock = threading.Lock()
+        self.stats = {"submitted": 0, "success": 0, "failed": 0, "skipped": 0, "total_time": 0.0}
+        self.consecutive_failures = 0
+        self.disabled_reason: Optional[str] = None
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=site["concurrency"], thread_name_prefix=f"wp-{self.name}"
+        )
+        self.progress = tqdm(total=0, desc=f"🌐 {self.name} (v{site['version']})", position=position, leave=True)
+        self.publisher: Optional[WordPressPublisher] = None
+
+        try:
+            self.publisher = WordPressPublisher(
+                site["url"], site["username"], site["password"], pool_size=site["concurrency"], index=index,
+                media_index=media_index
+            )
+        except Exception as e:
+            self.disabled_reason = f"init failed: {str(e)}"
+            print(f"❌ [MULTI-SITE] {self.name}: {self.disabled_reason}")
+
+    def submit(self, job: Dict[str, Any]) -> Optional[Future]:
+        with self.lock:
+            if self.disabled_reason:
+                self.stats["skipped"] += 1
+                return None
+            self.stats["submitted"] += 1
+            self.progress.total += 1
+            self.progress.refresh()
+
+        return self.executor.submit(self._publish, job)
+
+    def _publish(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"site": self.name, "post_id": job["post_id"], "version": job["version"], "success": False}
+
+        if self.disabled_reason:
+            with self.lock:
+                self.stats["skipped"] += 1
+                self.progress.update(1)
+            result["error"] = f"site disabled ({self.disabled_reason})"
+            return result
+
+        start = time.time()
+        try:
+            # Spool theo URL: các site cùng ảnh chỉ download 1 lần
+            image_path = get_spool().fetch(job["image_url"]) if job.get("image_url") else None
+
+            post_url = self.publisher.publish_complete_post(
+                job["content_data"], source_key=f"post:{job['post_id']}", version=job["version"],
+                image_path=image_path
+            )
+            result["success"] = bool(post_url)
+            result["wp_url"] = post_url
+            if not post_url:
+                result["error"] = "publish failed"
+
+        except Exception as e:
+            result["error"] = str(e)
+
+        with self.lock:
+            self.stats["total_time"] += time.time() - start
+            if result["success"]:
+                self.stats["success"] += 1
+                self.consecutive_failures = 0
+            else:
+                self.stats["failed"] += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.max_consecutive_failures and not self.disabled_reason:
+                    self.disabled_reason = f"{self.consecutive_failures} lỗi liên tiếp"
+                    print(f"⛔ [MULTI-SITE] {self.name} tạm ngưng: {self.disabled_reason}")
+            self.progress.set_postfix_str(f"✅{self.stats['success']} ❌{self.stats['failed']}")
+            self.progress.update(1)
+
+        return result
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.progress.close()
+
+
+class MultiSitePublisher:
+    """Fan-out publish các version của post sang site tương ứng"""
+
+    def __init__(self, registry: Optional[SiteRegistry] = None, max_consecutive_failures: int = 5,
+                 index: Optional[PublishIndex] = None):
+        self.registry = registry or SiteRegistry.load()
+        # 1 index dùng chung cho mọi site (key gồm site + version)
+        self.index = index or PublishIndex()
+        self.media_index = MediaIndex()
+        self.workers: Dict[int, _SiteWorker] = {}
+        self.unrouted = 0
+
+        for position, site in enumerate(self.registry.sites(), 1):
+            self.workers[site["version"]] = _SiteWorker(site, position, max_consecutive_failures,
+                                                       self.index, self.media_index)
+
+        print(f"🌐 [MULTI-SITE] {len(self.workers)} sites: "
+              + ", ".join(f"v{v}→{w.name}" for v, w in sorted(self.workers.items())))
+
+    def submit(self, post_id: Any, version: int, content_data: Dict[str, Any],
+               image_url: Optional[str] = None) -> Optional[Future]:
+        """Đưa version của post vào hàng đợi của site tương ứng (không block)"""
+        worker = self.workers.get(version)
+        if worker is None:
+            self.unrouted += 1
+            return None
+
+        return worker.submit({
+            "post_id": post_id,
+            "version": version,
+            "content_data": content_data,
+            "image_url": image_url,
+        })
+
+    def close(self) -> Dict[str, Dict[str, Any]]:
+        """Chờ tất cả site xong, in + trả về thống kê theo site"""
+        for worker in self.workers.values():
+            worker.close()
+
+        summary = {}
+        print("\n🌐 MULTI-SITE PUBLISH SUMMARY:")
+        for version, worker in sorted(self.workers.items()):
+            stats = dict(worker.stats, disabled=worker.disabled_reason)
+            summary[worker.name] = stats
+            avg = stats["total_time"] / max(1, stats["success"] + stats["failed"])
+            status = f" ⛔ {worker.disabled_reason}" if worker.disabled_reason else ""
+            print(f"   v{version} {worker.name}: ✅ {stats['success']} | ❌ {stats['failed']} | "
+                  f"⏭️ {stats['skipped']} | avg {avg:.1f}s{status}")
+        if self.unrouted:
+            print(f"   ⚠️ {self.unrouted} jobs không có site cho version tương ứng")
+        media = self.media_index.stats
+        if media["hits"]:
+            print(f"   ♻️ Ảnh dùng lại: {media['hits']} ({media['bytes_saved'] / 1024 / 1024:.1f} MB không phải upload)")
+        self.index.close()
+        self.media_index.close()
+
+        return summary
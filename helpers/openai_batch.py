@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OPENAI BATCH API
+Submit/collect request chat completion qua Batch API (rẻ hơn, không tính vào rate limit thường)
+
+- submit: ghi JSONL (mỗi dòng 1 request có custom_id) → upload file (purpose=batch) → tạo batch
+  (tự chia nhiều batch nếu vượt OPENAI_BATCH_MAX_REQUESTS); manifest lưu ở OPENAI_BATCH_DIR
+- wait: poll trạng thái tới khi completed/failed/expired/cancelled
+- results: đọc output/error file theo từng dòng (streaming), trả (custom_id, text, lỗi)
+- OPENAI_BASE_URL trỏ tới stub local (openai_batch_stub) để test không tốn tiền
+"""
+
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ai_usage import record_usage, usage_context
+from config import Config
+from json_output import supports_json_mode
+
+ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def custom_id(post_id: Any, site_version: int) -> str:
+    return f"post-{post_id}-v{site_version}"
+
+
+def parse_custom_id(value: str) -> Tuple[int, int]:
+    """'post-12-v3' → (12, 3)"""
+    _, post_id, version = value.rsplit("-", 2)
+    return int(post_id), int(version.lstrip("v"))
+
+
+def chat_request(request_id: str, prompt: str, system: str = "", model: Optional[str] = None,
+                 max_tokens: int = 2000, temperature: float = 0.7, json_mode: bool = False) -> Dict[str, Any]:
+    """1 dòng JSONL của Batch API (json_mode: response_format json_object nếu model hỗ trợ)"""
+    model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    body = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if json_mode and supports_json_mode("openai", model):
+        body["response_format"] = {"type": "json_object"}
+    return {
+        "custom_id": request_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": body,
+    }
+
+
+class BatchClient:
+    """Submit + theo dõi + đọc kết quả batch; manifest JSON theo batch id"""
+
+    def __init__(self, client, batch_dir: Optional[str] = None, label: str = "batch"):
+        """
+        Args:
+            client: openai.OpenAI
+            label: tên call site cho thống kê token usage
+        """
+        self.client = client
+        self.batch_dir = Path(batch_dir or Config.OPENAI_BATCH_DIR)
+        self.batch_dir.mkdir(parents=True, exist_ok=True)
+        self.label = label
+
+    def _manifest_path(self, batch_id: str) -> Path:
+        return self.batch_dir / f"{batch_id}.json"
+
+    def load_manifest(self, batch_id: str) -> Dict[str, Any]:
+        with open(self._manifest_path(batch_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest: Dict[str, Any]):
+        path = self._manifest_path(manifest["batch_id"])
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        tmp.replace(path)
+
+    def pending(self) -> List[str]:
+        """Batch đã submit nhưng chưa collect"""
+        batch_ids = []
+        for path in sorted(self.batch_dir.glob("*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not manifest.get("collected_at"):
+                batch_ids.append(manifest["batch_id"])
+        return batch_ids
+
+    def submit(self, requests: List[Dict[str, Any]], items: Dict[str, Dict[str, Any]],
+               description: str = "") -> List[str]:
+        """
+        Upload + tạo batch
+        Args:
+            requests: các dòng từ chat_request()
+            items: custom_id → thông tin cần khi collect (post_id, version, category...)
+        Returns: danh sách batch id
+        """
+        batch_ids = []
+        size = max(1, Config.OPENAI_BATCH_MAX_REQUESTS)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for start in range(0, len(requests), size):
+            chunk = requests[start:start + size]
+            input_path = self.batch_dir / f"input_{stamp}_{start // size + 1}.jsonl"
+            with open(input_path, "w", encoding="utf-8") as f:
+                for request in chunk:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+            with open(input_path, "rb") as f:
+                uploaded = self.client.files.create(file=f, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint=ENDPOINT,
+                completion_window=Config.OPENAI_BATCH_WINDOW,
+                metadata={"description": description or self.label},
+            )
+            self.save_manifest({
+                "batch_id": batch.id,
+                "input_file_id": uploaded.id,
+                "input_path": str(input_path),
+                "label": self.label,
+                "submitted_at": time.time(),
+                "status": batch.status,
+                "items": {request["custom_id"]: items.get(request["custom_id"], {}) for request in chunk},
+            })
+            batch_ids.append(batch.id)
+            print(f"📦 [BATCH] Đã submit {batch.id}: {len(chunk)} requests ({input_path.name})")
+        return batch_ids
+
+    def wait(self, batch_id: str, poll_interval: Optional[float] = None, timeout: Optional[float] = None):
+        """Poll tới khi batch kết thúc (hoặc hết timeout → trả batch ở trạng thái hiện tại)"""
+        poll_interval = Config.OPENAI_BATCH_POLL_SECONDS if poll_interval is None else poll_interval
+        deadline = time.monotonic() + timeout if timeout else None
+        last_status = None
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            status = (batch.status, getattr(counts, "completed", 0), getattr(counts, "failed", 0))
+            if status != last_status:
+                total = getattr(counts, "total", 0)
+                print(f"⏳ [BATCH] {batch_id}: {batch.status} ({status[1]}/{total} xong, {status[2]} lỗi)")
+                last_status = status
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            if deadline is not None and time.monotonic() >= deadline:
+                return batch
+            time.sleep(poll_interval)
+
+    def _iter_file(self, file_id: Optional[str]) -> Iterator[Dict[str, Any]]:
+        if not file_id:
+            return
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def results(self, batch) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        """(custom_id, text, lỗi) cho từng request của batch; text None khi request lỗi"""
+        from openai.types.chat import ChatCompletion
+
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            for line in self._iter_file(file_id):
+                request_id = line.get("custom_id", "")
+                response = line.get("response") or {}
+                error = line.get("error")
+                if error or response.get("status_code", 200) >= 400:
+                    body_error = (response.get("body") or {}).get("error") or error or {}
+                    yield request_id, None, str(body_error.get("message") or body_error)[:300]
+                    continue
+                try:
+                    completion = ChatCompletion.model_validate(response["body"])
+                except Exception as e:
+                    yield request_id, None, f"Response không hợp lệ: {e}"
+                    continue
+                try:
+                    post_id, site_version = parse_custom_id(request_id)
+                except ValueError:
+                    post_id, site_version = None, None
+                with usage_context(post_id=post_id, site_version=site_version, stage="text"):
+                    record_usage(self.label, "openai", completion, batch=True)
+                yield request_id, (completion.choices[0].message.content or "").strip(), None
+
+    def mark_collected(self, batch_id: str, summary: Dict[str, Any]):
+        manifest = self.load_manifest(batch_id)
+        manifest.update(collected_at=time.time(), status="collected", summary=summary)
+        self.save_manifest(manifest)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OPENAI BATCH STUB
+Giả lập endpoint files + batches của OpenAI (stdlib) để test submit-batch / collect-batch
+
+Hỗ trợ: POST /v1/files (multipart), GET /v1/files/{id}, GET /v1/files/{id}/content,
+        POST /v1/batches, GET /v1/batches/{id}, POST /v1/batches/{id}/cancel
+- Batch "in_progress" trong complete_after giây rồi chuyển "completed" với output/error file
+- responder(body) → text trả về cho từng request (raise → dòng lỗi trong error file)
+
+Dùng: OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 python ai_content_processor.py submit-batch ...
+"""
+
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+
+def default_responder(body: Dict[str, Any]) -> str:
+    """JSON giống output của posts_ai, dựng từ phần cuối prompt"""
+    prompt = body["messages"][-1]["content"]
+    excerpt = " ".join(prompt.split())[-200:]
+    return json.dumps({
+        "ai_content": f"[stub] {excerpt}",
+        "meta_title": "Stub meta title",
+        "meta_description": "Stub meta description",
+        "image_prompt": "",
+        "suggested_tags": "stub, batch",
+        "notes": "openai_batch_stub",
+    }, ensure_ascii=False)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "OpenAIBatchStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Any, content_type: str = "application/json"):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        stub = self.server.stub
+        match = re.fullmatch(r"/v1/files/([\w-]+)(/content)?", self.path)
+        if match:
+            file = stub.files.get(match.group(1))
+            if file is None:
+                self._send(404, {"error": {"message": "No such file", "type": "invalid_request_error"}})
+            elif match.group(2):
+                self._send(200, file["data"], "application/octet-stream")
+            else:
+                self._send(200, stub.file_object(file))
+            return
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+        if match and match.group(1) in stub.batches:
+            self._send(200, stub.batch_object(match.group(1)))
+            return
+        self._send(404, {"error": {"message": f"Unknown route {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self._read_body()
+        if self.path == "/v1/files":
+            header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8")
+            message = BytesParser(policy=HTTP).parsebytes(header + body)
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            upload = fields.get("file")
+            if upload is None:
+                self._send(400, {"error": {"message": "Missing file", "type": "invalid_request_error"}})
+                return
+            purpose = fields["purpose"].get_content() if "purpose" in fields else "batch"
+            file = stub.add_file(upload.get_content(), upload.get_filename() or "upload.jsonl", purpose)
+            self._send(200, stub.file_object(file))
+            return
+        if self.path == "/v1/batches":
+            payload = json.loads(body or b"{}")
+            if payload.get("input_file_id") not in stub.files:
+                self._send(400, {"error": {"message": "Invalid input_file_id", "type": "invalid_request_error"}})
+                return
+            self._send(200, stub.batch_object(stub.create_batch(payload)))
+            return
+        match = re.fullmatch(r"/v1/batches/([\w-]+)/cancel", self.path)
+        if match and match.group(1) in stub.batches:
+            with stub.lock:
+                stub.batches[match.group(1)]["status"] = "cancelled"
+            self._send(200, stub.batch_object(match.group(1)))
+            return
+        self._send(404, {"error": {"message": f"Unknown route {self.path}", "type": "invalid_request_error"}})
+
+
+class OpenAIBatchStub:
+    """Chạy stub trong background thread"""
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 complete_after: float = 0.0, port: int = 0):
+        self.responder = responder or default_responder
+        self.complete_after = complete_after
+        self.lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._next_id = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL cho OpenAI client (OPENAI_BASE_URL)"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "OpenAIBatchStub":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _new_id(self, prefix: str) -> str:
+        with self.lock:
+            self._next_id += 1
+            return f"{prefix}-stub{self._next_id}"
+
+    def add_file(self, data: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        file = {"id": self._new_id("file"), "data": data, "filename": filename,
+                "purpose": purpose, "created_at": int(time.time())}
+        with self.lock:
+            self.files[file["id"]] = file
+        return file
+
+    @staticmethod
+    def file_object(file: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": file["id"], "object": "file", "bytes": len(file["data"]), "created_at": file["created_at"],
+                "filename": file["filename"], "purpose": file["purpose"], "status": "processed"}
+
+    def create_batch(self, payload: Dict[str, Any]) -> str:
+        """Chạy hết request của input file ngay; trạng thái 'completed' sau complete_after giây"""
+        output, errors = [], []
+        for index, line in enumerate(self.files[payload["input_file_id"]]["data"].decode("utf-8").splitlines()):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            result = {"id": f"batch_req_{index}", "custom_id": request["custom_id"]}
+            try:
+                text = self.responder(request["body"])
+            except Exception as e:
+                errors.append(dict(result, response=None, error={"code": "stub_error", "message": str(e)}))
+                continue
+            prompt_tokens = sum(len(message["content"]) for message in request["body"]["messages"]) // 4
+            result["response"] = {"status_code": 200, "request_id": f"req_{index}", "body": {
+                "id": f"chatcmpl-stub{index}", "object": "chat.completion", "created": int(time.time()),
+                "model": request["body"]["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                          "total_tokens": prompt_tokens + len(text) // 4},
+            }}
+            result["error"] = None
+            output.append(result)
+
+        def to_file(lines, name):
+            if not lines:
+                return None
+            data = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+            return self.add_file(data, name, "batch_output")["id"]
+
+        batch_id = self._new_id("batch")
+        with self.lock:
+            self.batches[batch_id] = {
+                "payload": payload, "created_at": int(time.time()), "ready_at": time.monotonic() + self.complete_after,
+                "status": "in_progress", "total": len(output) + len(errors), "failed": len(errors),
+                "output_file_id": None, "error_file_id": None,
+            }
+        output_file_id, error_file_id = to_file(output, f"{batch_id}_output.jsonl"), to_file(errors, f"{batch_id}_errors.jsonl")
+        with self.lock:
+            self.batches[batch_id].update(output_file_id=output_file_id, error_file_id=error_file_id)
+        return batch_id
+
+    def batch_object(self, batch_id: str) -> Dict[str, Any]:
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch["status"] == "in_progress" and time.monotonic() >= batch["ready_at"]:
+                batch["status"] = "completed"
+            done = batch["status"] == "completed"
+            payload = batch["payload"]
+            return {
+                "id": batch_id, "object": "batch", "endpoint": payload.get("endpoint"),
+                "input_file_id": payload["input_file_id"], "completion_window": payload.get("completion_window", "24h"),
+                "status": batch["status"], "created_at": batch["created_at"],
+                "output_file_id": batch["output_file_id"] if done else None,
+                "error_file_id": batch["error_file_id"] if done else None,
+                "metadata": payload.get("metadata"),
+                "request_counts": {"total": batch["total"],
+                                   "completed": batch["total"] - batch["failed"] if done else 0,
+                                   "failed": batch["failed"] if done else 0},
+            }
+
+
+if __name__ == "__main__":
+    with OpenAIBatchStub(complete_after=5.0) as server:
+        print(f"🧪 OpenAI batch stub đang chạy: OPENAI_BASE_URL={server.url} (Ctrl+C để dừng)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
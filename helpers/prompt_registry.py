@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PROMPT REGISTRY
+Prompt template từ prompts/*.json (file do interactive_menu "Thêm/sửa custom prompt" tạo ra)
+
+- Load + compile 1 lần: user_prompt được parse sẵn thành các đoạn (literal, placeholder),
+  JSON schema của output_format được dựng sẵn → render chỉ còn ghép chuỗi
+- Validate lúc load: field bắt buộc, kiểu dữ liệu, placeholder phải là tên đơn giản ({title}, {keyword}...)
+  và placeholder riêng phải có giá trị mặc định trong "variables" (không render thành chuỗi rỗng)
+  File lỗi bị bỏ qua (giữ bản compile trước nếu có) và in cảnh báo
+- Hot reload: kiểm tra mtime thư mục tối đa mỗi PROMPTS_RELOAD_INTERVAL giây → batch dài dùng được
+  prompt vừa sửa mà không cần khởi động lại
+- Layout giống prompt có sẵn: hướng dẫn + schema trước (prefix cache được), dữ liệu bài sau cùng
+
+Format file:
+{
+  "name": "SEO Content Optimizer",          # bắt buộc
+  "key": "SEO_OPTIMIZER",                   # tùy chọn, mặc định = name dạng UPPER_SNAKE
+  "system_role": "...",
+  "user_prompt": "Tối ưu SEO ... {keyword}",  # bắt buộc
+  "output_format": {"field": "mô tả", ...},  # bắt buộc
+  "content_field": "optimized_content",     # tùy chọn, mặc định = field đầu tiên
+  "variables": {"keyword": "casino"},       # bắt buộc nếu có placeholder riêng: giá trị mặc định
+  "model": "gpt-3.5-turbo", "max_tokens": 2000, "temperature": 0.7
+}
+"""
+
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from string import Formatter
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from publish_index import slugify
+
+# Placeholder do pipeline truyền vào; placeholder khác lấy từ kwargs hoặc "variables" của file
+BUILTIN_VARIABLES = ("title", "content", "category", "site_version")
+PLACEHOLDER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class PromptTemplateError(ValueError):
+    """File prompt không hợp lệ"""
+
+
+def _compile(text: str, source: str) -> List[Tuple[str, Optional[str]]]:
+    """Parse chuỗi dạng str.format thành [(literal, placeholder | None)]"""
+    try:
+        parsed = list(Formatter().parse(text))
+    except ValueError as e:
+        raise PromptTemplateError(f"{source}: dấu ngoặc {{}} không hợp lệ ({e})")
+
+    pieces = []
+    for literal, field, spec, conversion in parsed:
+        if field is not None and (not PLACEHOLDER.match(field) or spec or conversion):
+            raise PromptTemplateError(
+                f"{source}: placeholder {{{field}{'!' + conversion if conversion else ''}"
+                f"{':' + spec if spec else ''}}} không hợp lệ (chỉ dùng {{ten_bien}})"
+            )
+        pieces.append((literal, field))
+    return pieces
+
+
+class PromptTemplate:
+    """1 prompt template đã compile"""
+
+    def __init__(self, data: Dict[str, Any], path: Path):
+        source = path.name
+        for field in ("name", "user_prompt", "output_format"):
+            if not data.get(field):
+                raise PromptTemplateError(f"{source}: thiếu '{field}'")
+        if not isinstance(data["output_format"], dict):
+            raise PromptTemplateError(f"{source}: 'output_format' phải là object {{field: mô tả}}")
+
+        self.path = path
+        self.name = str(data["name"])
+        self.key = str(data.get("key") or slugify(self.name).replace("-", "_").upper())
+        self.system = str(data.get("system_role") or "")
+        self.output_format: Dict[str, str] = {str(k): str(v) for k, v in data["output_format"].items()}
+        self.content_field = str(data.get("content_field") or next(iter(self.output_format)))
+        if self.content_field not in self.output_format:
+            raise PromptTemplateError(f"{source}: content_field '{self.content_field}' không có trong output_format")
+        self.model = data.get("model") or Config.AI_MODEL or "gpt-3.5-turbo"
+        try:
+            self.max_tokens = int(data.get("max_tokens", 2000))
+            self.temperature = float(data.get("temperature", 0.7))
+        except (TypeError, ValueError):
+            raise PromptTemplateError(f"{source}: max_tokens/temperature phải là số")
+        self.variables: Dict[str, str] = {str(k): str(v) for k, v in (data.get("variables") or {}).items()}
+
+        self.pieces = _compile(str(data["user_prompt"]), source)
+        self.placeholders = {field for _, field in self.pieces if field}
+        undeclared = self.placeholders - set(BUILTIN_VARIABLES) - set(self.variables)
+        if undeclared:
+            raise PromptTemplateError(
+                f"{source}: placeholder {', '.join(sorted(undeclared))} không có giá trị mặc định "
+                f"(khai báo trong 'variables', giá trị truyền khi gọi sẽ ghi đè)"
+            )
+
+        # Phần cố định dựng sẵn: schema output
+        self.schema = json.dumps(self.output_format, ensure_ascii=False, indent=4)
+        self.merge_schema = json.dumps(
+            {k: v for k, v in self.output_format.items() if k != self.content_field}, ensure_ascii=False, indent=4
+        )
+
+    def _render_instructions(self, values: Dict[str, Any]) -> str:
+        return "".join(literal + (str(values.get(field, "")) if field else "") for literal, field in self.pieces)
+
+    def _values(self, title: str, content: str, **kwargs) -> Dict[str, Any]:
+        values = dict(self.variables)
+        values.update({key: value for key, value in kwargs.items() if value is not None})
+        values.update(title=title, content=content)
+        return values
+
+    def render(self, source: str, title: str, **kwargs) -> str:
+        """Prompt đầy đủ: hướng dẫn + schema, dữ liệu bài cuối cùng (trừ khi user_prompt đã dùng {content})"""
+        values = self._values(title, source, **kwargs)
+        prompt = f"{self._render_instructions(values)}\n\nOUTPUT JSON:\n{self.schema}\n"
+        if "content" in self.placeholders:
+            return prompt
+        category = f"\nCategory: {values['category']}" if values.get("category") else ""
+        return f"{prompt}\nTitle: {title}{category}\n\nContent:\n{source}\n"
+
+    def render_section(self, section: str, title: str, index: int, total: int, **kwargs) -> str:
+        """Prompt xử lý 1 phần của bài dài: chỉ trả về text của content_field"""
+        values = self._values(title, "", **kwargs)
+        return (f"{self._render_instructions(values)}\n\n"
+                f"Apply the instructions above to ONE PART of a longer article (at the end). "
+                f"Continue seamlessly from the previous part.\n"
+                f"OUTPUT: only the text for '{self.content_field}' of this part (no JSON, no explanations)\n\n"
+                f"Title: {title}\nPart {index}/{total}:\n{section}\n")
+
+    def render_merge(self, content: str, title: str, **kwargs) -> str:
+        """Prompt gộp: sinh các field còn lại từ nội dung đã xử lý"""
+        values = self._values(title, "", **kwargs)
+        return (f"{self._render_instructions(values)}\n\n"
+                f"The article at the end has already been processed into '{self.content_field}'.\n"
+                f"OUTPUT JSON:\n{self.merge_schema}\n\nTitle: {title}\n{content}\n")
+
+
+class PromptRegistry:
+    """Các PromptTemplate trong PROMPTS_DIR, tự reload khi file thay đổi"""
+
+    def __init__(self, prompts_dir: Optional[str] = None, reload_interval: Optional[float] = None):
+        self.prompts_dir = Path(prompts_dir or Config.PROMPTS_DIR)
+        self.reload_interval = Config.PROMPTS_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        self._lock = threading.Lock()
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._by_file: Dict[Path, PromptTemplate] = {}
+        self._mtimes: Dict[Path, float] = {}
+        self._checked_at = 0.0
+        self.stats = {"loads": 0, "reloads": 0, "errors": 0}
+        self._refresh(force=True)
+
+    def _scan(self) -> Dict[Path, float]:
+        if not self.prompts_dir.is_dir():
+            return {}
+        mtimes = {}
+        for path in self.prompts_dir.glob("*.json"):
+            try:
+                mtimes[path] = path.stat().st_mtime
+            except OSError:
+                continue
+        return mtimes
+
+    def _refresh(self, force: bool = False):
+        """Load file mới/đã sửa, bỏ template của file đã xóa (giới hạn tần suất stat theo reload_interval)"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            mtimes = self._scan()
+            if mtimes == self._mtimes:
+                return
+
+            for path in set(self._by_file) - set(mtimes):
+                self._by_file.pop(path)
+            for path in sorted(mtimes):
+                if self._mtimes.get(path) == mtimes[path]:
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        template = PromptTemplate(json.load(f), path)
+                except (OSError, json.JSONDecodeError, PromptTemplateError) as e:
+                    self.stats["errors"] += 1
+                    print(f"❌ [PROMPTS] Bỏ qua {path.name}: {e}")
+                    continue
+                is_reload = path in self._by_file
+                self._by_file[path] = template
+                self.stats["reloads" if is_reload else "loads"] += 1
+                if is_reload:
+                    print(f"🔄 [PROMPTS] Reload {path.name} → {template.key}")
+            self._mtimes = mtimes
+
+            templates = {}
+            for path in sorted(self._by_file):
+                template = self._by_file[path]
+                if template.key in templates:
+                    print(f"⚠️ [PROMPTS] Trùng key {template.key}: {path.name} ghi đè {templates[template.key].path.name}")
+                templates[template.key] = template
+            self._templates = templates
+
+    def get(self, key: str) -> Optional[PromptTemplate]:
+        self._refresh()
+        with self._lock:
+            return self._templates.get(key)
+
+    def keys(self) -> List[str]:
+        self._refresh()
+        with self._lock:
+            return list(self._templates)
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
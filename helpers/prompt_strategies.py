@@ -8,22 +8,29 @@ Author: AI Assistant
 Date: 2025-08-06
 """
 
-import json
 import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from openai import OpenAI
 
 from config import Config
+from ai_usage import average_cost, record_usage
+from chunked_rewrite import map_reduce_rewrite, needs_chunking
+from json_output import REPAIR_SYSTEM, parse_structured, supports_json_mode
+from prompt_registry import PromptTemplate, get_prompt_registry
+from retry_policy import call_with_retry, record_fallback
+from token_budget import build_prompt
 
 
 class PromptStrategy(ABC):
     """Base class cho tất cả Prompt Strategies"""
 
     def __init__(self):
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
+        self.client = OpenAI(api_key=Config.OPENAI_API_KEY, max_retries=0, timeout=Config.AI_REQUEST_TIMEOUT)
         self.logger = logging.getLogger(__name__)
+        self._model = Config.AI_MODEL or "gpt-3.5-turbo"
 
     @abstractmethod
     def get_strategy_name(self) -> str:
@@ -31,14 +38,62 @@ class PromptStrategy(ABC):
         pass
 
     @abstractmethod
+    def make_prompt(self, source: str, title: str, **kwargs) -> str:
+        """Prompt hoàn chỉnh với nguồn đã cắt vừa token budget"""
+        pass
+
+    @abstractmethod
+    def make_section_prompt(self, section: str, title: str, index: int, total: int, **kwargs) -> str:
+        """Prompt viết lại 1 phần của bài dài (chế độ chia phần), output là text thuần"""
+        pass
+
+    @abstractmethod
+    def make_merge_prompt(self, content: str, title: str, **kwargs) -> str:
+        """Prompt gộp: từ nội dung đã viết lại → JSON các field còn lại"""
+        pass
+
+    @abstractmethod
+    def get_content_field(self) -> str:
+        """Field chứa nội dung đã viết lại trong kết quả"""
+        pass
+
     def prepare_prompt(self, content: str, title: str, **kwargs) -> str:
-        """Chuẩn bị prompt cho strategy này"""
+        """Chuẩn bị prompt cho strategy này (nguồn cắt theo token budget)"""
+        prompt, _ = build_prompt(
+            lambda source: self.make_prompt(source, title, **kwargs), content,
+            kwargs.get("model", Config.AI_MODEL or "gpt-3.5-turbo"),
+            max_tokens=self.get_max_tokens(), system=self.get_system_message(), label=self.get_strategy_name()
+        )
+        return prompt
+
+    @abstractmethod
+    def get_required_fields(self) -> List[str]:
+        """Field bắt buộc trong JSON output (thiếu → gọi sửa, vẫn thiếu → fallback)"""
         pass
 
     @abstractmethod
+    def finalize_result(self, ai_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Bổ sung field mặc định + metadata xử lý theo strategy này"""
+        pass
+
+    def parse_response(self, response: str, merged: bool = False) -> Dict[str, Any]:
+        """
+        Parse JSON (chịu fence, dấu phẩy thừa, response bị cắt) + validate field bắt buộc
+        Hỏng → 1 call sửa rẻ (AI_REPAIR_MODEL); merged=True: response của call gộp (không có field nội dung)
+        Raises: JSONOutputError
+        """
+        required = [field for field in self.get_required_fields()
+                    if not (merged and field == self.get_content_field())]
+        return parse_structured(
+            response, required,
+            repair=lambda prompt: self._chat(prompt, Config.AI_REPAIR_MODEL, self.get_max_tokens(),
+                                             system=REPAIR_SYSTEM, temperature=0, json_mode=True),
+            model=self._model,
+        )
+
     def process_ai_response(self, response: str) -> Dict[str, Any]:
         """Xử lý response từ AI theo strategy này"""
-        pass
+        return self.finalize_result(self.parse_response(response))
 
     @abstractmethod
     def get_database_fields(self) -> Dict[str, str]:
@@ -48,28 +103,22 @@ class PromptStrategy(ABC):
     def execute_strategy(self, content: str, title: str, **kwargs) -> Dict[str, Any]:
         """Execute strategy chính"""
         try:
-            # 1. Prepare prompt theo strategy
-            prompt = self.prepare_prompt(content, title, **kwargs)
+            model = kwargs.get("model", Config.AI_MODEL or "gpt-3.5-turbo")
+            self._model = model
 
-            # 2. Call OpenAI với prompt đã chuẩn bị
-            response = self.client.chat.completions.create(
-                model=kwargs.get("model", Config.AI_MODEL or "gpt-3.5-turbo"),
-                messages=[
-                    {"role": "system", "content": self.get_system_message()},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=self.get_max_tokens(),
-                temperature=self.get_temperature(),
-            )
-
-            ai_response = response.choices[0].message.content
-            if ai_response:
-                ai_response = ai_response.strip()
+            if needs_chunking(lambda source: self.make_prompt(source, title, **kwargs), content, model,
+                              max_tokens=self.get_max_tokens(), system=self.get_system_message()):
+                # Bài dài → viết lại theo phần + 1 call gộp (không bỏ phần đuôi)
+                result = self._execute_chunked(content, title, model, **kwargs)
             else:
-                ai_response = ""
+                # 1. Prepare prompt theo strategy
+                prompt = self.prepare_prompt(content, title, **kwargs)
+
+                # 2. Call OpenAI với prompt đã chuẩn bị
+                ai_response = self._chat(prompt, model, self.get_max_tokens(), json_mode=True)
 
-            # 3. Process response theo strategy
-            result = self.process_ai_response(ai_response)
+                # 3. Process response theo strategy
+                result = self.process_ai_response(ai_response)
 
             # 4. Add metadata
             result["strategy"] = self.get_strategy_name()
@@ -83,7 +132,53 @@ class PromptStrategy(ABC):
             self.logger.error(
                 f"❌ Lỗi execute strategy {self.get_strategy_name()}: {e}"
             )
-            return self.get_fallback_result(content, title, str(e))
+            record_fallback("openai.chat")
+            result = self.get_fallback_result(content, title, str(e))
+            # Caller kiểm tra ai_fallback để không coi nội dung gốc là kết quả AI
+            result["ai_fallback"] = True
+            return result
+
+    def _chat(self, prompt: str, model: str, max_tokens: int, system: Optional[str] = None,
+              temperature: Optional[float] = None, json_mode: bool = False) -> str:
+        """1 lời gọi chat completion (retry + limiter của endpoint openai.chat), ghi token usage"""
+        extra = {"response_format": {"type": "json_object"}} if json_mode and supports_json_mode("openai", model) else {}
+        start = time.monotonic()
+        response = call_with_retry(
+            "openai.chat",
+            lambda timeout: self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": self.get_system_message() if system is None else system},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=max_tokens,
+                temperature=self.get_temperature() if temperature is None else temperature,
+                timeout=timeout,
+                **extra,
+            ),
+        )
+        record_usage(self.get_strategy_name(), "openai", response, model=model, latency=time.monotonic() - start)
+        return (response.choices[0].message.content or "").strip()
+
+    def _execute_chunked(self, content: str, title: str, model: str, **kwargs) -> Dict[str, Any]:
+        """Map-reduce: viết lại từng phần song song (có cache theo phần) → call gộp sinh các field còn lại"""
+        rewritten = map_reduce_rewrite(
+            content,
+            lambda section, index, total: self.make_section_prompt(section, title, index, total, **kwargs),
+            lambda rewritten_content: self.make_merge_prompt(rewritten_content, title, **kwargs),
+            lambda prompt, max_tokens: self._chat(prompt, model, max_tokens),
+            model=model,
+            system=self.get_system_message(),
+            section_max_tokens=self.get_max_tokens(),
+            merge_max_tokens=min(800, self.get_max_tokens()),
+            label=self.get_strategy_name(),
+            complete_merge=lambda prompt, max_tokens: self._chat(prompt, model, max_tokens, json_mode=True),
+        )
+        ai_result = self.parse_response(rewritten["merge_text"], merged=True)
+        ai_result[self.get_content_field()] = rewritten["content"]
+        result = self.finalize_result(ai_result)
+        result["chunked_sections"] = len(rewritten["sections"])
+        return result
 
     @abstractmethod
     def get_system_message(self) -> str:
@@ -123,85 +218,90 @@ class DatabasePromptStrategy(PromptStrategy):
     def get_temperature(self) -> float:
         return 0.7
 
-    def prepare_prompt(self, content: str, title: str, **kwargs) -> str:
-        """Prompt cho Database Strategy - Focus SEO + Images"""
-        category = kwargs.get("category", "")
+    def get_content_field(self) -> str:
+        return "ai_content"
 
-        prompt = f"""
-        🎯 NHIỆM VỤ: PREMIUM CONTENT PROCESSING cho Website/Blog
+    def make_prompt(self, source: str, title: str, **kwargs) -> str:
+        """Prompt cho Database Strategy - Focus SEO + Images (phần tĩnh trước, dữ liệu bài sau cùng)"""
+        category = kwargs.get("category", "")
+        return f"""
+            🎯 NHIỆM VỤ: PREMIUM CONTENT PROCESSING cho Website/Blog
         
-        Bạn là chuyên gia content marketing và SEO. Hãy viết lại bài viết sau đây để:
-        ✅ Tối ưu SEO và thu hút người đọc
-        ✅ Giữ nguyên ý nghĩa chính nhưng diễn đạt hay hơn  
-        ✅ Thêm keywords tự nhiên liên quan đến chủ đề
-        ✅ Cấu trúc rõ ràng với đoạn văn ngắn
-        ✅ Tạo image prompt chất lượng cao
+            Bạn là chuyên gia content marketing và SEO. Hãy viết lại bài viết ở cuối prompt để:
+            ✅ Tối ưu SEO và thu hút người đọc
+            ✅ Giữ nguyên ý nghĩa chính nhưng diễn đạt hay hơn  
+            ✅ Thêm keywords tự nhiên liên quan đến chủ đề
+            ✅ Cấu trúc rõ ràng với đoạn văn ngắn
+            ✅ Tạo image prompt chất lượng cao
         
-        📊 INPUT DATA:
-        Tiêu đề gốc: {title}
-        Danh mục: {category}
+            📋 YÊU CẦU OUTPUT JSON (6 FIELDS):
+            {{
+                "ai_content": "Nội dung đã được viết lại với SEO optimization",
+                "meta_title": "Tiêu đề SEO (60-70 ký tự)",
+                "meta_description": "Mô tả SEO (150-160 ký tự)",
+                "image_prompt": "Professional image prompt for DALL-E 3 (English, detailed)",
+                "suggested_tags": "tag1, tag2, tag3, tag4, tag5",
+                "notes": "Ghi chú về quá trình xử lý và chiến lược SEO"
+            }}
         
-        Nội dung gốc:
-        {content[:2000]}...
+            🎨 IMAGE PROMPT REQUIREMENTS:
+            - Tiếng Anh, chi tiết
+            - Professional, high-quality
+            - Liên quan trực tiếp đến nội dung
+            - Suitable for DALL-E 3 generation
         
-        📋 YÊU CẦU OUTPUT JSON (6 FIELDS):
-        {{
-            "ai_content": "Nội dung đã được viết lại với SEO optimization",
-            "meta_title": "Tiêu đề SEO (60-70 ký tự)",
-            "meta_description": "Mô tả SEO (150-160 ký tự)",
-            "image_prompt": "Professional image prompt for DALL-E 3 (English, detailed)",
-            "suggested_tags": "tag1, tag2, tag3, tag4, tag5",
-            "notes": "Ghi chú về quá trình xử lý và chiến lược SEO"
-        }}
+            📊 INPUT DATA:
+            Tiêu đề gốc: {title}
+            Danh mục: {category}
         
-        🎨 IMAGE PROMPT REQUIREMENTS:
-        - Tiếng Anh, chi tiết
-        - Professional, high-quality
-        - Liên quan trực tiếp đến nội dung
-        - Suitable for DALL-E 3 generation
-        """
-        return prompt
-
-    def process_ai_response(self, response: str) -> Dict[str, Any]:
+            Nội dung gốc:
+            {source}
+            """
+
+    def make_section_prompt(self, section: str, title: str, index: int, total: int, **kwargs) -> str:
+        return f"""
+            🎯 NHIỆM VỤ: Viết lại MỘT PHẦN của bài viết dài (phần gốc ở cuối prompt)
+            ✅ Tối ưu SEO, giữ đủ ý của phần này, đoạn văn ngắn
+            ✅ Nối tiếp tự nhiên với phần trước; không thêm tiêu đề bài / kết luận nếu chưa phải phần cuối
+
+            📋 OUTPUT: chỉ nội dung đã viết lại của phần này (không JSON, không giải thích)
+
+            📊 Bài: {title} | Danh mục: {kwargs.get("category", "")}
+            Nội dung gốc phần {index}/{total}:
+            {section}
+            """
+
+    def make_merge_prompt(self, content: str, title: str, **kwargs) -> str:
+        return f"""
+            Bài viết ở cuối prompt đã được viết lại.
+
+            📋 YÊU CẦU OUTPUT JSON (5 FIELDS):
+            {{
+                "meta_title": "Tiêu đề SEO (60-70 ký tự)",
+                "meta_description": "Mô tả SEO (150-160 ký tự)",
+                "image_prompt": "Professional image prompt for DALL-E 3 (English, detailed)",
+                "suggested_tags": "tag1, tag2, tag3, tag4, tag5",
+                "notes": "Ghi chú về quá trình xử lý và chiến lược SEO"
+            }}
+
+            📊 Tiêu đề gốc: {title} | Danh mục: {kwargs.get("category", "")}
+            {content}
+            """
+
+    def get_required_fields(self) -> List[str]:
+        return ["ai_content", "meta_title", "meta_description"]
+
+    def finalize_result(self, ai_result: Dict[str, Any]) -> Dict[str, Any]:
         """Xử lý response cho Database Strategy"""
-        try:
-            # Parse JSON từ AI
-            ai_result = json.loads(response)
-
-            # Validate required fields cho Database Strategy
-            required_fields = [
-                "ai_content",
-                "meta_title",
-                "meta_description",
-                "image_prompt",
-                "suggested_tags",
-                "notes",
-            ]
-
-            for field in required_fields:
-                if field not in ai_result:
-                    ai_result[field] = f"Missing {field}"
-
-            # Additional processing cho Database Strategy
-            ai_result["processing_type"] = "premium_seo"
-            ai_result["supports_images"] = True
-            ai_result["output_format"] = "6_fields"
-
-            return ai_result
-
-        except json.JSONDecodeError:
-            # Fallback parsing cho Database Strategy
-            return {
-                "ai_content": response,
-                "meta_title": "Fallback Title",
-                "meta_description": "Fallback Description",
-                "image_prompt": "Professional business image",
-                "suggested_tags": "business, content",
-                "notes": "AI response không đúng JSON format - Database Strategy",
-                "processing_type": "premium_seo",
-                "supports_images": True,
-                "output_format": "6_fields",
-            }
+        for field in ("image_prompt", "suggested_tags", "notes"):
+            ai_result.setdefault(field, "")
+
+        # Additional processing cho Database Strategy
+        ai_result["processing_type"] = "premium_seo"
+        ai_result["supports_images"] = True
+        ai_result["output_format"] = "6_fields"
+
+        return ai_result
 
     def get_database_fields(self) -> Dict[str, str]:
         """Database fields mapping cho Database Strategy"""
@@ -247,75 +347,80 @@ class CSVPromptStrategy(PromptStrategy):
     def get_temperature(self) -> float:
         return 0.5  # Conservative hơn Database Strategy
 
-    def prepare_prompt(self, content: str, title: str, **kwargs) -> str:
-        """Prompt cho CSV Strategy - Focus Philippines + Fast"""
+    def get_content_field(self) -> str:
+        return "paraphrased_content"
 
-        prompt = f"""
-        🇵🇭 MISSION: PHILIPPINES CONTENT LOCALIZATION
+    def make_prompt(self, source: str, title: str, **kwargs) -> str:
+        """Prompt cho CSV Strategy - Focus Philippines + Fast (phần tĩnh trước, dữ liệu bài sau cùng)"""
+        return f"""
+            🇵🇭 MISSION: PHILIPPINES CONTENT LOCALIZATION
         
-        You are a content localization expert for Philippines market. Transform this content to:
-        ✅ Adapt to Philippines culture and market
-        ✅ Keep it natural and engaging for Filipino readers
-        ✅ Fast processing - concise but effective
-        ✅ Focus on paraphrasing and classification
+            You are a content localization expert for Philippines market. Transform the content at the end to:
+            ✅ Adapt to Philippines culture and market
+            ✅ Keep it natural and engaging for Filipino readers
+            ✅ Fast processing - concise but effective
+            ✅ Focus on paraphrasing and classification
         
-        📊 INPUT:
-        Original Title: {title}
+            📋 REQUIRED JSON OUTPUT (3 FIELDS ONLY):
+            {{
+                "paraphrased_content": "Content adapted for Philippines market",
+                "classification": "Category classification (Business/Tech/Lifestyle/etc)",
+                "localization_notes": "Brief notes about Philippines adaptation"
+            }}
         
-        Original Content:
-        {content[:1500]}...
+            🎯 FOCUS:
+            - Philippines market adaptation
+            - Cultural relevance
+            - Fast processing
+            - 3 fields only (no SEO, no images)
         
-        📋 REQUIRED JSON OUTPUT (3 FIELDS ONLY):
-        {{
-            "paraphrased_content": "Content adapted for Philippines market",
-            "classification": "Category classification (Business/Tech/Lifestyle/etc)",
-            "localization_notes": "Brief notes about Philippines adaptation"
-        }}
+            📊 INPUT:
+            Original Title: {title}
         
-        🎯 FOCUS:
-        - Philippines market adaptation
-        - Cultural relevance
-        - Fast processing
-        - 3 fields only (no SEO, no images)
-        """
-        return prompt
+            Original Content:
+            {source}
+            """
 
-    def process_ai_response(self, response: str) -> Dict[str, Any]:
+    def make_section_prompt(self, section: str, title: str, index: int, total: int, **kwargs) -> str:
+        return f"""
+            🇵🇭 Localize ONE PART of a longer article (at the end) for the Philippines market.
+            Keep every point of this part, natural for Filipino readers, continue from the previous part.
+
+            OUTPUT: only the localized text of this part (no JSON, no explanations)
+
+            Article: {title}
+            Original part {index}/{total}:
+            {section}
+            """
+
+    def make_merge_prompt(self, content: str, title: str, **kwargs) -> str:
+        return f"""
+            The article at the end has already been localized for the Philippines market.
+
+            REQUIRED JSON OUTPUT (2 FIELDS):
+            {{
+                "classification": "Category classification (Business/Tech/Lifestyle/etc)",
+                "localization_notes": "Brief notes about Philippines adaptation"
+            }}
+
+            Title: {title}
+            {content}
+            """
+
+    def get_required_fields(self) -> List[str]:
+        return ["paraphrased_content", "classification"]
+
+    def finalize_result(self, ai_result: Dict[str, Any]) -> Dict[str, Any]:
         """Xử lý response cho CSV Strategy"""
-        try:
-            # Parse JSON từ AI
-            ai_result = json.loads(response)
-
-            # Validate required fields cho CSV Strategy
-            required_fields = [
-                "paraphrased_content",
-                "classification",
-                "localization_notes",
-            ]
-
-            for field in required_fields:
-                if field not in ai_result:
-                    ai_result[field] = f"Missing {field}"
-
-            # Additional processing cho CSV Strategy
-            ai_result["processing_type"] = "philippines_localization"
-            ai_result["supports_images"] = False
-            ai_result["output_format"] = "3_fields"
-            ai_result["target_market"] = "Philippines"
-
-            return ai_result
-
-        except json.JSONDecodeError:
-            # Fallback parsing cho CSV Strategy
-            return {
-                "paraphrased_content": response,
-                "classification": "General",
-                "localization_notes": "AI response không đúng JSON format - CSV Strategy",
-                "processing_type": "philippines_localization",
-                "supports_images": False,
-                "output_format": "3_fields",
-                "target_market": "Philippines",
-            }
+        ai_result.setdefault("localization_notes", "")
+
+        # Additional processing cho CSV Strategy
+        ai_result["processing_type"] = "philippines_localization"
+        ai_result["supports_images"] = False
+        ai_result["output_format"] = "3_fields"
+        ai_result["target_market"] = "Philippines"
+
+        return ai_result
 
     def get_database_fields(self) -> Dict[str, str]:
         """Database fields mapping cho CSV Strategy"""
@@ -341,8 +446,90 @@ class CSVPromptStrategy(PromptStrategy):
         }
 
 
+class TemplatePromptStrategy(PromptStrategy):
+    """STRATEGY từ file prompts/*.json (PromptRegistry) - thêm strategy không cần sửa code"""
+
+    def __init__(self, key: str):
+        super().__init__()
+        self.key = key
+
+    @property
+    def template(self) -> PromptTemplate:
+        """Template hiện tại (lấy lại từ registry mỗi lần → file sửa giữa batch được dùng ngay)"""
+        template = get_prompt_registry().get(self.key)
+        if template is None:
+            raise ValueError(f"Prompt template không còn tồn tại: {self.key}")
+        return template
+
+    def get_strategy_name(self) -> str:
+        return self.key
+
+    def get_system_message(self) -> str:
+        return self.template.system
+
+    def get_max_tokens(self) -> int:
+        return self.template.max_tokens
+
+    def get_temperature(self) -> float:
+        return self.template.temperature
+
+    def get_content_field(self) -> str:
+        return self.template.content_field
+
+    def execute_strategy(self, content: str, title: str, **kwargs) -> Dict[str, Any]:
+        try:
+            kwargs.setdefault("model", self.template.model)
+        except ValueError as e:
+            # Template bị xóa/hỏng giữa batch → trả fallback như mọi lỗi khác của strategy
+            self.logger.error(f"❌ Lỗi execute strategy {self.key}: {e}")
+            record_fallback("openai.chat")
+            result = self.get_fallback_result(content, title, str(e))
+            result["ai_fallback"] = True
+            return result
+        return super().execute_strategy(content, title, **kwargs)
+
+    def make_prompt(self, source: str, title: str, **kwargs) -> str:
+        return self.template.render(source, title, **kwargs)
+
+    def make_section_prompt(self, section: str, title: str, index: int, total: int, **kwargs) -> str:
+        return self.template.render_section(section, title, index, total, **kwargs)
+
+    def make_merge_prompt(self, content: str, title: str, **kwargs) -> str:
+        return self.template.render_merge(content, title, **kwargs)
+
+    def get_required_fields(self) -> List[str]:
+        return list(self.template.output_format)
+
+    def finalize_result(self, ai_result: Dict[str, Any]) -> Dict[str, Any]:
+        template = self.template
+        for field in template.output_format:
+            ai_result.setdefault(field, "")
+        ai_result["processing_type"] = "custom_template"
+        ai_result["output_format"] = f"{len(template.output_format)}_fields"
+        return ai_result
+
+    def get_database_fields(self) -> Dict[str, str]:
+        """Field nội dung → ai_content, các field khác giữ nguyên tên"""
+        template = self.template
+        return {field: "ai_content" if field == template.content_field else field for field in template.output_format}
+
+    def get_fallback_result(
+        self, content: str, title: str, error: str
+    ) -> Dict[str, Any]:
+        # Không dùng self.template: fallback phải chạy được cả khi template đã không còn
+        template = get_prompt_registry().get(self.key)
+        result = {field: "" for field in template.output_format} if template else {}
+        result.update({
+            template.content_field if template else "content": content,
+            "notes": f"{self.key} failed: {error}",
+            "processing_type": "custom_template",
+            "strategy": self.key,
+        })
+        return result
+
+
 class PromptStrategyFactory:
-    """Factory để tạo ra các strategies"""
+    """Factory để tạo ra các strategies (built-in + template trong prompts/*.json)"""
 
     _strategies = {
         "DATABASE_PIPELINE": DatabasePromptStrategy,
@@ -352,21 +539,45 @@ class PromptStrategyFactory:
     @classmethod
     def create_strategy(cls, strategy_name: str) -> PromptStrategy:
         """Tạo strategy instance"""
-        if strategy_name not in cls._strategies:
-            raise ValueError(
-                f"Unknown strategy: {strategy_name}. Available: {list(cls._strategies.keys())}"
-            )
-
-        return cls._strategies[strategy_name]()
+        if strategy_name in cls._strategies:
+            return cls._strategies[strategy_name]()
+        if get_prompt_registry().get(strategy_name) is not None:
+            return TemplatePromptStrategy(strategy_name)
+        raise ValueError(
+            f"Unknown strategy: {strategy_name}. Available: {cls.get_available_strategies()}"
+        )
 
     @classmethod
     def get_available_strategies(cls) -> list:
         """Lấy danh sách strategies có thể dùng"""
-        return list(cls._strategies.keys())
+        templates = [key for key in get_prompt_registry().keys() if key not in cls._strategies]
+        return list(cls._strategies.keys()) + templates
 
     @classmethod
     def get_strategy_info(cls) -> Dict[str, Dict]:
-        """Thông tin chi tiết về từng strategy"""
+        """Thông tin chi tiết về từng strategy (cost_per_request: chi phí đo được nếu đã chạy, không thì ước tính)"""
+        info = cls._builtin_strategy_info()
+        registry = get_prompt_registry()
+        for key in registry.keys():
+            template = registry.get(key)
+            if key in info or template is None:
+                continue
+            info[key] = {
+                "name": template.name,
+                "description": template.system or "Custom prompt template",
+                "output_fields": len(template.output_format),
+                "supports_images": "image_prompt" in template.output_format,
+                "target": f"{Config.PROMPTS_DIR}/{template.path.name}",
+                "cost_per_request": "n/a",
+            }
+        for key, item in info.items():
+            measured = average_cost(key)
+            if measured is not None:
+                item["cost_per_request"] = f"${measured:.4f}"
+        return info
+
+    @staticmethod
+    def _builtin_strategy_info() -> Dict[str, Dict]:
         return {
             "DATABASE_PIPELINE": {
                 "name": "Database Pipeline",
@@ -388,8 +599,8 @@ class PromptStrategyFactory:
 
 
 def demo_strategies():
-    """Demo để test 2 strategies"""
-    print("🎯 DEMO: 2 PROMPT STRATEGIES")
+    """Demo để test các strategies (built-in + prompts/*.json)"""
+    print("🎯 DEMO: PROMPT STRATEGIES")
     print("=" * 50)
 
     # Sample data
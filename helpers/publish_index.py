@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PUBLISH INDEX
+Index local (SQLite): nguồn (post_id / sheet row) + site + version → WP post id, slug, content hash
+
+Dùng trước khi tạo post để re-run không đăng trùng:
+- Đã publish, hash giống  → skip (không gọi API)
+- Đã publish, hash khác   → update post cũ
+- Đang 'pending' (run trước chết giữa chừng) → tìm lại theo slug (1 GET chính xác, không search)
+  slug đặt trước = slug tiêu đề + hậu tố hash của (nguồn, version) → 2 nguồn cùng tiêu đề không bao giờ
+  nhận nhầm bài của nhau khi recover
+- Chưa có                 → create
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS post_mapping (
+    source_key   TEXT    NOT NULL,
+    site         TEXT    NOT NULL,
+    version      INTEGER NOT NULL DEFAULT 1,
+    wp_post_id   INTEGER,
+    slug         TEXT,
+    link         TEXT,
+    content_hash TEXT,
+    status       TEXT    NOT NULL DEFAULT 'pending',
+    updated_at   REAL    NOT NULL,
+    PRIMARY KEY (source_key, site, version)
+)
+"""
+
+
+def slugify(text: str, max_length: int = 190) -> str:
+    """Slug ASCII ổn định (bỏ dấu tiếng Việt, đ → d)"""
+    text = str(text or "").replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    text = re.sub(r"[^a-z0-9]+", "-", text).strip("-")
+    return text[:max_length].rstrip("-") or "post"
+
+
+def source_suffix(source_key: str, version: int = 1) -> str:
+    return hashlib.sha1(f"{source_key}:{version}".encode("utf-8")).hexdigest()[:8]
+
+
+def source_slug(title: str, source_key: str, version: int = 1) -> str:
+    """Slug đặt khi create: duy nhất theo nguồn + version (không phụ thuộc bài khác cùng tiêu đề)"""
+    return f"{slugify(title, max_length=180)}-{source_suffix(source_key, version)}"
+
+
+def content_hash(content_data: Dict[str, Any]) -> str:
+    """SHA-256 của các field được publish (không phụ thuộc thứ tự key)"""
+    fields = {
+        key: content_data.get(key)
+        for key in ("title", "content", "excerpt", "meta_title", "meta_desc", "tags", "category", "categories")
+        if content_data.get(key) not in (None, "", [])
+    }
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PublishIndex:
+    """Mapping nguồn → WordPress post, ghi atomic bằng transaction SQLite"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = Path(db_path or Config.PUBLISH_INDEX_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+
+    @staticmethod
+    def site_key(site_url: str) -> str:
+        return site_url.rstrip("/").lower()
+
+    def get(self, source_key: str, site: str, version: int = 1) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM post_mapping WHERE source_key = ? AND site = ? AND version = ?",
+                (source_key, self.site_key(site), version),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def plan(self, source_key: str, site: str, version: int, new_hash: str):
+        """
+        Quyết định thao tác cho 1 bài
+        Returns: (action, entry) với action ∈ {'create', 'update', 'skip', 'recover'}
+        """
+        entry = self.get(source_key, site, version)
+        if not entry:
+            return "create", None
+        if entry["status"] == "pending" or not entry["wp_post_id"]:
+            return "recover", entry
+        if entry["content_hash"] == new_hash:
+            return "skip", entry
+        return "update", entry
+
+    def reserve(self, source_key: str, site: str, version: int, slug: str, new_hash: str):
+        """Ghi 'pending' TRƯỚC khi gọi create, để run sau biết cần recover theo slug"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO post_mapping (source_key, site, version, slug, content_hash, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, 'pending', ?)
+                ON CONFLICT (source_key, site, version) DO UPDATE SET
+                    slug = excluded.slug,
+                    content_hash = excluded.content_hash,
+                    status = CASE WHEN post_mapping.wp_post_id IS NULL THEN 'pending' ELSE post_mapping.status END,
+                    updated_at = excluded.updated_at
+                """,
+                (source_key, self.site_key(site), version, slug, new_hash, time.time()),
+            )
+
+    def recover(self, source_key: str, site: str, version: int,
+                find_by_slug: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        Entry 'pending' (run trước chết giữa create và record) → tìm post theo slug đã đặt
+        Chỉ nhận post có slug đúng bằng slug đã đặt, và slug đó mang hậu tố của chính nguồn này
+        (entry cũ đặt slug chỉ theo tiêu đề có thể trỏ vào bài của nguồn khác → không nhận, tạo mới)
+        Returns: post tìm được (đã ghi mapping) hoặc None
+        """
+        entry = self.get(source_key, site, version)
+        slug = entry.get("slug") if entry else None
+        if not slug or not slug.endswith(f"-{source_suffix(source_key, version)}"):
+            return None
+        found = find_by_slug(slug)
+        if not found or found.get("slug") != slug:
+            return None
+        self.record(source_key, site, version, found["id"], found.get("slug"), found.get("link"),
+                    entry["content_hash"])
+        return found
+
+    def record(self, source_key: str, site: str, version: int, wp_post_id: int,
+               slug: Optional[str], link: Optional[str], new_hash: str):
+        """Ghi mapping sau khi create/update thành công"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO post_mapping
+                    (source_key, site, version, wp_post_id, slug, link, content_hash, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'published', ?)
+                ON CONFLICT (source_key, site, version) DO UPDATE SET
+                    wp_post_id = excluded.wp_post_id,
+                    slug = COALESCE(excluded.slug, post_mapping.slug),
+                    link = COALESCE(excluded.link, post_mapping.link),
+                    content_hash = excluded.content_hash,
+                    status = 'published',
+                    updated_at = excluded.updated_at
+                """,
+                (source_key, self.site_key(site), version, wp_post_id, slug, link, new_hash, time.time()),
+            )
+
+    def forget(self, source_key: str, site: str, version: int = 1):
+        """Xóa mapping (vd. post đã bị xóa trên WordPress)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM post_mapping WHERE source_key = ? AND site = ? AND version = ?",
+                (source_key, self.site_key(site), version),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
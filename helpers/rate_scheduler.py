@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RATE SCHEDULER
+Gửi việc vào thread pool theo rate cấu hình + giới hạn số việc đang chạy (in-flight window)
+
+- Submit đều theo rate (token ở phía gửi), không sleep ở phía nhận kết quả
+- Chỉ submit khi in-flight < concurrency → không đẩy toàn bộ hàng đợi vào executor ngay từ đầu
+- set_concurrency() / set_rate() đổi được trong lúc chạy: main.process_batch đặt concurrency theo
+  limit hiện tại của AIMD limiter provider text sau mỗi hàng xong
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+from config import Config
+
+_DONE = object()
+
+
+class RateScheduler:
+    """Chạy func(item) cho từng item với rate + concurrency điều chỉnh được"""
+
+    def __init__(self, func: Callable[[Any], Any], concurrency: Optional[int] = None,
+                 rate: Optional[float] = None, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            func: Hàm xử lý 1 item
+            concurrency: Số việc chạy đồng thời ban đầu (mặc định CONCURRENT_REQUESTS)
+            rate: Số việc submit tối đa mỗi giây (0/None = không giới hạn, mặc định REQUEST_RATE)
+            max_concurrency: Trần cho set_concurrency (= số thread của pool)
+        """
+        self.func = func
+        self.max_concurrency = max_concurrency or Config.MAX_CONCURRENT_REQUESTS
+        self._concurrency = max(1, min(concurrency or Config.CONCURRENT_REQUESTS, self.max_concurrency))
+        self._rate = Config.REQUEST_RATE if rate is None else rate
+        self._in_flight = 0
+        self._next_submit = 0.0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.stats = {"submitted": 0, "completed": 0, "max_in_flight": 0}
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def set_concurrency(self, concurrency: int):
+        """Đổi số việc chạy đồng thời (áp dụng cho lần submit tiếp theo)"""
+        with self._cond:
+            self._concurrency = max(1, min(int(concurrency), self.max_concurrency))
+            self._cond.notify_all()
+
+    def set_rate(self, rate: Optional[float]):
+        with self._cond:
+            self._rate = rate or 0
+            self._cond.notify_all()
+
+    def stop(self):
+        """Ngừng submit việc mới (việc đang chạy vẫn hoàn thành)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def run(self, items: Iterable[Any]) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """
+        Chạy và trả kết quả theo thứ tự hoàn thành
+        Yields: (item, result, error) - error là exception nếu func raise
+        """
+        results: "queue.Queue" = queue.Queue()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="sched")
+
+        def execute(item):
+            try:
+                results.put((item, self.func(item), None))
+            except Exception as e:
+                results.put((item, None, e))
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self.stats["completed"] += 1
+                    self._cond.notify_all()
+
+        def submitter():
+            try:
+                for item in items:
+                    if not self._acquire_slot():
+                        break
+                    executor.submit(execute, item)
+            finally:
+                results.put(_DONE)
+
+        thread = threading.Thread(target=submitter, name="sched-submit", daemon=True)
+        thread.start()
+
+        try:
+            # Submitter xong (_DONE) thì số việc đã submit là cố định → nhận đủ chừng đó kết quả
+            submitting, received = True, 0
+            while submitting or received < self.stats["submitted"]:
+                entry = results.get()
+                if entry is _DONE:
+                    submitting = False
+                    continue
+                received += 1
+                yield entry
+        finally:
+            self.stop()
+            executor.shutdown(wait=True)
+
+    def _acquire_slot(self) -> bool:
+        """Chờ tới khi còn slot in-flight và tới lượt theo rate; False nếu đã stop"""
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return False
+                now = time.monotonic()
+                if self._in_flight >= self._concurrency:
+                    self._cond.wait()
+                    continue
+                if self._rate and now < self._next_submit:
+                    self._cond.wait(self._next_submit - now)
+                    continue
+
+                self._in_flight += 1
+                self.stats["submitted"] += 1
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+                if self._rate:
+                    self._next_submit = max(now, self._next_submit) + 1.0 / self._rate
+                return True
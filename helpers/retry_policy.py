@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RETRY POLICY
+Retry chung cho mọi lời gọi OpenAI/Gemini
+
+- Chỉ retry lỗi tạm thời: 429, 5xx, timeout, lỗi kết nối (400/401/404... raise ngay)
+- Backoff lũy thừa có trần + full jitter: sleep ∈ [0, min(max_delay, base × 2^attempt)]
+- Server gửi Retry-After / retry-after-ms (OpenAI) hoặc retry_delay (Gemini) → chờ đúng thời gian đó
+- Deadline cho cả lời gọi (tính cả thời gian chờ): hết deadline → raise lỗi cuối cùng
+  func nhận timeout của lần thử = min(AI_REQUEST_TIMEOUT, thời gian còn lại của deadline)
+  → 1 lần thử treo không kéo lời gọi quá deadline
+- Mỗi lần thử giữ 1 slot của limiter AIMD; lúc backoff đã trả slot
+- Có breaker (circuit_breaker): mỗi lần thử được ghi nhận; circuit mở giữa chừng → dừng retry
+  (CircuitOpenError) để caller chuyển provider
+- Thống kê theo endpoint: số lần retry, số lần bỏ cuộc, số lần caller phải dùng fallback
+"""
+
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+from adaptive_concurrency import is_overload_error, limited, status_of
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from config import Config
+
+RETRYABLE_NAME_HINTS = ("Connection", "Timeout")
+NON_RETRYABLE_STATUSES = (400, 401, 403, 404, 409, 422)
+MIN_ATTEMPT_TIMEOUT = 1.0  # giây; sàn timeout của 1 lần thử khi deadline gần hết
+GEMINI_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Lỗi tạm thời (quá tải, mất kết nối) → nên thử lại"""
+    if status_of(error) in NON_RETRYABLE_STATUSES:
+        return False
+    if is_overload_error(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return any(hint in type(error).__name__ for hint in RETRYABLE_NAME_HINTS)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Thời gian chờ server yêu cầu (giây), None nếu không có"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                # Dạng HTTP-date
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+
+    # Gemini (google.api_core) đưa RetryInfo vào message lỗi
+    match = GEMINI_RETRY_DELAY.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class RetryPolicy:
+    """Capped exponential backoff + jitter + Retry-After + deadline"""
+
+    def __init__(self, max_attempts: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, deadline: Optional[float] = None,
+                 request_timeout: Optional[float] = None):
+        self.max_attempts = max_attempts or Config.AI_RETRY_ATTEMPTS
+        self.base_delay = Config.AI_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = Config.AI_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.deadline = Config.AI_RETRY_DEADLINE if deadline is None else deadline
+        self.request_timeout = Config.AI_REQUEST_TIMEOUT if request_timeout is None else request_timeout
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Thời gian chờ trước lần thử attempt + 1 (attempt bắt đầu từ 1)"""
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            return server_delay
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def call(self, endpoint: str, func: Callable[[float], Any], breaker: Optional[CircuitBreaker] = None) -> Any:
+        """
+        Gọi func(timeout) với retry; mỗi lần thử chạy trong limited(endpoint)
+        timeout (giây) = min(request_timeout, thời gian còn lại của deadline) → func truyền vào SDK
+        Raises: lỗi cuối cùng nếu không retry được / hết lượt / hết deadline;
+                CircuitOpenError nếu breaker không cho gọi
+        """
+        stats = _stats_for(endpoint)
+        start = time.monotonic()
+        _bump(stats, "calls")
+
+        for attempt in range(1, self.max_attempts + 1):
+            if breaker is not None and not breaker.allow():
+                _bump(stats, "short_circuited")
+                raise CircuitOpenError(breaker.name)
+
+            attempt_start = time.monotonic()
+            try:
+                with limited(endpoint):
+                    # Tính sau khi có slot: thời gian chờ limiter cũng trừ vào deadline
+                    remaining = self.deadline - (time.monotonic() - start)
+                    result = func(max(MIN_ATTEMPT_TIMEOUT, min(self.request_timeout, remaining)))
+                if breaker is not None:
+                    breaker.record_success(time.monotonic() - attempt_start)
+                return result
+            except Exception as e:
+                if not is_retryable(e):
+                    if breaker is not None:
+                        breaker.record_ignored()
+                    raise
+                if breaker is not None:
+                    breaker.record_failure()
+
+                delay = self.backoff(attempt, e)
+                remaining = self.deadline - (time.monotonic() - start)
+                if attempt >= self.max_attempts or delay >= remaining:
+                    _bump(stats, "gave_up")
+                    print(f"❌ [RETRY] {endpoint}: bỏ cuộc sau {attempt} lần thử "
+                          f"({time.monotonic() - start:.1f}s): {str(e)[:120]}")
+                    raise
+
+                _bump(stats, "retries")
+                _bump(stats, "retry_wait", delay)
+                print(f"🔁 [RETRY] {endpoint}: lần {attempt}/{self.max_attempts} lỗi "
+                      f"({status_of(e) or type(e).__name__}), thử lại sau {delay:.1f}s")
+                time.sleep(delay)
+
+
+_default_policy: Optional[RetryPolicy] = None
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def _stats_for(endpoint: str) -> Dict[str, float]:
+    with _stats_lock:
+        return _stats.setdefault(endpoint, {
+            "calls": 0, "retries": 0, "gave_up": 0, "fallbacks": 0, "short_circuited": 0, "retry_wait": 0.0,
+        })
+
+
+def _bump(stats: Dict[str, float], key: str, amount: float = 1):
+    with _stats_lock:
+        stats[key] += amount
+
+
+def call_with_retry(endpoint: str, func: Callable[[float], Any], policy: Optional[RetryPolicy] = None,
+                    breaker: Optional[CircuitBreaker] = None) -> Any:
+    """Gọi API với policy mặc định (AI_RETRY_* trong Config); func(timeout) → truyền timeout vào SDK"""
+    global _default_policy
+    if policy is None:
+        if _default_policy is None:
+            _default_policy = RetryPolicy()
+        policy = _default_policy
+    return policy.call(endpoint, func, breaker)
+
+
+def record_fallback(endpoint: str):
+    """Caller đã dùng kết quả dự phòng (nội dung gốc) thay vì kết quả AI"""
+    _bump(_stats_for(endpoint), "fallbacks")
+
+
+def retry_stats() -> Dict[str, Dict[str, float]]:
+    with _stats_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _stats.items()}
+
+
+def print_retry_stats():
+    """In số retry / bỏ cuộc / fallback theo endpoint (bỏ qua nếu chưa gọi API nào)"""
+    stats = retry_stats()
+    if not stats:
+        return
+    print("   🔁 Retry:")
+    for endpoint, item in stats.items():
+        print(f"      {endpoint}: {int(item['calls'])} calls | 🔁 {int(item['retries'])} retries "
+              f"(chờ {item['retry_wait']:.1f}s) | ❌ {int(item['gave_up'])} bỏ cuộc | "
+              f"⚡ {int(item['short_circuited'])} bị chặn (circuit) | ⚠️ {int(item['fallbacks'])} fallback")
@@ -3,6 +3,7 @@ import time
 from datetime import datetime
 from typing import List, Dict, Optional, Any
 from config import Config
+from adaptive_concurrency import limited
 from google.oauth2.service_account import Credentials
 
 class SheetsHelper:
@@ -46,7 +47,8 @@ class SheetsHelper:
         """Lấy danh sách các hàng chưa xử lý (status = 'pending' hoặc rỗng)"""
         try:
             # Lấy tất cả dữ liệu
-            all_records = self.worksheet.get_all_records()
+            with limited("sheets"):
+                all_records = self.worksheet.get_all_records()
             
             pending_rows = []
             for i, record in enumerate(all_records, 2):  # Bắt đầu từ hàng 2 (do header ở hàng 1)
@@ -71,7 +73,8 @@ class SheetsHelper:
         """Cập nhật trạng thái và thông tin khác cho một hàng"""
         try:
             # Cập nhật status
-            self.worksheet.update_cell(row_number, 2, status)  # Cột B = Status
+            with limited("sheets"):
+                self.worksheet.update_cell(row_number, 2, status)  # Cột B = Status
             
             # Cập nhật các thông tin khác
             column_mapping = {
@@ -88,12 +91,14 @@ class SheetsHelper:
             for key, value in kwargs.items():
                 if key in column_mapping and value:
                     col_num = column_mapping[key]
-                    self.worksheet.update_cell(row_number, col_num, str(value))
+                    with limited("sheets"):
+                        self.worksheet.update_cell(row_number, col_num, str(value))
             
             # Luôn cập nhật thời gian
             if 'created_date' not in kwargs:
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self.worksheet.update_cell(row_number, 9, current_time)
+                with limited("sheets"):
+                    self.worksheet.update_cell(row_number, 9, current_time)
             
             print(f"✅ Đã cập nhật hàng {row_number}: {status}")
             
@@ -134,7 +139,8 @@ class SheetsHelper:
             
             # Thực hiện batch update
             if batch_data:
-                self.worksheet.batch_update(batch_data)
+                with limited("sheets"):
+                    self.worksheet.batch_update(batch_data)
                 print(f"✅ Đã cập nhật batch {len(batch_data)} ô")
             
         except Exception as e:
@@ -170,7 +176,8 @@ class SheetsHelper:
         
         try:
             for data in sample_data:
-                self.worksheet.append_row(data)
+                with limited("sheets"):
+                    self.worksheet.append_row(data)
             print("✅ Đã thêm dữ liệu mẫu")
             
         except Exception as e:
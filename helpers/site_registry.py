@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SITE REGISTRY
+Danh sách các site WordPress cho multi-site publishing (version k → site k)
+
+File sites.json (Config.SITES_FILE):
+[
+    {
+        "name": "site1",
+        "url": "https://site1.example.com",
+        "username": "editor",
+        "password_env": "SITE1_WP_PASSWORD",
+        "concurrency": 2,
+        "version": 1
+    }
+]
+Dùng "password_env" để không ghi password vào file (hoặc "password" nếu cần).
+Không có file → 1 site duy nhất từ WP_URL/WP_USERNAME/WP_PASSWORD, version 1.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+
+class SiteRegistry:
+    """Registry các site: URL, credentials, concurrency, version"""
+
+    def __init__(self, sites: List[Dict[str, Any]]):
+        self._sites = [self._normalize(site, index) for index, site in enumerate(sites, 1)]
+
+        versions = [site["version"] for site in self._sites]
+        duplicates = {v for v in versions if versions.count(v) > 1}
+        if duplicates:
+            raise ValueError(f"Trùng version trong site registry: {sorted(duplicates)}")
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "SiteRegistry":
+        """Load từ sites.json, fallback về site mặc định trong Config"""
+        sites_file = Path(path or Config.SITES_FILE)
+
+        if sites_file.exists():
+            with open(sites_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            sites = data.get("sites", []) if isinstance(data, dict) else data
+            print(f"✅ [SITE REGISTRY] Loaded {len(sites)} sites từ {sites_file}")
+            return cls(sites)
+
+        if not Config.WP_URL:
+            return cls([])
+
+        return cls([
+            {
+                "name": "default",
+                "url": Config.WP_URL,
+                "username": Config.WP_USERNAME,
+                "password": Config.WP_PASSWORD,
+                "concurrency": Config.WP_MAX_CONCURRENCY,
+                "version": 1,
+            }
+        ])
+
+    @staticmethod
+    def _normalize(site: Dict[str, Any], index: int) -> Dict[str, Any]:
+        if not site.get("url"):
+            raise ValueError(f"Site #{index} thiếu 'url'")
+
+        password = site.get("password")
+        if not password and site.get("password_env"):
+            password = os.getenv(site["password_env"], "")
+
+        return {
+            "name": site.get("name") or f"site{index}",
+            "url": site["url"].rstrip("/"),
+            "username": site.get("username", ""),
+            "password": password or "",
+            "concurrency": max(1, int(site.get("concurrency", Config.WP_MAX_CONCURRENCY))),
+            "version": int(site.get("version", index)),
+        }
+
+    def sites(self) -> List[Dict[str, Any]]:
+        return list(self._sites)
+
+    def for_version(self, version: int) -> Optional[Dict[str, Any]]:
+        """Site nhận version này (None nếu chưa cấu hình)"""
+        for site in self._sites:
+            if site["version"] == version:
+                return site
+        return None
+
+    def __len__(self) -> int:
+        return len(self._sites)
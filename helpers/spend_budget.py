@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SPEND BUDGET
+Ngân sách chi phí cho 1 lần chạy batch (USD và/hoặc token), giữ bởi scheduler của process_batch
+
+- CostModel: dự đoán chi phí 1 job (post, version) trước khi gửi
+  + prompt token: đếm từ prompt thật (template category/version + nội dung, số phần nếu viết lại chia phần)
+  + completion token / request và số ảnh / job: trung bình lịch sử bảng ai_usage theo category
+    (category ít mẫu → trung bình chung, chưa có lịch sử → mặc định)
+- SpendBudget: nhận job khi đã chi + phần giữ chỗ của job đang chạy + ước tính job mới ≤ ngân sách
+  (đã chi đọc trực tiếp từ thống kê ai_usage; job xong → trả phần giữ chỗ)
+  job tiếp theo không vừa → chờ job đang chạy xong, tính lại theo chi phí thật; vẫn không vừa → dừng
+- Checkpoint: các (post_id, version) chưa chạy lưu ở RUN_CHECKPOINT_DIR/<run_id>.json → chạy tiếp bằng resume-run
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional
+
+from ai_usage import IMAGE_PRICES, cost_of, usage_totals
+from config import Config
+
+DEFAULT_COMPLETION_TOKENS = 1500  # ~75% max_tokens của posts_ai khi chưa có lịch sử
+DEFAULT_IMAGES_PER_JOB = 1.0
+MIN_HISTORY_JOBS = 5  # số job tối thiểu để tin trung bình riêng của 1 category
+UNITS = ("usd", "tokens")
+
+
+class CostModel:
+    """Ước tính chi phí 1 job từ kích thước prompt + lịch sử completion / ảnh"""
+
+    def __init__(self, model: str, history: Optional[Dict[str, Dict[str, float]]] = None,
+                 image_key: tuple = ("dall-e-3", "standard", "1024x1024")):
+        """
+        Args:
+            history: category → {"jobs", "completion_tokens" (/ request text), "images" (/ job)};
+                     key "*" = trung bình mọi category
+        """
+        self.model = model
+        self.history = history or {}
+        self.image_price = IMAGE_PRICES.get(image_key, 0.0)
+
+    def _history(self, category: str) -> Optional[Dict[str, float]]:
+        for key in (category, "*"):
+            item = self.history.get(key)
+            if item and item.get("jobs", 0) >= MIN_HISTORY_JOBS:
+                return item
+        return None
+
+    def estimate(self, prompt_tokens: int, category: str = "", requests: int = 1) -> Dict[str, float]:
+        """
+        Args:
+            prompt_tokens: tổng token input của mọi request text của job
+            requests: số request text (1, hoặc số phần + 1 call gộp khi viết lại chia phần)
+        Returns: {"usd", "tokens"}
+        """
+        item = self._history(category)
+        completion = (item["completion_tokens"] if item else DEFAULT_COMPLETION_TOKENS) * requests
+        images = item["images"] if item else DEFAULT_IMAGES_PER_JOB
+        usage = {"prompt_tokens": int(prompt_tokens), "completion_tokens": int(completion), "cached_tokens": 0}
+        return {
+            "usd": cost_of(self.model, usage) + images * self.image_price,
+            "tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+        }
+
+
+class SpendBudget:
+    """Ngân sách của 1 run: admit() trước khi gửi job, release() khi job xong (thành công hay lỗi)"""
+
+    def __init__(self, max_usd: Optional[float] = None, max_tokens: Optional[int] = None):
+        """max_usd / max_tokens: None = lấy từ config (RUN_BUDGET_USD / RUN_BUDGET_TOKENS), 0 = không giới hạn"""
+        self.limits = {
+            "usd": Config.RUN_BUDGET_USD if max_usd is None else max_usd,
+            "tokens": Config.RUN_BUDGET_TOKENS if max_tokens is None else max_tokens,
+        }
+        self.start = usage_totals()
+        self.reserved: Dict[Hashable, Dict[str, float]] = {}
+        self.estimated = dict.fromkeys(UNITS, 0.0)
+        self.admitted = 0
+        self.refused: Optional[Dict[str, Any]] = None
+        self.condition = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.limits.values())
+
+    def spent(self) -> Dict[str, float]:
+        """Chi phí thật từ lúc bắt đầu run (mọi call AI trong process)"""
+        totals = usage_totals()
+        return {"usd": totals["cost"] - self.start["cost"], "tokens": totals["tokens"] - self.start["tokens"]}
+
+    def _over(self, estimate: Dict[str, float]) -> Optional[str]:
+        """Đơn vị bị vượt nếu nhận thêm job này (None = vừa)"""
+        spent = self.spent()
+        for unit in UNITS:
+            limit = self.limits[unit]
+            reserved = sum(item[unit] for item in self.reserved.values())
+            if limit and spent[unit] + reserved + estimate[unit] > limit:
+                return unit
+        return None
+
+    def admit(self, key: Hashable, estimate: Dict[str, float], wait: bool = True) -> bool:
+        """
+        Giữ chỗ cho job nếu tổng dự kiến còn vừa ngân sách
+        wait: không vừa → chờ mọi job đang chạy xong (chi phí thật thay cho ước tính) rồi thử lại 1 lần
+        """
+        with self.condition:
+            unit = self._over(estimate)
+            if unit and wait and self.reserved:
+                self.condition.wait_for(lambda: not self.reserved)
+                unit = self._over(estimate)
+            if unit:
+                self.refused = {"key": key, "unit": unit, "estimate": estimate}
+                return False
+            self.reserved[key] = estimate
+            self.admitted += 1
+            for unit in UNITS:
+                self.estimated[unit] += estimate[unit]
+            return True
+
+    def release(self, key: Hashable):
+        """Job xong → bỏ phần giữ chỗ (chi phí thật đã nằm trong spent())"""
+        with self.condition:
+            self.reserved.pop(key, None)
+            self.condition.notify_all()
+
+    def describe(self) -> str:
+        """'$5.00 + 2000000 token'"""
+        return " + ".join(
+            f"${value:.2f}" if unit == "usd" else f"{int(value)} token"
+            for unit, value in self.limits.items() if value
+        ) or "không giới hạn"
+
+    def summary(self) -> Dict[str, Any]:
+        spent = self.spent()
+        return {
+            "limits": dict(self.limits),
+            "spent_usd": round(spent["usd"], 6),
+            "spent_tokens": int(spent["tokens"]),
+            "estimated_usd": round(self.estimated["usd"], 6),
+            "estimated_tokens": int(self.estimated["tokens"]),
+            "admitted": self.admitted,
+            "stopped": self.refused is not None,
+        }
+
+    def print_summary(self):
+        """In ngân sách / đã chi / ước tính của các job đã nhận"""
+        if not self.enabled:
+            return
+        item = self.summary()
+        print(f"   💰 Budget {self.describe()}: đã chi ${item['spent_usd']:.4f} ({item['spent_tokens']} token) | "
+              f"ước tính ${item['estimated_usd']:.4f} ({item['estimated_tokens']} token) cho {item['admitted']} job")
+        if self.refused:
+            print(f"   🛑 Dừng tại job {self.refused['key']}: vượt ngân sách {self.refused['unit']} "
+                  f"(ước tính ${self.refused['estimate']['usd']:.4f})")
+
+
+def _checkpoint_path(ref: str) -> Path:
+    path = Path(ref)
+    if path.suffix == ".json" and path.exists():
+        return path
+    return Path(Config.RUN_CHECKPOINT_DIR) / f"{ref}.json"
+
+
+def save_checkpoint(run_id: str, checkpoint: Dict[str, Any]) -> Path:
+    """Lưu checkpoint của run (ghi file tạm rồi replace)"""
+    path = _checkpoint_path(run_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**checkpoint, "run_id": run_id, "saved_at": time.time()}, f, ensure_ascii=False, indent=2)
+    tmp.replace(path)
+    return path
+
+
+def load_checkpoint(ref: str) -> Dict[str, Any]:
+    """ref: run_id hoặc đường dẫn file checkpoint; Raises: FileNotFoundError"""
+    with open(_checkpoint_path(ref), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def pending_checkpoints() -> List[str]:
+    """Run dừng vì hết ngân sách, chưa được chạy tiếp"""
+    run_ids = []
+    for path in sorted(Path(Config.RUN_CHECKPOINT_DIR).glob("*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if checkpoint.get("remaining") and not checkpoint.get("resumed_by"):
+            run_ids.append(checkpoint["run_id"])
+    return run_ids
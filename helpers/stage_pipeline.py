@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+STAGE PIPELINE
+Pipeline nhiều stage nối bằng hàng đợi có giới hạn (bounded queue)
+
+- Mỗi stage: hàm xử lý 1 item + số worker riêng + hàng đợi đầu vào riêng
+- Hàng đợi đầy → stage phía trước (hoặc submit) bị block = backpressure
+- Stage chậm (image, upload, ...) chỉ giữ worker của chính nó; stage khác vẫn chạy tiếp
+- Metrics theo stage: độ sâu hàng đợi, số item đang xử lý, latency avg/p95, lỗi
+
+Hàm stage nhận item và trả về item cho stage sau; trả None → bỏ item; raise → on_error.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+_STOP = object()
+
+
+class Stage:
+    """Định nghĩa 1 stage"""
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1, queue_size: Optional[int] = None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        # Mặc định hàng đợi = 2 lần số worker: đủ để không bị đói, không tích quá nhiều việc
+        self.queue_size = queue_size if queue_size is not None else self.workers * 2
+
+
+class StagePipeline:
+    """Chạy các Stage nối tiếp nhau bằng thread + queue.Queue(maxsize)"""
+
+    def __init__(self, stages: List[Stage],
+                 on_result: Optional[Callable[[Any], None]] = None,
+                 on_error: Optional[Callable[[str, Any, Exception], None]] = None):
+        self.stages = stages
+        self.on_result = on_result
+        self.on_error = on_error
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.threads: List[List[threading.Thread]] = [[] for _ in stages]
+        self.metrics = {
+            stage.name: {
+                "processed": 0, "errors": 0, "dropped": 0, "in_flight": 0,
+                "busy_time": 0.0, "max_depth": 0, "latencies": deque(maxlen=1000),
+            }
+            for stage in stages
+        }
+        self._metrics_lock = threading.Lock()
+        self._callback_lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> "StagePipeline":
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(index,), name=f"{stage.name}-{number + 1}", daemon=True
+                )
+                thread.start()
+                self.threads[index].append(thread)
+        self._started = True
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, item: Any, timeout: Optional[float] = None):
+        """Đưa item vào stage đầu (block khi hàng đợi đầy)"""
+        self._put(0, item, timeout)
+
+    def _put(self, index: int, item: Any, timeout: Optional[float] = None):
+        self.queues[index].put(item, timeout=timeout)
+        depth = self.queues[index].qsize()
+        metrics = self.metrics[self.stages[index].name]
+        with self._metrics_lock:
+            if depth > metrics["max_depth"]:
+                metrics["max_depth"] = depth
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        work_queue = self.queues[index]
+        metrics = self.metrics[stage.name]
+
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                work_queue.task_done()
+                break
+
+            with self._metrics_lock:
+                metrics["in_flight"] += 1
+            start = time.time()
+            output = None
+            try:
+                output = stage.func(item)
+            except Exception as e:
+                with self._metrics_lock:
+                    metrics["errors"] += 1
+                if self.on_error:
+                    with self._callback_lock:
+                        self.on_error(stage.name, item, e)
+
+            elapsed = time.time() - start
+            with self._metrics_lock:
+                metrics["in_flight"] -= 1
+                metrics["processed"] += 1
+                metrics["busy_time"] += elapsed
+                metrics["latencies"].append(elapsed)
+                if output is None:
+                    metrics["dropped"] += 1
+
+            if output is not None:
+                if index + 1 < len(self.stages):
+                    self._put(index + 1, output)
+                elif self.on_result:
+                    with self._callback_lock:
+                        self.on_result(output)
+
+            work_queue.task_done()
+
+    def close(self) -> Dict[str, Dict[str, Any]]:
+        """Chờ xử lý hết: dừng lần lượt từng stage sau khi stage trước đã xong"""
+        if self._started:
+            for index, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    self.queues[index].put(_STOP)
+                for thread in self.threads[index]:
+                    thread.join()
+            self._started = False
+        return self.snapshot()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Metrics hiện tại theo stage"""
+        snapshot = {}
+        with self._metrics_lock:
+            for index, stage in enumerate(self.stages):
+                metrics = self.metrics[stage.name]
+                latencies = sorted(metrics["latencies"])
+                snapshot[stage.name] = {
+                    "workers": stage.workers,
+                    "queue": self.queues[index].qsize(),
+                    "max_depth": metrics["max_depth"],
+                    "in_flight": metrics["in_flight"],
+                    "processed": metrics["processed"],
+                    "errors": metrics["errors"],
+                    "avg_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+                    "p95_latency": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+                    "busy_time": metrics["busy_time"],
+                }
+        return snapshot
+
+    def status_line(self) -> str:
+        """Dòng ngắn cho progress bar: stage q<hàng đợi> ▶<đang xử lý>/<workers>"""
+        return " | ".join(
+            f"{name} q{stats['queue']} ▶{stats['in_flight']}/{stats['workers']}"
+            for name, stats in self.snapshot().items()
+        )
+
+    def print_summary(self, elapsed: Optional[float] = None):
+        """In metrics theo stage (utilization = busy_time / (workers × elapsed))"""
+        print("   🧩 Stages:")
+        for name, stats in self.snapshot().items():
+            line = (f"      {name}: {stats['processed']} items | ❌ {stats['errors']} | "
+                    f"avg {stats['avg_latency']:.2f}s p95 {stats['p95_latency']:.2f}s | "
+                    f"queue max {stats['max_depth']} | workers {stats['workers']}")
+            if elapsed:
+                line += f" | busy {stats['busy_time'] / (stats['workers'] * elapsed) * 100:.0f}%"
+            print(line)
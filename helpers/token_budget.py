@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TOKEN BUDGET
+Cắt nội dung nguồn theo số token (thay cho cắt cứng theo số ký tự)
+
+- Đếm token bằng tiktoken (encoder cache theo model); không có tiktoken → ước lượng thận trọng
+  (ký tự ASCII / 4 + 1 token / ký tự có dấu) và cảnh báo 1 lần
+- Ngân sách input = min(context window của model - max_tokens - dự phòng, AI_INPUT_TOKEN_BUDGET)
+- Phần nguồn = ngân sách - token của template (prompt khi nguồn rỗng) - system message
+- Cắt theo ranh giới đoạn văn → câu; chỉ cắt giữa câu khi 1 câu đã vượt ngân sách
+- split_text: chia nguồn dài thành nhiều phần ≤ N token (cho chế độ viết lại theo phần)
+- Thống kê theo call site: số request, token gửi đi, số lần phải cắt, token nguồn bị bỏ
+"""
+
+import math
+import re
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import Config
+
+try:
+    import tiktoken
+except ImportError:  # tùy chọn
+    tiktoken = None
+
+# Context window (token) theo tiền tố tên model; model lạ → DEFAULT_CONTEXT
+MODEL_CONTEXT = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4.1": 1000000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "gemini-1.5": 1000000,
+    "gemini": 32768,
+}
+DEFAULT_CONTEXT = 8192
+SAFETY_MARGIN = 64  # token cho role/format của message
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?…])\s+")
+ELLIPSIS = "..."
+_warned_no_tiktoken = False
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str):
+    """Encoder tiktoken cho model (cache); None nếu không có tiktoken"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Model mới/Gemini → encoding gần đúng
+        return tiktoken.get_encoding("o200k_base" if model.startswith(("gpt-4o", "gpt-4.1")) else "cl100k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Số token của text theo model"""
+    if not text:
+        return 0
+    encoder = get_encoder(model or Config.AI_MODEL or "gpt-3.5-turbo")
+    if encoder is None:
+        return _estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    Ước lượng khi không có tiktoken: ~4 ký tự ASCII / token, ký tự có dấu (tiếng Việt) ~1 token / ký tự
+    (BPE thường tách âm tiết có dấu thành nhiều token → bytes / 4 đếm thiếu)
+    """
+    global _warned_no_tiktoken
+    if not _warned_no_tiktoken:
+        _warned_no_tiktoken = True
+        print("⚠️ [TOKEN BUDGET] Chưa cài tiktoken → đếm token theo ước lượng (pip install tiktoken)")
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return math.ceil((len(text) - non_ascii) / 4) + non_ascii
+
+
+def context_window(model: str) -> int:
+    for prefix, size in MODEL_CONTEXT.items():
+        if model.startswith(prefix):
+            return size
+    return DEFAULT_CONTEXT
+
+
+def input_budget(model: str, max_tokens: int) -> int:
+    """Số token input tối đa cho 1 request (prompt + system)"""
+    budget = context_window(model) - max_tokens - SAFETY_MARGIN
+    if Config.AI_INPUT_TOKEN_BUDGET:
+        budget = min(budget, Config.AI_INPUT_TOKEN_BUDGET)
+    return max(0, budget)
+
+
+def _hard_cut(text: str, budget: int, model: str) -> str:
+    """Cắt 1 đoạn không có ranh giới câu phù hợp (theo token nếu có encoder)"""
+    encoder = get_encoder(model)
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:budget])
+    # Ước lượng: bớt ký tự tới khi vừa
+    cut = text[:budget * 4]
+    while cut and count_tokens(cut, model) > budget:
+        cut = cut[:int(len(cut) * 0.9)]
+    return cut
+
+
+def fit_text(text: str, budget: int, model: Optional[str] = None) -> Tuple[str, int, bool]:
+    """
+    Giữ phần đầu của text trong budget token, cắt ở cuối đoạn văn / câu
+    Returns: (text, số token, có bị cắt không)
+    """
+    model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+    text = (text or "").strip()
+    total = count_tokens(text, model)
+    if total <= budget:
+        return text, total, False
+
+    # Chừa chỗ cho "..." đánh dấu đã cắt
+    budget = max(0, budget - count_tokens(ELLIPSIS, model))
+    kept, used = [], 0
+    for paragraph in PARAGRAPH_SPLIT.split(text):
+        paragraph_tokens = count_tokens(paragraph, model) + 1
+        if used + paragraph_tokens <= budget:
+            kept.append(paragraph)
+            used += paragraph_tokens
+            continue
+
+        # Đoạn không vừa → lấy từng câu
+        sentences = []
+        for sentence in SENTENCE_SPLIT.split(paragraph):
+            sentence_tokens = count_tokens(sentence, model) + 1
+            if used + sentence_tokens > budget:
+                break
+            sentences.append(sentence)
+            used += sentence_tokens
+        if sentences:
+            kept.append(" ".join(sentences))
+        elif not kept:
+            # Câu đầu tiên đã vượt ngân sách → buộc cắt giữa câu
+            kept.append(_hard_cut(paragraph, budget, model))
+        break
+
+    fitted = "\n\n".join(kept).rstrip() + ELLIPSIS
+    return fitted, count_tokens(fitted, model), True
+
+
+def split_text(text: str, budget: int, model: Optional[str] = None) -> List[str]:
+    """
+    Chia text thành các phần liên tiếp, mỗi phần ≤ budget token
+    Gộp đoạn văn tới khi đầy; đoạn quá dài → gộp theo câu; câu quá dài → cắt cứng
+    """
+    model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+    budget = max(1, budget)
+    sections, current, used = [], [], 0
+
+    def flush():
+        nonlocal current, used
+        if current:
+            sections.append("\n\n".join(current))
+        current, used = [], 0
+
+    for paragraph in PARAGRAPH_SPLIT.split((text or "").strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        paragraph_tokens = count_tokens(paragraph, model) + 1
+        if used + paragraph_tokens <= budget:
+            current.append(paragraph)
+            used += paragraph_tokens
+            continue
+        flush()
+        if paragraph_tokens <= budget:
+            current, used = [paragraph], paragraph_tokens
+            continue
+
+        # Đoạn dài hơn 1 phần → gộp theo câu
+        sentences, sentences_used = [], 0
+        for sentence in SENTENCE_SPLIT.split(paragraph):
+            sentence_tokens = count_tokens(sentence, model) + 1
+            if sentences and sentences_used + sentence_tokens > budget:
+                sections.append(" ".join(sentences))
+                sentences, sentences_used = [], 0
+            while sentence_tokens > budget:
+                cut = _hard_cut(sentence, budget, model)
+                if not cut or not sentence.startswith(cut):
+                    cut = sentence[:max(1, len(sentence) // 2)]
+                sections.append(cut)
+                sentence = sentence[len(cut):].lstrip()
+                sentence_tokens = count_tokens(sentence, model) + 1
+            if sentence:
+                sentences.append(sentence)
+                sentences_used += sentence_tokens
+        if sentences:
+            current, used = [" ".join(sentences)], sentences_used
+
+    flush()
+    return sections
+
+
+def source_budget(make_prompt: Callable[[str], str], model: Optional[str] = None,
+                  max_tokens: int = 2000, system: str = "") -> int:
+    """Số token còn lại cho nguồn sau template + system"""
+    model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+    overhead = count_tokens(make_prompt(""), model) + count_tokens(system, model)
+    return max(0, input_budget(model, max_tokens) - overhead)
+
+
+def build_prompt(make_prompt: Callable[[str], str], source: str, model: Optional[str] = None,
+                 max_tokens: int = 2000, system: str = "", label: str = "prompt") -> Tuple[str, int]:
+    """
+    Dựng prompt với nguồn đã cắt vừa ngân sách token
+    Args:
+        make_prompt: hàm nhận nguồn (đã cắt) → prompt hoàn chỉnh
+        source: nội dung nguồn cần đưa vào prompt
+        max_tokens: max_tokens của request (phần dành cho output)
+        system: system message (tính vào ngân sách)
+        label: tên call site cho thống kê
+    Returns: (prompt, số token input gửi đi gồm cả system)
+    """
+    model = model or Config.AI_MODEL or "gpt-3.5-turbo"
+    overhead = count_tokens(make_prompt(""), model) + count_tokens(system, model)
+    budget = max(0, input_budget(model, max_tokens) - overhead)
+
+    fitted, source_tokens, truncated = fit_text(source, budget, model)
+    prompt = make_prompt(fitted)
+    prompt_tokens = overhead + source_tokens
+    dropped = count_tokens(source, model) - source_tokens if truncated else 0
+    _record(label, prompt_tokens, truncated, dropped)
+    return prompt, prompt_tokens
+
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(label: str, prompt_tokens: int, truncated: bool, dropped: int):
+    with _stats_lock:
+        stats = _stats.setdefault(label, {"requests": 0, "tokens": 0, "max_tokens": 0, "truncated": 0, "dropped": 0})
+        stats["requests"] += 1
+        stats["tokens"] += prompt_tokens
+        stats["max_tokens"] = max(stats["max_tokens"], prompt_tokens)
+        stats["truncated"] += int(truncated)
+        stats["dropped"] += max(0, dropped)
+
+
+def print_token_stats():
+    """In token input theo call site (bỏ qua nếu chưa dựng prompt nào)"""
+    with _stats_lock:
+        stats = {label: dict(item) for label, item in _stats.items()}
+    if not stats:
+        return
+    method = "tiktoken" if tiktoken is not None else "ước lượng"
+    print(f"   🧮 Token input ({method}):")
+    for label, item in stats.items():
+        print(f"      {label}: {item['requests']} req | avg {item['tokens'] / item['requests']:.0f} "
+              f"max {item['max_tokens']} tokens/req | ✂️ cắt {item['truncated']} lần "
+              f"(bỏ {item['dropped']} tokens nguồn)")
@@ -139,8 +139,8 @@ def check_ai_apis():
         
         # Test OpenAI
         try:
-            result = ai.generate_content("Test ngắn", provider='openai')
-            if result and result.get('title'):
+            result = ai.generate_content("Test ngắn", provider='openai', failover=False)
+            if result and result.get('title') and not result.get('ai_fallback'):
                 print(f"✅ OpenAI API: Hoạt động bình thường")
                 print(f"   Sample title: {result['title'][:50]}...")
             else:
@@ -150,8 +150,8 @@ def check_ai_apis():
         
         # Test Gemini
         try:
-            result = ai.generate_content("Test ngắn", provider='gemini')
-            if result and result.get('title'):
+            result = ai.generate_content("Test ngắn", provider='gemini', failover=False)
+            if result and result.get('title') and not result.get('ai_fallback'):
                 print(f"✅ Gemini API: Hoạt động bình thường")
                 print(f"   Sample title: {result['title'][:50]}...")
             else:
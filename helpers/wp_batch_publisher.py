@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WP BATCH PUBLISHER
+Gộp nhiều thao tác tạo/cập nhật post vào endpoint /wp-json/batch/v1 (WordPress 5.6+)
+
+- Tự phát hiện site có hỗ trợ batch endpoint không (GET /wp-json/)
+- Mỗi batch tối đa 25 sub-requests (đọc maxItems từ site nếu có)
+- Map kết quả từng item về source_id (post_id trong posts_ai)
+- Chỉ retry các item lỗi; site không hỗ trợ batch → gửi từng request
+- Lỗi chắc chắn trước khi server nhận request (không kết nối được, 429) → gửi lại ngay
+  Lỗi mơ hồ (timeout đọc, 5xx, đứt kết nối sau khi gửi) → create có thể đã được commit:
+  tra lại theo slug đã đặt, có thì nhận post đó; create không có slug để tra → không retry (tránh post trùng)
+- Có PublishIndex: item đã publish + nội dung không đổi → skip, đã đổi → update thay vì tạo trùng
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from module_wp_publisher import WordPressPublisher
+from publish_index import PublishIndex, content_hash, source_slug
+from wp_taxonomy_cache import WPTaxonomyCache
+
+DEFAULT_MAX_ITEMS = 25
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+PRE_COMMIT_STATUSES = (408, 429)  # server từ chối trước khi xử lý request
+
+
+def _pre_commit_error(error: Exception) -> bool:
+    """Exception chắc chắn xảy ra trước khi WordPress nhận request (không thể đã tạo post)"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return False
+    return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+
+
+class WPBatchPublisher:
+    """Bulk create/update posts trên 1 site, dựa trên WordPressPublisher"""
+
+    def __init__(self, publisher: WordPressPublisher, max_attempts: int = 3, retry_delay: float = 2.0,
+                 index: Optional[PublishIndex] = None):
+        self.publisher = publisher
+        self.index = index if index is not None else publisher.index
+        self.session = publisher.session
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.batch_url = f"{publisher.wp_url}/wp-json/batch/v1"
+        self._supported: Optional[bool] = None
+        self.max_items = DEFAULT_MAX_ITEMS
+
+    def supports_batch(self) -> bool:
+        """Kiểm tra (1 lần) site có route /batch/v1 không"""
+        if self._supported is not None:
+            return self._supported
+
+        try:
+            response = self.session.get(
+                f"{self.publisher.wp_url}/wp-json/",
+                headers={"Authorization": self.publisher.auth_header},
+                timeout=15
+            )
+            routes = response.json().get("routes", {}) if response.status_code == 200 else {}
+            batch_route = routes.get("/batch/v1")
+            self._supported = batch_route is not None
+
+            if batch_route:
+                for endpoint in batch_route.get("endpoints", []):
+                    max_items = endpoint.get("args", {}).get("requests", {}).get("maxItems")
+                    if max_items:
+                        self.max_items = min(int(max_items), DEFAULT_MAX_ITEMS)
+
+        except Exception as e:
+            print(f"⚠️ [WP BATCH] Không kiểm tra được batch endpoint: {str(e)}")
+            self._supported = False
+
+        print(f"{'✅' if self._supported else 'ℹ️'} [WP BATCH] Batch endpoint: "
+              f"{'supported (max ' + str(self.max_items) + ')' if self._supported else 'not supported, dùng từng request'}")
+        return self._supported
+
+    def create_posts(self, items: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Tạo nhiều post
+        items: [{'source_id': ..., 'content_data': {...}, 'featured_image_id': int|None,
+                 'source_key': str (mặc định "post:<source_id>"), 'version': int (mặc định 1)}, ...]
+        Returns: {source_id: {'success', 'wp_post_id', 'link', 'status', 'error', 'attempts'}}
+        """
+        # Resolve toàn bộ tag/category một lượt trước khi build payload
+        self._warm_taxonomy([item['content_data'] for item in items])
+
+        if self.index:
+            return self._create_indexed(items)
+
+        operations = [
+            {
+                'source_id': item['source_id'],
+                'method': 'POST',
+                'path': '/wp/v2/posts',
+                'build': (lambda item=item: self.publisher._build_post_data(
+                    item['content_data'], item.get('featured_image_id'))),
+            }
+            for item in items
+        ]
+        return self._run(operations)
+
+    def _create_indexed(self, items: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """create_posts có tra publish index: skip / update / create"""
+        site = self.publisher.wp_url
+        skipped, operations = {}, []
+
+        for item in items:
+            key = item.get('source_key') or f"post:{item['source_id']}"
+            version = item.get('version', 1)
+            new_hash = content_hash(item['content_data'])
+            action, entry = self.index.plan(key, site, version, new_hash)
+
+            if action == 'recover':
+                self.index.recover(key, site, version, self.publisher._find_post_by_slug)
+                action, entry = self.index.plan(key, site, version, new_hash)
+                if action == 'recover':
+                    action = 'create'
+
+            if action == 'skip':
+                skipped[item['source_id']] = {
+                    'success': True, 'status': 'skipped', 'wp_post_id': entry['wp_post_id'],
+                    'link': entry['link'], 'error': None, 'attempts': 0,
+                }
+                continue
+
+            op = {
+                'source_id': item['source_id'],
+                'method': 'POST',
+                'index': (key, version, new_hash),
+            }
+            if action == 'update':
+                op['path'] = f"/wp/v2/posts/{entry['wp_post_id']}"
+                op['build'] = (lambda item=item: self.publisher._build_post_data(
+                    item['content_data'], item.get('featured_image_id')))
+            else:
+                slug = source_slug(item['content_data'].get('title', ''), key, version)
+                self.index.reserve(key, site, version, slug, new_hash)
+                op['path'] = '/wp/v2/posts'
+                op['slug'] = slug
+                op['build'] = (lambda item=item, slug=slug: dict(self.publisher._build_post_data(
+                    item['content_data'], item.get('featured_image_id')), slug=slug))
+            operations.append(op)
+
+        if skipped:
+            print(f"⏭️ [WP BATCH] {len(skipped)} item không đổi, skip")
+
+        results = self._run(operations) if operations else {}
+        for op in operations:
+            result = results[op['source_id']]
+            if result['success'] and result.get('wp_post_id'):
+                key, version, new_hash = op['index']
+                self.index.record(key, site, version, result['wp_post_id'], result.get('slug'),
+                                  result.get('link'), new_hash)
+
+        results.update(skipped)
+        return results
+
+    def update_posts(self, items: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Cập nhật nhiều post (vd. re-meta)
+        items: [{'source_id': ..., 'wp_post_id': int, 'update_data': {...}}, ...]
+        """
+        operations = [
+            {
+                'source_id': item['source_id'],
+                'method': 'POST',
+                'path': f"/wp/v2/posts/{item['wp_post_id']}",
+                'build': (lambda item=item: item['update_data']),
+            }
+            for item in items
+        ]
+        return self._run(operations)
+
+    def _warm_taxonomy(self, contents: List[Dict[str, Any]]):
+        tags, categories = [], []
+        for content_data in contents:
+            tags.extend(self.publisher._split_names(content_data.get('tags', [])))
+            categories.extend(self.publisher._split_names(
+                content_data.get('categories') or content_data.get('category') or []))
+
+        try:
+            self.publisher.taxonomy.resolve("tags", tags)
+            self.publisher.taxonomy.resolve("categories", categories)
+        except Exception as e:
+            print(f"⚠️ [WP BATCH] Taxonomy warm-up error: {str(e)}")
+
+    def _run(self, operations: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """Chạy operations, retry riêng các item lỗi"""
+        results = {op['source_id']: {'success': False, 'error': 'not sent', 'attempts': 0} for op in operations}
+        pending = list(operations)
+        use_batch = self.supports_batch()
+
+        for attempt in range(1, self.max_attempts + 1):
+            if not pending:
+                break
+            if attempt > 1:
+                print(f"🔄 [WP BATCH] Retry {len(pending)} item lỗi (lần {attempt})...")
+                time.sleep(self.retry_delay * (2 ** (attempt - 2)))
+
+            if use_batch:
+                for start in range(0, len(pending), self.max_items):
+                    chunk = pending[start:start + self.max_items]
+                    self._send_batch(chunk, results)
+            else:
+                for op in pending:
+                    self._send_single(op, results)
+
+            for op in pending:
+                results[op['source_id']]['attempts'] = attempt
+            pending = [op for op in pending if results[op['source_id']].get('retryable')]
+            if pending and attempt < self.max_attempts:
+                pending = self._resolve_ambiguous(pending, results)
+
+        success = sum(1 for result in results.values() if result['success'])
+        print(f"📊 [WP BATCH] {success}/{len(operations)} thành công")
+        return results
+
+    def _resolve_ambiguous(self, pending: List[Dict[str, Any]],
+                           results: Dict[Any, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Create lỗi mơ hồ có thể đã được WordPress commit → tra theo slug đã đặt trước khi gửi lại
+        Tìm thấy → nhận post đó (không retry); không slug để tra → bỏ retry
+        Returns: các op còn cần gửi lại
+        """
+        remaining = []
+        for op in pending:
+            result = results[op['source_id']]
+            if op['path'] != '/wp/v2/posts' or not result.get('ambiguous'):
+                remaining.append(op)
+                continue
+
+            if not op.get('slug'):
+                result.update({'retryable': False,
+                               'error': f"{result['error']} (có thể đã tạo post, không retry)"})
+                continue
+
+            found = self.publisher._find_post_by_slug(op['slug'])
+            if found and found.get('slug') == op['slug']:
+                print(f"♻️ [WP BATCH] {op['source_id']}: post đã được tạo (ID {found['id']}), không gửi lại")
+                result.update({
+                    'success': True, 'status': 'recovered', 'wp_post_id': found['id'],
+                    'link': found.get('link'), 'slug': found['slug'], 'error': None,
+                    'retryable': False, 'ambiguous': False,
+                })
+            else:
+                remaining.append(op)
+        return remaining
+
+    def _send_batch(self, chunk: List[Dict[str, Any]], results: Dict[Any, Dict[str, Any]]):
+        """Gửi 1 batch; response[i] ứng với chunk[i]"""
+        payload = {
+            "validation": "normal",
+            "requests": [
+                {"method": op['method'], "path": op['path'], "body": op['build']()}
+                for op in chunk
+            ]
+        }
+
+        try:
+            response = self.session.post(
+                self.batch_url,
+                headers={"Authorization": self.publisher.auth_header, "Content-Type": "application/json"},
+                json=payload,
+                timeout=120
+            )
+            body = response.json() if response.content else {}
+            responses = body.get("responses") if isinstance(body, dict) else None
+
+            if not responses or len(responses) != len(chunk):
+                # Cả batch lỗi (5xx, timeout phía server, ...) → retry toàn bộ chunk
+                for op in chunk:
+                    results[op['source_id']].update({
+                        'success': False,
+                        'status': response.status_code,
+                        'error': f"batch failed: {response.status_code}",
+                        'retryable': response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES,
+                        'ambiguous': response.status_code not in PRE_COMMIT_STATUSES,
+                    })
+                return
+
+            term_error = False
+            for op, item in zip(chunk, responses):
+                self._record(op, item.get('status', 0), item.get('body') or {}, results)
+                if WPTaxonomyCache.is_term_error_body(item.get('status', 0), item.get('body') or {}):
+                    term_error = True
+
+            if term_error:
+                self.publisher.taxonomy.invalidate()
+
+        except Exception as e:
+            for op in chunk:
+                results[op['source_id']].update({'success': False, 'error': str(e), 'retryable': True,
+                                                 'ambiguous': not _pre_commit_error(e)})
+
+    def _send_single(self, op: Dict[str, Any], results: Dict[Any, Dict[str, Any]]):
+        """Fallback khi site không hỗ trợ batch"""
+        try:
+            response = self.session.post(
+                f"{self.publisher.wp_url}/wp-json{op['path']}",
+                headers={"Authorization": self.publisher.auth_header, "Content-Type": "application/json"},
+                json=op['build'](),
+                timeout=30
+            )
+            body = response.json() if response.content else {}
+            self._record(op, response.status_code, body if isinstance(body, dict) else {}, results)
+
+            if WPTaxonomyCache.is_term_error(response):
+                self.publisher.taxonomy.invalidate()
+
+        except Exception as e:
+            results[op['source_id']].update({'success': False, 'error': str(e), 'retryable': True,
+                                             'ambiguous': not _pre_commit_error(e)})
+
+    def _record(self, op: Dict[str, Any], status: int, body: Dict[str, Any], results: Dict[Any, Dict[str, Any]]):
+        """Ghi kết quả 1 item vào results[source_id]"""
+        if 200 <= status < 300:
+            results[op['source_id']].update({
+                'success': True,
+                'status': status,
+                'wp_post_id': body.get('id'),
+                'link': body.get('link'),
+                'slug': body.get('slug'),
+                'error': None,
+                'retryable': False,
+                'ambiguous': False,
+            })
+        else:
+            results[op['source_id']].update({
+                'success': False,
+                'status': status,
+                'error': body.get('message') or body.get('code') or f"HTTP {status}",
+                # Term ID cũ: sau khi invalidate cache, build lại payload là sửa được
+                'retryable': status in RETRYABLE_STATUSES or WPTaxonomyCache.is_term_error_body(status, body),
+                'ambiguous': status >= 500,
+            })
+
+
+def posts_ai_to_content(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Chuyển 1 row posts_ai thành content_data cho WordPressPublisher"""
+    return {
+        'title': row.get('title', ''),
+        'content': row.get('ai_content', ''),
+        'meta_title': row.get('meta_title', ''),
+        'meta_desc': row.get('meta_description', ''),
+        'tags': row.get('tags', ''),
+        'category': row.get('category', ''),
+    }
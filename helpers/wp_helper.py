@@ -1,3 +1,4 @@
+import os
 import requests
 import json
 import time
@@ -5,6 +6,11 @@ import base64
 from urllib.parse import urljoin
 from typing import Optional, Dict, Any, List
 from config import Config
+from http_helper import RETRY_STATUSES, create_session
+from image_optimizer import get_optimizer
+from image_spool import get_spool
+from media_index import MediaIndex
+from publish_index import PublishIndex, content_hash, source_slug
 
 class WPHelper:
     """Lớp xử lý WordPress REST API"""
@@ -12,8 +18,13 @@ class WPHelper:
     def __init__(self):
         self.base_url = Config.WP_API_URL
         self.auth = (Config.WP_USERNAME, Config.WP_PASSWORD)
-        self.session = requests.Session()
+        self.session = create_session()
         self.session.auth = self.auth
+        # Site URL (bỏ /wp-json/...) làm key cho media index
+        self.site_url = self.base_url.split('/wp-json')[0]
+        self.media_index = MediaIndex()
+        self.index = PublishIndex()
+        self.optimizer = get_optimizer()
         
         # Test kết nối
         self._test_connection()
@@ -31,7 +42,8 @@ class WPHelper:
         except Exception as e:
             print(f"❌ Lỗi kết nối WordPress: {str(e)}")
     
-    def create_post(self, title: str, content: str, status: str = 'draft') -> Optional[Dict[str, Any]]:
+    def create_post(self, title: str, content: str, status: str = 'draft',
+                    slug: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Tạo bài viết mới trên WordPress
         
@@ -39,6 +51,7 @@ class WPHelper:
             title: Tiêu đề bài viết
             content: Nội dung bài viết (HTML)
             status: Trạng thái bài viết ('draft', 'publish', 'private')
+            slug: Slug cố định (đã ghi trong publish index để tìm lại khi run bị ngắt)
         
         Returns:
             Dict chứa thông tin bài viết đã tạo hoặc None nếu lỗi
@@ -50,6 +63,8 @@ class WPHelper:
                 'status': status,
                 'format': 'standard'
             }
+            if slug:
+                post_data['slug'] = slug
             
             response = self.session.post(
                 f"{self.base_url}/posts",
@@ -82,9 +97,10 @@ class WPHelper:
             Dict chứa thông tin ảnh đã upload hoặc None nếu lỗi
         """
         try:
-            # Download ảnh từ URL
-            img_response = requests.get(image_url, timeout=30)
-            if img_response.status_code != 200:
+            # Download (stream) về spool trên disk; retry/lần gọi sau dùng lại file, không tải lại
+            spool = get_spool()
+            image_path = spool.fetch(image_url)
+            if not image_path:
                 print(f"❌ Không tải được ảnh từ URL: {image_url}")
                 return None
             
@@ -92,24 +108,50 @@ class WPHelper:
             if not filename:
                 filename = f"ai_generated_{int(time.time())}.png"
             
-            # Chuẩn bị data để upload
-            files = {
-                'file': (filename, img_response.content, 'image/png')
-            }
+            # Resize + re-encode (WebP/JPEG) trong process pool
+            mime_type = spool.mime_type(image_path)
+            if self.optimizer:
+                optimized = self.optimizer.optimize_file(image_path, filename)
+                image_path, mime_type, filename = optimized['path'], optimized['mime'], optimized['filename']
+            
+            # Ảnh đã upload lên site này (cùng SHA-256) → dùng lại
+            digest = spool.digest(image_path)
+            size = os.path.getsize(image_path)
+            existing = self.media_index.find(self.site_url, digest, size, verify=self._get_media)
+            if existing:
+                print(f"♻️ Dùng lại ảnh đã upload: {existing['source_url']}")
+                return {'id': existing['media_id'], 'source_url': existing['source_url']}
             
             headers = {
+                'Content-Type': mime_type,
+                'Content-Length': str(size),
                 'Content-Disposition': f'attachment; filename="{filename}"'
             }
             
-            # Upload lên WordPress
-            response = self.session.post(
-                f"{self.base_url}/media",
-                files=files,
-                headers=headers
-            )
+            # Upload lên WordPress: raw body stream từ file handle (không dựng multipart trong RAM)
+            for attempt in range(Config.HTTP_MAX_RETRIES + 1):
+                if attempt:
+                    time.sleep(Config.HTTP_BACKOFF_FACTOR * (2 ** (attempt - 1)))
+                upload_start = time.time()
+                try:
+                    with open(image_path, 'rb') as image_file:
+                        response = self.session.post(
+                            f"{self.base_url}/media",
+                            data=image_file,
+                            headers=headers
+                        )
+                except requests.ConnectionError:
+                    if attempt == Config.HTTP_MAX_RETRIES:
+                        raise
+                    continue
+                if response.status_code not in RETRY_STATUSES:
+                    break
+            if self.optimizer and response.status_code == 201:
+                self.optimizer.record_upload(size, time.time() - upload_start)
             
             if response.status_code == 201:
                 media_info = response.json()
+                self.media_index.record(self.site_url, digest, media_info['id'], media_info['source_url'])
                 print(f"✅ Đã upload ảnh: {media_info['source_url']}")
                 return media_info
             else:
@@ -120,6 +162,14 @@ class WPHelper:
             print(f"❌ Exception upload ảnh: {str(e)}")
             return None
     
+    def _get_media(self, media_id: int) -> Optional[Dict[str, Any]]:
+        """GET media/{id}; None nếu media không còn trên site"""
+        response = self.session.get(f"{self.base_url}/media/{media_id}", params={'_fields': 'id,source_url'})
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+    
     def set_featured_image(self, post_id: int, media_id: int) -> bool:
         """
         Đặt ảnh featured cho bài viết
@@ -225,18 +275,90 @@ class WPHelper:
             print(f"❌ Exception publish bài viết: {str(e)}")
             return False
     
+    def update_post(self, post_id: int, title: str, content: str) -> Optional[Dict[str, Any]]:
+        """Cập nhật title + content của bài đã có (giữ nguyên status)"""
+        try:
+            response = self.session.post(
+                f"{self.base_url}/posts/{post_id}",
+                json={'title': title, 'content': content},
+                headers={'Content-Type': 'application/json'}
+            )
+            if response.status_code == 200:
+                post_info = response.json()
+                print(f"♻️ Đã cập nhật bài viết: {post_info['link']}")
+                return post_info
+            print(f"❌ Lỗi cập nhật bài viết {post_id}: {response.status_code} - {response.text}")
+            return None
+        except Exception as e:
+            print(f"❌ Exception cập nhật bài viết: {str(e)}")
+            return None
+    
+    def _find_post_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Tìm post theo slug chính xác (mọi status)"""
+        try:
+            response = self.session.get(
+                f"{self.base_url}/posts",
+                params={
+                    'slug': slug,
+                    'status': 'publish,future,draft,pending,private',
+                    '_fields': 'id,slug,link'
+                },
+                timeout=10
+            )
+            if response.status_code == 200 and response.json():
+                return response.json()[0]
+        except Exception as e:
+            print(f"⚠️ Lỗi tìm bài viết theo slug: {str(e)}")
+        return None
+    
+    def _plan_indexed(self, source_key: str, new_hash: str):
+        """
+        Tra publish index cho source_key (recover theo slug nếu run trước chết giữa create và ghi index)
+        Returns: (action ∈ {'create', 'update', 'skip'}, entry)
+        """
+        action, entry = self.index.plan(source_key, self.site_url, 1, new_hash)
+        if action == 'recover':
+            found = self.index.recover(source_key, self.site_url, 1, self._find_post_by_slug)
+            if not found:
+                return 'create', entry
+            print(f"♻️ Tìm lại {source_key} → post ID {found['id']}")
+            entry = self.index.get(source_key, self.site_url, 1)
+            action = 'skip' if entry['content_hash'] == new_hash else 'update'
+        return action, entry
+    
     def process_complete_post(self, title: str, content: str, image_url: str = None, 
                             meta_title: str = None, meta_description: str = None,
-                            auto_publish: bool = False) -> Optional[Dict[str, Any]]:
+                            auto_publish: bool = False,
+                            source_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Xử lý hoàn chỉnh một bài viết: tạo post, upload ảnh, set meta, publish
+        source_key (vd. "sheet:<id>:5"): tra publish index trước khi tạo → chạy lại row đã đăng
+        thì skip (nội dung không đổi) / update bài cũ thay vì đăng trùng
         
         Returns:
             Dict chứa thông tin bài viết hoàn chỉnh hoặc None nếu lỗi
         """
         try:
-            # 1. Tạo bài viết draft
-            post_info = self.create_post(title, content, 'draft')
+            new_hash = content_hash({'title': title, 'content': content,
+                                     'meta_title': meta_title, 'meta_desc': meta_description})
+            action, entry, slug = 'create', None, None
+            if source_key:
+                action, entry = self._plan_indexed(source_key, new_hash)
+            
+            if action == 'skip':
+                print(f"⏭️ {source_key} không đổi, skip: {entry['link']}")
+                return {'post_id': entry['wp_post_id'], 'post_url': entry['link'],
+                        'title': title, 'status': 'skipped'}
+            
+            # 1. Tạo bài viết draft (hoặc cập nhật bài đã đăng của source_key)
+            if action == 'update':
+                post_info = self.update_post(entry['wp_post_id'], title, content)
+            else:
+                if source_key:
+                    # Ghi 'pending' + slug TRƯỚC khi create → run sau tìm lại được nếu chết giữa chừng
+                    slug = source_slug(title, source_key)
+                    self.index.reserve(source_key, self.site_url, 1, slug, new_hash)
+                post_info = self.create_post(title, content, 'draft', slug=slug)
             if not post_info:
                 return None
             
@@ -269,7 +391,11 @@ class WPHelper:
                 else:
                     result['status'] = 'draft'
             else:
-                result['status'] = 'draft'
+                result['status'] = post_info.get('status', 'draft')
+            
+            if source_key:
+                self.index.record(source_key, self.site_url, 1, post_id,
+                                  post_info.get('slug'), post_info['link'], new_hash)
             
             print(f"✅ Hoàn thành xử lý bài viết: {title}")
             return result
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WP STUB SERVER
+WordPress REST API giả lập (stdlib) để benchmark/test publisher mà không cần site thật
+
+Hỗ trợ: users/me, tags, categories, media, posts (tạo/cập nhật/đọc), batch/v1
+- latency: thời gian xử lý mỗi request (giây)
+- workers: số request xử lý song song tối đa (giống PHP-FPM workers trên shared hosting)
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/wp-json/wp/v2/"
+BATCH_PATH = "/wp-json/batch/v1"
+BATCH_MAX_ITEMS = 25
+
+
+class WPStubState:
+    """Dữ liệu in-memory của stub"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_id = 1000
+        self.terms = {"tags": {}, "categories": {1: "Uncategorized"}}
+        self.posts: Dict[int, Dict[str, Any]] = {}
+        self.media: Dict[int, int] = {}
+        self.request_count = 0
+
+    def new_id(self) -> int:
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "WPStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- helpers ----
+    def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self) -> Dict[str, Any]:
+        raw = self._read_body()
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _handle(self, method: str):
+        stub = self.server.stub
+        with stub.workers:
+            if stub.latency:
+                time.sleep(stub.latency)
+            with stub.state.lock:
+                stub.state.request_count += 1
+
+            parsed = urlparse(self.path)
+            if parsed.path.rstrip("/") == "/wp-json" and method == "GET":
+                self._send(200, stub.index())
+                return
+            if parsed.path.rstrip("/") == BATCH_PATH and method == "POST" and stub.batch_enabled:
+                status, payload = stub.dispatch_batch(self._read_json())
+                self._send(status, payload)
+                return
+            if not parsed.path.startswith(API_PREFIX):
+                self._send(404, {"code": "rest_no_route"})
+                return
+
+            route = parsed.path[len(API_PREFIX):].strip("/")
+            query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            body = self._read_json() if method == "POST" and route != "media" else {}
+            if route == "media":
+                self._read_body()
+
+            status, payload, headers = stub.dispatch(method, route, query, body)
+            self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class WPStubServer:
+    """Chạy stub trong background thread"""
+
+    def __init__(self, latency: float = 0.05, workers: int = 8, port: int = 0,
+                 batch_enabled: bool = True):
+        self.latency = latency
+        self.batch_enabled = batch_enabled
+        self.workers = threading.BoundedSemaphore(workers)
+        self.state = WPStubState()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "WPStubServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def index(self) -> Dict[str, Any]:
+        """GET /wp-json/ - chỉ trả phần routes mà client cần"""
+        routes = {"/wp/v2/posts": {"methods": ["GET", "POST"]}}
+        if self.batch_enabled:
+            routes["/batch/v1"] = {
+                "methods": ["POST"],
+                "endpoints": [{"methods": ["POST"], "args": {"requests": {"maxItems": BATCH_MAX_ITEMS}}}],
+            }
+        return {"name": "WP Stub", "routes": routes}
+
+    def dispatch_batch(self, payload: Dict[str, Any]):
+        """POST /wp-json/batch/v1 - xử lý lần lượt các sub-request (validation=normal)"""
+        sub_requests = payload.get("requests", [])
+        if len(sub_requests) > BATCH_MAX_ITEMS:
+            return 400, {"code": "rest_batch_max_requests", "data": {"status": 400}}
+
+        responses = []
+        for sub in sub_requests:
+            path = urlparse(sub.get("path", "")).path
+            route = path[len("/wp/v2/"):].strip("/") if path.startswith("/wp/v2/") else ""
+            status, body, headers = self.dispatch(sub.get("method", "POST"), route, {}, sub.get("body") or {})
+            responses.append({"body": body, "status": status, "headers": headers})
+        return 207, {"responses": responses}
+
+    def dispatch(self, method: str, route: str, query: Dict[str, str], body: Dict[str, Any]):
+        """Xử lý 1 request REST; trả về (status, payload, headers)"""
+        state = self.state
+
+        if route == "users/me":
+            return 200, {"id": 1, "name": "WP Stub"}, {}
+
+        if route in ("tags", "categories"):
+            terms = state.terms[route]
+            if method == "GET":
+                per_page = int(query.get("per_page", 10))
+                page = int(query.get("page", 1))
+                items = [{"id": term_id, "name": name, "slug": name.lower().replace(" ", "-")}
+                         for term_id, name in sorted(terms.items())]
+                total_pages = max(1, -(-len(items) // per_page))
+                chunk = items[(page - 1) * per_page: page * per_page]
+                return 200, chunk, {"X-WP-Total": str(len(items)), "X-WP-TotalPages": str(total_pages)}
+
+            name = body.get("name", "")
+            with state.lock:
+                for term_id, existing in terms.items():
+                    if existing.lower() == name.lower():
+                        return 400, {"code": "term_exists", "data": {"status": 400, "term_id": term_id}}, {}
+            term_id = state.new_id()
+            with state.lock:
+                terms[term_id] = name
+            return 201, {"id": term_id, "name": name}, {}
+
+        if route == "media" and method == "POST":
+            media_id = state.new_id()
+            with state.lock:
+                state.media[media_id] = media_id
+            return 201, {"id": media_id, "source_url": f"{self.url}/uploads/{media_id}.jpg"}, {}
+
+        if route == "posts" and method == "GET":
+            with state.lock:
+                items = [post for post in state.posts.values()
+                         if not query.get("slug") or post.get("slug") == query["slug"]]
+            return 200, items[:int(query.get("per_page", 10))], {"X-WP-Total": str(len(items))}
+
+        if route == "posts" and method == "POST":
+            post_id = state.new_id()
+            post = dict(body, id=post_id, link=f"{self.url}/?p={post_id}")
+            with state.lock:
+                state.posts[post_id] = post
+            return 201, post, {}
+
+        match = re.fullmatch(r"(posts|media)/(\d+)", route)
+        if match:
+            kind, item_id = match.group(1), int(match.group(2))
+            store = state.posts if kind == "posts" else state.media
+            if item_id not in store:
+                return 404, {"code": "rest_post_invalid_id"}, {}
+            if kind == "posts" and method == "POST":
+                with state.lock:
+                    store[item_id].update(body)
+            item = store[item_id]
+            return 200, item if isinstance(item, dict) else {"id": item_id}, {}
+
+        return 404, {"code": "rest_no_route"}, {}
+
+
+if __name__ == "__main__":
+    with WPStubServer() as server:
+        print(f"🧪 WP stub đang chạy tại {server.url} (Ctrl+C để dừng)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WP TAXONOMY CACHE
+Cache tag/category name → ID cho từng site WordPress
+
+- Preload toàn bộ tags + categories (phân trang per_page=100) khi khởi động
+- Resolve tên ở local (đã normalize), chỉ gọi API để tạo term còn thiếu
+- Lưu map name → id xuống disk để dùng lại giữa các lần chạy
+- Invalidate khi WordPress trả lỗi 4xx liên quan tới term
+"""
+
+import html
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from config import Config
+
+
+class WPTaxonomyCache:
+    """Cache name → ID cho tags và categories của một site"""
+
+    TAXONOMIES = ("tags", "categories")
+    PER_PAGE = 100
+
+    def __init__(
+        self,
+        site_url: str,
+        api_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        http: Any = None,
+        cache_dir: Optional[str] = None,
+        ttl: Optional[int] = None,
+    ):
+        self.site_url = site_url.rstrip("/")
+        self.api_url = api_url if api_url.endswith("/") else f"{api_url}/"
+        self.headers = headers or {}
+        self.http = http or requests
+        self.ttl = Config.WP_TAXONOMY_TTL if ttl is None else ttl
+
+        site_key = re.sub(r"[^a-z0-9]+", "_", urlparse(self.site_url).netloc.lower())
+        self.cache_file = Path(cache_dir or Config.CACHE_DIR) / f"wp_taxonomy_{site_key or 'default'}.json"
+
+        self._terms: Dict[str, Dict[str, int]] = {tax: {} for tax in self.TAXONOMIES}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def normalize_name(name: Any) -> str:
+        """Normalize tên term: bỏ HTML entity, NFKC, lowercase, gộp khoảng trắng"""
+        text = html.unescape(str(name or ""))
+        text = unicodedata.normalize("NFKC", text).casefold()
+        return re.sub(r"\s+", " ", text).strip()
+
+    def load(self, force_refresh: bool = False):
+        """Load cache từ disk nếu còn hạn, ngược lại preload từ WordPress"""
+        with self._lock:
+            if not force_refresh and self.load_cached():
+                return
+
+            self.preload()
+
+    def load_cached(self) -> bool:
+        """Chỉ load từ disk (không gọi API); True nếu cache còn hạn"""
+        with self._lock:
+            if self._load_from_disk():
+                self._loaded = True
+            return self._loaded
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def set_terms(self, taxonomy: str, mapping: Dict[str, int]):
+        """Thay toàn bộ map của một taxonomy (dùng khi preload từ client khác, vd. async)"""
+        with self._lock:
+            self._terms[taxonomy] = dict(mapping)
+            self._loaded = True
+
+    def remember(self, taxonomy: str, name: Any, term_id: int):
+        """Ghi nhận term vừa tạo/tìm thấy ở nơi khác"""
+        with self._lock:
+            self._terms[taxonomy][self.normalize_name(name)] = term_id
+
+    def preload(self):
+        """Lấy toàn bộ tags + categories từ WordPress (phân trang)"""
+        with self._lock:
+            terms = {}
+            for taxonomy in self.TAXONOMIES:
+                terms[taxonomy] = self._fetch_all(taxonomy)
+
+            self._terms = terms
+            self._loaded = True
+            self.save()
+
+            print(
+                f"✅ [TAXONOMY CACHE] Preloaded {len(set(terms['tags'].values()))} tags, "
+                f"{len(set(terms['categories'].values()))} categories"
+            )
+
+    def _fetch_all(self, taxonomy: str) -> Dict[str, int]:
+        """Duyệt tất cả các trang của một taxonomy"""
+        mapping = {}
+        page = 1
+        total_pages = 1
+
+        while page <= total_pages:
+            response = self.http.get(
+                f"{self.api_url}{taxonomy}",
+                headers=self.headers,
+                params={
+                    "per_page": self.PER_PAGE,
+                    "page": page,
+                    "hide_empty": "false",
+                    "_fields": "id,name,slug",
+                },
+                timeout=30,
+            )
+
+            if response.status_code != 200:
+                print(f"⚠️ [TAXONOMY CACHE] List {taxonomy} page {page} failed: {response.status_code}")
+                break
+
+            self.add_listing(mapping, response.json())
+
+            total_pages = int(response.headers.get("X-WP-TotalPages", 1) or 1)
+            page += 1
+
+        return mapping
+
+    @classmethod
+    def add_listing(cls, mapping: Dict[str, int], terms: List[Dict[str, Any]]):
+        """Thêm một trang kết quả GET /tags|/categories vào map (theo name và slug)"""
+        for term in terms:
+            mapping[cls.normalize_name(term["name"])] = term["id"]
+            if term.get("slug"):
+                mapping.setdefault(cls.normalize_name(term["slug"]), term["id"])
+
+    def _load_from_disk(self) -> bool:
+        """Đọc cache file; False nếu không có, hỏng hoặc đã hết hạn"""
+        try:
+            if not self.cache_file.exists():
+                return False
+
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            if data.get("site_url") != self.site_url:
+                return False
+            if self.ttl and time.time() - data.get("saved_at", 0) > self.ttl:
+                return False
+
+            self._terms = {tax: dict(data.get("terms", {}).get(tax, {})) for tax in self.TAXONOMIES}
+            return True
+
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [TAXONOMY CACHE] Không đọc được cache: {str(e)}")
+            return False
+
+    def save(self):
+        """Ghi cache xuống disk (atomic: ghi file tạm rồi rename)"""
+        with self._lock:
+            try:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = self.cache_file.with_suffix(".tmp")
+
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {"site_url": self.site_url, "saved_at": time.time(), "terms": self._terms},
+                        f,
+                        ensure_ascii=False,
+                    )
+
+                os.replace(tmp_file, self.cache_file)
+
+            except OSError as e:
+                print(f"⚠️ [TAXONOMY CACHE] Không ghi được cache: {str(e)}")
+
+    def invalidate(self):
+        """Xóa cache (memory + disk), lần resolve sau sẽ preload lại"""
+        with self._lock:
+            self._terms = {tax: {} for tax in self.TAXONOMIES}
+            self._loaded = False
+            try:
+                self.cache_file.unlink()
+            except FileNotFoundError:
+                pass
+            print("🔄 [TAXONOMY CACHE] Cache invalidated")
+
+    def resolve(self, taxonomy: str, names: Iterable[Any], create_missing: bool = True,
+                autoload: bool = True) -> List[int]:
+        """
+        Chuyển danh sách tên thành IDs (giữ thứ tự, bỏ trùng)
+        Term chưa có sẽ được tạo một lượt cho cả danh sách
+        autoload=False: chưa load thì không gọi load() (sync) - caller async tự preload trước
+        """
+        if taxonomy not in self.TAXONOMIES:
+            raise ValueError(f"Unknown taxonomy: {taxonomy}")
+
+        with self._lock:
+            if not self._loaded and autoload:
+                self.load()
+
+            names = list(names)
+            missing = self.missing(taxonomy, names)
+            if missing and create_missing:
+                self._create_terms(taxonomy, missing)
+
+            ids = []
+            for name in names:
+                term_id = self._terms[taxonomy].get(self.normalize_name(name))
+                if term_id and term_id not in ids:
+                    ids.append(term_id)
+            return ids
+
+    def missing(self, taxonomy: str, names: Iterable[Any]) -> List[str]:
+        """Các tên (đã bỏ trùng) chưa có ID trong cache"""
+        with self._lock:
+            wanted = {}
+            for name in names:
+                key = self.normalize_name(name)
+                if key and key not in wanted:
+                    wanted[key] = str(name).strip()
+
+            return [wanted[key] for key in wanted if key not in self._terms[taxonomy]]
+
+    def _create_terms(self, taxonomy: str, names: List[str]):
+        """Tạo các term còn thiếu, ghi cache một lần ở cuối"""
+        created = 0
+        for name in names:
+            try:
+                response = self.http.post(
+                    f"{self.api_url}{taxonomy}",
+                    headers={**self.headers, "Content-Type": "application/json"},
+                    json={"name": name},
+                    timeout=10,
+                )
+
+                if response.status_code == 201:
+                    self.remember(taxonomy, name, response.json()["id"])
+                    created += 1
+                    continue
+
+                body = self._json_or_empty(response)
+                if body.get("code") == "term_exists":
+                    # Term đã có trên site nhưng cache chưa biết (vd. tạo từ process khác)
+                    self.remember(taxonomy, name, body["data"]["term_id"])
+                else:
+                    # Vd. 403 (user không có quyền tạo term): chỉ bỏ term này, giữ cache cho các term khác
+                    print(f"❌ [TAXONOMY CACHE] Create {taxonomy[:-1]} '{name}' failed: {response.status_code}"
+                          f" {body.get('code', '')}, skip")
+
+            except Exception as e:
+                print(f"❌ [TAXONOMY CACHE] Create {taxonomy[:-1]} '{name}' error: {str(e)}")
+
+        if created:
+            print(f"✅ [TAXONOMY CACHE] Created {created} {taxonomy}")
+        self.save()
+
+    @staticmethod
+    def _json_or_empty(response) -> Dict[str, Any]:
+        try:
+            body = response.json()
+            return body if isinstance(body, dict) else {}
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def is_term_error(response) -> bool:
+        """Response 4xx do tag/category ID không hợp lệ?"""
+        return WPTaxonomyCache.is_term_error_body(response.status_code, WPTaxonomyCache._json_or_empty(response))
+
+    @staticmethod
+    def is_term_error_body(status: int, body: Dict[str, Any]) -> bool:
+        """Như is_term_error, cho status + body đã parse (vd. sub-response của batch)"""
+        if not 400 <= status < 500:
+            return False
+
+        params = body.get("data", {}).get("params", {}) if isinstance(body.get("data"), dict) else {}
+        return body.get("code") in ("rest_term_invalid", "term_exists") or any(
+            key in params for key in WPTaxonomyCache.TAXONOMIES
+        )
@@ -14,6 +14,8 @@ import sys
 from datetime import datetime
 from pathlib import Path
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers"))
+
 
 def print_header():
     """Print header"""
@@ -312,6 +314,24 @@ Yêu cầu output dạng JSON:
     return True
 
 
+def ask_prompt_variables(user_prompt: str) -> dict:
+    """Hỏi giá trị mặc định cho các placeholder riêng ({keyword}...) - registry bỏ qua file thiếu"""
+    from string import Formatter
+
+    from prompt_registry import BUILTIN_VARIABLES
+
+    try:
+        fields = [field for _, field, _, _ in Formatter().parse(user_prompt) if field]
+    except ValueError:
+        return {}
+
+    variables = {}
+    for field in dict.fromkeys(fields):
+        if field not in BUILTIN_VARIABLES:
+            variables[field] = input(f"Giá trị mặc định cho {{{field}}}: ").strip()
+    return variables
+
+
 def add_edit_prompt():
     """Thêm/sửa custom prompt"""
     print("\n🎨 THÊM/SỬA CUSTOM PROMPT")
@@ -322,6 +342,7 @@ def add_edit_prompt():
         "1": {
             "name": "SEO Content Optimizer",
             "prompt": "Tối ưu SEO cho bài viết này với focus keyword: {keyword}",
+            "variables": {"keyword": "casino"},
             "output": {
                 "optimized_content": "Content đã tối ưu",
                 "seo_score": "Điểm SEO",
@@ -366,6 +387,7 @@ def add_edit_prompt():
             "system_role": "Bạn là chuyên gia content marketing chuyên nghiệp",
             "user_prompt": template["prompt"],
             "output_format": template["output"],
+            "variables": template.get("variables", {}),
             "model": "gpt-3.5-turbo",
             "max_tokens": 2000,
             "temperature": 0.7,
@@ -381,6 +403,7 @@ def add_edit_prompt():
         name = input("Tên prompt: ").strip()
         system_role = input("System role (AI sẽ đóng vai gì): ").strip()
         user_prompt = input("User prompt (yêu cầu cụ thể): ").strip()
+        variables = ask_prompt_variables(user_prompt)
 
         print("\n📊 OUTPUT FORMAT:")
         print("Nhập các fields bạn muốn AI trả về (cách nhau bởi dấu phẩy):")
@@ -403,6 +426,7 @@ def add_edit_prompt():
             "system_role": system_role,
             "user_prompt": user_prompt,
             "output_format": output_format,
+            "variables": variables,
             "model": "gpt-3.5-turbo",
             "max_tokens": 2000,
             "temperature": 0.7,
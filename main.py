@@ -11,7 +11,6 @@ import sys
 import time
 import traceback
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional
 from tqdm import tqdm
 
@@ -21,6 +20,12 @@ from sheets_helper import SheetsHelper
 from mysql_helper import MySQLHelper
 from ai_helper import AIHelper
 from wp_helper import WPHelper
+from adaptive_concurrency import get_limiter, print_limiter_stats, status_line
+from retry_policy import print_retry_stats
+from ai_gateway import ENDPOINTS, print_gateway_stats
+from http_helper import print_connection_stats
+from image_optimizer import print_image_stats
+from rate_scheduler import RateScheduler
 
 class WordPressAutomation:
     """Lớp chính điều phối toàn bộ workflow"""
@@ -84,6 +89,9 @@ class WordPressAutomation:
             
             if not ai_result or 'title' not in ai_result:
                 raise Exception("AI không sinh được content hợp lệ")
+            if ai_result.get('ai_fallback'):
+                # Hết retry → không đăng nội dung báo lỗi lên WordPress
+                raise Exception(f"AI lỗi sau khi retry: {ai_result['content']}")
             
             title = ai_result['title']
             content = ai_result['content']
@@ -109,7 +117,9 @@ class WordPressAutomation:
                 image_url=image_url,
                 meta_title=meta_title,
                 meta_description=meta_desc,
-                auto_publish=False  # Tạo draft trước
+                auto_publish=False,  # Tạo draft trước
+                # Crash giữa publish và update_row_status → chạy lại row không đăng trùng
+                source_key=f"sheet:{Config.GOOGLE_SHEET_ID}:{row_number}"
             )
             
             if not wp_result:
@@ -181,62 +191,35 @@ class WordPressAutomation:
         # Bắt đầu xử lý
         start_time = time.time()
         
-        if concurrent and len(pending_rows) > 1:
-            # Xử lý đồng thời với ThreadPoolExecutor
-            print(f"⚡ Xử lý đồng thời với {Config.CONCURRENT_REQUESTS} threads...")
-            
-            with ThreadPoolExecutor(max_workers=Config.CONCURRENT_REQUESTS) as executor:
-                # Submit tất cả tasks
-                future_to_row = {
-                    executor.submit(self.process_single_row, row): row 
-                    for row in pending_rows
-                }
+        # Scheduler: submit theo REQUEST_RATE, tối đa `concurrency` hàng đang chạy,
+        # nhận kết quả ngay khi xong (không sleep ở vòng nhận)
+        concurrency = Config.CONCURRENT_REQUESTS if concurrent and len(pending_rows) > 1 else 1
+        self.scheduler = RateScheduler(self.process_single_row, concurrency=concurrency)
+        # AIMD limiter của provider text (bottleneck mỗi hàng) điều khiển số hàng in-flight trong lúc chạy
+        limiter = None
+        if concurrency > 1 and Config.ADAPTIVE_CONCURRENCY:
+            limiter = get_limiter(ENDPOINTS.get(Config.DEFAULT_AI_PROVIDER, Config.DEFAULT_AI_PROVIDER))
+        rate_info = f"{Config.REQUEST_RATE:.2f} hàng/giây" if Config.REQUEST_RATE else "không giới hạn rate"
+        print(f"⚡ Xử lý với tối đa {concurrency} hàng đồng thời, {rate_info}...")
+        
+        with tqdm(total=len(pending_rows), desc="Xử lý bài viết") as pbar:
+            for row, result, error in self.scheduler.run(pending_rows):
+                if error:
+                    print(f"❌ Exception khi xử lý hàng {row.get('row_number')}: {str(error)}")
+                    stats['error'] += 1
+                elif result['success']:
+                    stats['success'] += 1
+                else:
+                    stats['error'] += 1
                 
-                # Theo dõi tiến trình với tqdm
-                with tqdm(total=len(pending_rows), desc="Xử lý bài viết") as pbar:
-                    for future in as_completed(future_to_row):
-                        try:
-                            result = future.result()
-                            
-                            if result['success']:
-                                stats['success'] += 1
-                            else:
-                                stats['error'] += 1
-                            
-                            stats['results'].append(result)
-                            pbar.update(1)
-                            
-                            # Delay nhỏ giữa các request
-                            time.sleep(Config.REQUEST_DELAY)
-                            
-                        except Exception as e:
-                            print(f"❌ Exception trong concurrent processing: {str(e)}")
-                            stats['error'] += 1
-                            pbar.update(1)
-        else:
-            # Xử lý tuần tự
-            print("🔄 Xử lý tuần tự...")
-            
-            with tqdm(total=len(pending_rows), desc="Xử lý bài viết") as pbar:
-                for row in pending_rows:
-                    try:
-                        result = self.process_single_row(row)
-                        
-                        if result['success']:
-                            stats['success'] += 1
-                        else:
-                            stats['error'] += 1
-                        
-                        stats['results'].append(result)
-                        pbar.update(1)
-                        
-                        # Delay giữa các request
-                        time.sleep(Config.REQUEST_DELAY)
-                        
-                    except Exception as e:
-                        print(f"❌ Exception trong sequential processing: {str(e)}")
-                        stats['error'] += 1
-                        pbar.update(1)
+                if result:
+                    stats['results'].append(result)
+                if limiter:
+                    self.scheduler.set_concurrency(limiter.current_limit)
+                pbar.set_postfix_str(
+                    f"in-flight {self.scheduler.in_flight}/{self.scheduler.concurrency} | {status_line()}"
+                )
+                pbar.update(1)
         
         # Tính thời gian thực hiện
         end_time = time.time()
@@ -249,6 +232,11 @@ class WordPressAutomation:
         print(f"   Lỗi: {stats['error']}")
         print(f"   Thời gian: {duration:.2f} giây")
         print(f"   Tốc độ: {stats['total']/duration:.2f} bài/giây")
+        print_connection_stats()
+        print_limiter_stats()
+        print_retry_stats()
+        print_gateway_stats()
+        print_image_stats()
         
         return stats
     